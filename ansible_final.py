@@ -1,70 +1,602 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing.connection import Connection, Pipe
 from pathlib import Path
+import atexit
+import json
+import re
 import subprocess
+import sys
+import threading
+
+from config_store import config_store
+from governor import GovernorError, governor
+from inventory import changed_devices, inventory
+from metrics import metrics
 import restconf_final
 
+try:
+    from ansible import context
+    from ansible.executor.task_queue_manager import TaskQueueManager
+    from ansible.inventory.manager import InventoryManager
+    from ansible.module_utils.common.collections import ImmutableDict
+    from ansible.parsing.dataloader import DataLoader
+    from ansible.playbook.play import Play
+    from ansible.plugins.callback import CallbackBase
+    from ansible.plugins.loader import init_plugin_loader
+    from ansible.vars.manager import VariableManager
+except ImportError:  # ansible-core not importable: fall back to the ansible-playbook CLI
+    TaskQueueManager = None
+    CallbackBase = object
+
 STUDENT_ID = getattr(restconf_final, "STUDENT_ID", "66070014")
+PORT = 22  # network_cli logs in over SSH; the governor keeps Ansible's breaker for this port
+FORKS = 5
+WORKERS = 4  # playbook runs in flight at once, each in its own worker process
+MAX_DIFF_CHARS = 7000  # stay below the Webex message size limit
+
+
+def _timed(phase, target):
+    return metrics.timer("ipa_device_seconds", backend="ansible", phase=phase, router=target)
+
+
+class _ResultCollector(CallbackBase):
+    """Collect per-host task results instead of parsing ansible-playbook output"""
+
+    def __init__(self, last_task=None, on_host_done=None):
+        super().__init__()
+        self.hosts = {}  # host name -> {"failed": bool, "unreachable": bool, "results": {task: result}}
+        self._last_task = last_task
+        self._on_host_done = on_host_done
+
+    def _record(self, result, failed=False, unreachable=False):
+        host = result._host.get_name()
+        task = result._task.get_name()
+        entry = self.hosts.setdefault(host, {"failed": False, "unreachable": False, "results": {}})
+        entry["results"][task] = result._result
+        entry["failed"] = entry["failed"] or failed or unreachable
+        entry["unreachable"] = entry["unreachable"] or unreachable
+
+        # A host is finished once it fails or reaches the last task of the play
+        if self._on_host_done and (failed or unreachable or task == self._last_task):
+            self._on_host_done(host, entry)
+
+    def v2_runner_on_ok(self, result):
+        self._record(result)
+
+    def v2_runner_on_skipped(self, result):
+        self._record(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result, failed=not ignore_errors)
+
+    def v2_runner_on_unreachable(self, result):
+        self._record(result, unreachable=True)
+
+
+class PlaybookRunner:
+    """Run playbooks inside this process
+
+    The inventory, variable manager and playbook files are loaded once and
+    reused for every command, so a chat command no longer pays for starting a
+    new interpreter and importing ansible-core and its collections.
+    ansible-core keeps global state per run, so a runner runs one play at a
+    time; RunnerPool gives every worker process its own runner.
+    """
+
+    def __init__(self, source, forks=FORKS):
+        if not context.CLIARGS:
+            context.CLIARGS = ImmutableDict(
+                connection="smart", module_path=None, forks=forks, become=None,
+                become_method=None, become_user=None, check=False, diff=False, verbosity=0,
+            )
+        # Make installed collections (ansible.netcommon, cisco.ios) resolvable, as the CLI does
+        init_plugin_loader()
+        self._forks = forks
+        self._loader = DataLoader()
+        self._loader.set_basedir(str(Path(source).resolve().parent))
+        self._inventory = InventoryManager(loader=self._loader, sources=[str(source)])
+        self._variable_manager = VariableManager(loader=self._loader, inventory=self._inventory)
+        self._plays = {}  # playbook path -> parsed play data
+
+    def _play_data(self, playbook):
+        path = str(Path(playbook).resolve())
+        if path not in self._plays:
+            self._plays[path] = self._loader.load_from_file(path, trusted_as_template=True)[0]
+        return self._plays[path]
+
+    def run(self, playbook, hosts, extra_vars=None, forks=None, on_host_done=None):
+        """Run the first play of playbook against hosts and return per-host results
+
+        on_host_done(host, entry) is called as soon as each host has finished,
+        while the other hosts may still be running.
+        """
+        play_data = dict(self._play_data(playbook))
+        play_data["hosts"] = hosts
+        play_data["vars"] = {**play_data.get("vars", {}), **(extra_vars or {})}
+        if on_host_done:
+            # Let fast hosts run ahead instead of waiting for the slowest one at every task
+            play_data["strategy"] = "free"
+        play = Play.load(play_data, variable_manager=self._variable_manager, loader=self._loader)
+
+        last_task = play_data["tasks"][-1].get("name") if play_data.get("tasks") else None
+        collector = _ResultCollector(last_task, on_host_done)
+        tqm = TaskQueueManager(
+            inventory=self._inventory,
+            variable_manager=self._variable_manager,
+            loader=self._loader,
+            passwords={},
+            forks=forks or self._forks,
+        )
+        try:
+            tqm.load_callbacks()
+            collector._init_callback_methods()
+            tqm._callback_plugins.append(collector)
+            tqm.run(play)
+        finally:
+            tqm.cleanup()
+        return collector.hosts
+
+
+def _plain(value):
+    """Results as plain JSON types, so they cross the pipe without ansible's tagged str/dict types"""
+    return json.loads(json.dumps(value, default=str))
+
+
+def _serve(fd, source):
+    """Worker process main loop: run the requests read from fd on one PlaybookRunner"""
+    conn = Connection(fd)
+    try:
+        runner = PlaybookRunner(source)
+    except Exception as exc:
+        conn.send(("error", f"{type(exc).__name__}: {exc}"))
+        return
+    conn.send(("ready",))
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        playbook, hosts, extra_vars, forks, stream = request
+        on_host_done = (lambda host, entry: conn.send(("host", host, _plain(entry)))) if stream else None
+        try:
+            results = runner.run(playbook, hosts, extra_vars, forks, on_host_done)
+        except Exception as exc:
+            conn.send(("error", f"{type(exc).__name__}: {exc}"))
+        else:
+            conn.send(("done", _plain(results)))
+
+
+# Started with -c rather than multiprocessing so the child never re-runs the bot's __main__ script
+_WORKER_CODE = "import sys; sys.path.insert(0, sys.argv[3]); import ansible_final; ansible_final._serve(int(sys.argv[1]), sys.argv[2])"
+
+
+class _Worker:
+    """One worker process holding a warm PlaybookRunner, serving one run at a time"""
+
+    def __init__(self, source):
+        self._conn, child_conn = Pipe()
+        module_dir = str(Path(__file__).resolve().parent)
+        self._process = subprocess.Popen(
+            [sys.executable, "-c", _WORKER_CODE, str(child_conn.fileno()), str(source), module_dir],
+            pass_fds=(child_conn.fileno(),),
+        )
+        child_conn.close()
+        try:
+            self._receive()  # wait until the inventory and plugins are loaded
+        except RuntimeError:
+            self.close()
+            raise
+
+    def _receive(self):
+        try:
+            message = self._conn.recv()
+        except (EOFError, OSError) as exc:
+            raise RuntimeError("Ansible worker exited") from exc
+        if message[0] == "error":
+            raise RuntimeError(message[1])
+        return message
+
+    def run(self, playbook, hosts, extra_vars, forks, on_host_done):
+        self._conn.send((str(playbook), hosts, extra_vars, forks, on_host_done is not None))
+        while True:
+            message = self._receive()
+            if message[0] == "done":
+                return message[1]
+            try:
+                on_host_done(message[1], message[2])
+            except Exception as exc:
+                # Keep reading, or the next run would get this run's replies
+                print(f"Error handling Ansible result for {message[1]}: {exc}")
+
+    def alive(self):
+        return self._process.poll() is None
+
+    def close(self):
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._conn.close()
+        try:
+            self._process.wait(5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+
+
+class RunnerPool:
+    """Up to max_workers worker processes, each with its own PlaybookRunner
+
+    ansible-core cannot run two plays at once in one process, so concurrent
+    commands (showrun and motd on different routers, or any command during a
+    "showrun all") each get a worker process of their own. Workers start on
+    demand, keep their inventory and plugins loaded between runs, and are
+    replaced if they die.
+    """
+
+    def __init__(self, source, max_workers=WORKERS):
+        self._source = source
+        self._max_workers = max_workers
+        self._cond = threading.Condition()
+        self._idle = []
+        self._started = 0
+        self._closed = False
+
+    def _checkout(self):
+        with self._cond:
+            while not self._idle and self._started >= self._max_workers:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+        try:
+            with _timed("setup", "worker"):
+                return _Worker(self._source)
+        except BaseException:
+            with self._cond:
+                self._started -= 1
+                self._cond.notify()
+            raise
+
+    def _checkin(self, worker, reusable):
+        with self._cond:
+            if reusable and not self._closed and worker.alive():
+                self._idle.append(worker)
+                worker = None
+            else:
+                self._started -= 1
+            self._cond.notify()
+        if worker is not None:
+            worker.close()
+
+    def run(self, playbook, hosts, extra_vars=None, forks=None, on_host_done=None):
+        """PlaybookRunner.run() on a free worker; on_host_done is called in this process"""
+        worker = self._checkout()
+        reusable = False
+        try:
+            with _timed("rpc", hosts):
+                results = worker.run(playbook, hosts, extra_vars, forks, on_host_done)
+            reusable = True
+            return results
+        except RuntimeError:
+            # The worker reported a failed run and waits for the next one, unless it died
+            reusable = True
+            raise
+        finally:
+            self._checkin(worker, reusable)
+
+    def close(self):
+        """Stop idle workers now and busy ones when their run ends"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+        for worker in idle:
+            with _timed("close", "worker"):
+                worker.close()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def configure(workers=None):
+    """Change how many playbook runs may be in flight; running workers are stopped"""
+    global WORKERS
+    if workers is not None:
+        WORKERS = workers
+    _close_runner()
+
+
+def _get_runner():
+    """Return the shared RunnerPool, or None when only the CLI is available"""
+    global _runner
+    if TaskQueueManager is None or not inventory.path.exists():
+        return None
+    with _runner_lock:
+        if _runner is None:
+            _runner = RunnerPool(inventory.path, WORKERS)
+        return _runner
+
+
+def _close_runner():
+    global _runner
+    with _runner_lock:
+        runner, _runner = _runner, None
+    if runner is not None:
+        runner.close()
+
 
-def showrun(router_ip=None):
-    """Get running configuration from router using Ansible"""
+atexit.register(_close_runner)
+
+
+def _on_inventory_change(old, new):
+    """Load the edited inventory into fresh workers on the next run"""
+    if changed_devices(old, new):
+        _close_runner()
+
+
+inventory.subscribe(_on_inventory_change)
+
+
+# network_cli reports a failed login as a failed task, not as an unreachable host
+_CONNECTION_ERROR = re.compile(
+    r"unable to connect|ssh protocol banner|ssh connect failed|timed out|connection (refused|reset)"
+    r"|no route to host|network is unreachable|name or service not known",
+    re.IGNORECASE,
+)
+
+
+def _connection_error(entry):
+    """Return why the host could not be reached, or None if its tasks ran on the router"""
+    if entry["unreachable"]:
+        return "unreachable from Ansible"
+    if entry["failed"]:
+        for result in entry["results"].values():
+            msg = str(result.get("msg", ""))
+            if _CONNECTION_ERROR.search(msg):
+                return msg
+    return None
+
+
+def _ip_for(router_name):
+    device = inventory.get(router_name)
+    return device.ip if device else router_name
+
+
+def _run_governed(runner, playbook, router_names, extra_vars=None, **kwargs):
+    """Run playbook on routers holding a governor slot on each, and feed reachability back to it
+
+    Routers whose breaker refuses the call are left out and get no result.
+    """
+    admitted = {}
+    for router_name in router_names:
+        router_ip = _ip_for(router_name)
+        try:
+            governor.admit(router_ip, PORT)
+        except GovernorError as exc:
+            print(exc)
+            continue
+        admitted[router_name] = router_ip
+    results = {}
+    try:
+        if admitted:
+            with governor.sessions(admitted.values()):
+                results = runner.run(playbook, ",".join(admitted), extra_vars, **kwargs)
+    finally:
+        for router_name, router_ip in admitted.items():
+            entry = results.get(router_name)
+            error = _connection_error(entry) if entry is not None else None
+            if error:
+                governor.record_failure(router_ip, PORT, error)
+            elif entry is not None and not entry["failed"]:
+                governor.record_success(router_ip, PORT)
+            else:
+                # A task failed on the router, or the run produced nothing: no verdict either way
+                governor.release(router_ip, PORT)
+    return results
+
+
+def _host_ok(results, host):
+    entry = results.get(host)
+    return entry is not None and not entry["failed"]
+
+
+def _collected_config(entry):
+    """Return the running-config text a host's play captured, without reading the saved file"""
+    for result in (entry or {}).get("results", {}).values():
+        stdout = result.get("stdout")
+        if isinstance(stdout, list):
+            stdout = "\n".join(stdout)
+        if isinstance(stdout, str) and stdout:
+            return stdout
+    return None
+
+
+def _run_playbook_cli(playbook, extra_vars):
+    """Fallback: run ansible-playbook as a subprocess and check its recap"""
+    args = ["ansible-playbook", "-i", str(inventory.path), str(playbook)]
+    for key, value in extra_vars.items():
+        args += ["-e", f"{key}={value}"]
+    # Includes interpreter startup and the SSH login, which the in-process runner avoids
+    router_ip = extra_vars.get("router_ip")
+    with governor.sessions([router_ip] if router_ip else []), _timed("rpc", router_ip or "all"):
+        r = subprocess.run(args, capture_output=True, text=True)
+    print(r.stdout + r.stderr)
+    return not r.returncode and "failed=0" in r.stdout + r.stderr
+
+
+def _showrun_file(router_name, student_id=STUDENT_ID):
+    return Path(f"show_run_{student_id}_{router_name}.txt")
+
+
+def _store_snapshot(router_name, response):
+    """Add the fresh show-run file to the config store and note the versions in response"""
+    try:
+        config_text = response.get("content") or Path(response["path"]).read_text()
+        entry, previous, changed = config_store.save(router_name, config_text)
+    except OSError as exc:
+        print(f"Error storing config snapshot for {router_name}: {exc}")
+        return response
+    response.update({"snapshot": entry, "previous": previous, "changed": changed})
+    return response
+
+
+def showrun(router_ip=None, student_id=STUDENT_ID):
+    """Get running configuration from router using Ansible, saved under the student's file name"""
     playbook = Path("playbook.yaml")
-    
-    # Map IP to router name
-    router_map = {
-        "10.0.15.61": "CSR1KV-Pod1-1",
-        "10.0.15.62": "CSR1KV-Pod1-2",
-        "10.0.15.63": "CSR1KV-Pod1-3",
-        "10.0.15.64": "CSR1KV-Pod1-4",
-        "10.0.15.65": "CSR1KV-Pod1-5",
-    }
-    
+
     # Default to 10.0.15.65 if no IP provided (backward compatibility)
     if router_ip is None:
         router_ip = "10.0.15.65"
-    
-    router_name = router_map.get(router_ip, "CSR1KV-Pod1-5")
-    output_file = Path(f"show_run_{STUDENT_ID}_{router_name}.txt")
 
-    if not playbook.exists():
+    router_name = inventory.current().name_for(router_ip)
+    if router_name is None or not playbook.exists():
+        return {"status": "FAIL", "msg": "Error: Ansible"}
+    output_file = _showrun_file(router_name, student_id)
+    try:
+        governor.check(router_ip, PORT)
+    except GovernorError as exc:
+        print(exc)
         return {"status": "FAIL", "msg": "Error: Ansible"}
 
-    # Run ansible playbook with router IP filter
-    r = subprocess.run(
-        ["ansible-playbook", str(playbook), 
-         "-e", f"router_ip={router_ip}"],
-        capture_output=True, 
-        text=True
-    )
-    print(r.stdout + r.stderr)
+    content = None
+    runner = _get_runner()
+    if runner is not None:
+        results = _run_governed(runner, playbook, [router_name], {"router_ip": router_ip, "student_id": student_id})
+        ok = _host_ok(results, router_name)
+        content = _collected_config(results.get(router_name))
+    else:
+        # Run ansible playbook with router IP filter
+        ok = _run_playbook_cli(playbook, {"router_ip": router_ip, "student_id": student_id})
 
-    if r.returncode or "failed=0" not in r.stdout + r.stderr or not output_file.exists():
+    if not ok or (content is None and not output_file.exists()):
         return {"status": "FAIL", "msg": "Error: Ansible"}
 
-    return {"status": "OK", "msg": "show running config", "path": str(output_file)}
+    # "content" lets the caller upload straight from memory; "path" is the copy the playbook saved
+    response = {"status": "OK", "msg": "show running config", "path": str(output_file), "content": content}
+    return _store_snapshot(router_name, response)
+
+
+def showrun_diff(router_ip, student_id=STUDENT_ID):
+    """Back up the running config and report only the lines changed since the previous backup"""
+    response = showrun(router_ip, student_id)
+    if response.get("status") != "OK" or "snapshot" not in response:
+        return {"status": "FAIL", "msg": "Error: Ansible"}
+
+    router_name = inventory.current().name_for(router_ip)
+    if not response["changed"]:
+        return {"status": "OK", "msg": f"No changes on {router_name} since {response['previous']['time']}"}
+    if response["previous"] is None:
+        return {"status": "OK", "msg": f"First backup of {router_name} stored, nothing to compare yet"}
+
+    lines = config_store.diff(response["previous"]["hash"], response["snapshot"]["hash"])
+    text = "\n".join(lines)
+    if len(text) > MAX_DIFF_CHARS:
+        text = text[:MAX_DIFF_CHARS].rsplit("\n", 1)[0] + f"\n... diff truncated ({len(lines)} lines in total)"
+    return {"status": "OK", "msg": f"Config changes on {router_name} since {response['previous']['time']}:\n{text}"}
+
+
+def showrun_all(on_result=None, forks=None, router_ips=None, student_id=STUDENT_ID):
+    """Back up the running config of every router (or just router_ips) concurrently
+
+    on_result(router_name, response) is called as each router finishes, with
+    the same response dict showrun() returns. Returns {router_name: response}.
+    """
+    playbook = Path("playbook.yaml")
+    forks = forks or FORKS
+    summary = {}
+
+    def finish(router_name, ok, content=None):
+        output_file = _showrun_file(router_name, student_id)
+        if ok and (content is not None or output_file.exists()):
+            response = _store_snapshot(
+                router_name,
+                {"status": "OK", "msg": "show running config", "path": str(output_file), "content": content},
+            )
+        else:
+            response = {"status": "FAIL", "msg": "Error: Ansible"}
+        summary[router_name] = response
+        if on_result:
+            try:
+                on_result(router_name, response)
+            except Exception as exc:
+                print(f"Error handling showrun result for {router_name}: {exc}")
+
+    if not playbook.exists():
+        return summary
+
+    runner = _get_runner()
+    if runner is not None:
+        router_names = [
+            device.name for device in inventory.current() if router_ips is None or device.ip in router_ips
+        ]
+        # Routers known to be down are reported at once instead of holding up the run
+        for router_name in router_names:
+            if governor.is_down(_ip_for(router_name), PORT):
+                finish(router_name, False)
+        router_names = [name for name in router_names if name not in summary]
+        results = {}
+        if router_names:
+            results = _run_governed(
+                runner, playbook, router_names, {"student_id": student_id}, forks=forks,
+                on_host_done=lambda host, entry: finish(host, not entry["failed"], _collected_config(entry)),
+            )
+        # Hosts that produced no result at all (e.g. filtered out) still get a summary line
+        for router_name in router_names:
+            if router_name not in summary:
+                finish(router_name, router_name in results and not results[router_name]["failed"])
+        return summary
+
+    # CLI fallback: one ansible-playbook per router, at most `forks` at a time
+    for device in inventory.current():
+        if (router_ips is None or device.ip in router_ips) and governor.is_down(device.ip, PORT):
+            finish(device.name, False)
+    with ThreadPoolExecutor(max_workers=forks) as pool:
+        futures = {
+            pool.submit(showrun, device.ip, student_id): device.name
+            for device in inventory.current()
+            if (router_ips is None or device.ip in router_ips) and not governor.is_down(device.ip, PORT)
+        }
+        for future in as_completed(futures):
+            try:
+                ok = future.result().get("status") == "OK"
+            except Exception as exc:
+                print(f"Error running showrun for {futures[future]}: {exc}")
+                ok = False
+            finish(futures[future], ok)
+    return summary
 
 
 def set_motd(router_ip, motd_message):
     """Configure MOTD banner using Ansible"""
     playbook = Path("motd_playbook.yaml")
-    
+
     if not playbook.exists():
         return {"status": "FAIL", "msg": "Error: Ansible"}
-    
-    # Escape quotes in motd_message
-    motd_escaped = motd_message.replace('"', '\\"')
-    
-    # Run ansible playbook with extra variables
-    r = subprocess.run(
-        ["ansible-playbook", str(playbook), 
-         "-e", f"router_ip={router_ip}",
-         "-e", f'motd_message="{motd_escaped}"'],
-        capture_output=True, 
-        text=True
-    )
-    print(r.stdout + r.stderr)
-    
-    if r.returncode or "failed=0" not in r.stdout + r.stderr:
+
+    try:
+        governor.check(router_ip, PORT)
+    except GovernorError as exc:
+        print(exc)
+        return {"status": "FAIL", "msg": "Error: Ansible"}
+
+    runner = _get_runner()
+    if runner is not None:
+        router_name = inventory.current().name_for(router_ip)
+        if router_name is None:
+            return {"status": "FAIL", "msg": "Error: Ansible"}
+        results = _run_governed(runner, playbook, [router_name], {"router_ip": router_ip, "motd_message": motd_message})
+        ok = _host_ok(results, router_name)
+    else:
+        # Escape quotes in motd_message
+        motd_escaped = motd_message.replace('"', '\\"')
+        ok = _run_playbook_cli(playbook, {"router_ip": router_ip, "motd_message": f'"{motd_escaped}"'})
+
+    if not ok:
         return {"status": "FAIL", "msg": "Error: Ansible"}
-    
+
     return {"status": "OK", "msg": "Ok: success"}
 
 
@@ -0,0 +1,200 @@
+import datetime
+import ipaddress
+import logging
+import random
+import socket
+import threading
+import sys
+import time
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import paramiko
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+USERNAME = "admin"
+PASSWORD = "cisco"
+
+# Clients dropping pooled sessions at teardown is expected; keep the server side quiet
+logging.getLogger("bench.ssh").setLevel(logging.CRITICAL)
+
+
+class Latency:
+    """Injected service time: delay seconds plus up to jitter seconds at random"""
+
+    def __init__(self, delay=0.0, jitter=0.0):
+        self.delay = delay
+        self.jitter = jitter
+
+    def sleep(self):
+        pause = self.delay + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if pause > 0:
+            time.sleep(pause)
+
+
+class FakeRouter:
+    """Interface and banner state of one simulated CSR1KV
+
+    The RESTCONF, NETCONF and CLI stand-ins for the same address share one
+    FakeRouter, so a Loopback created over RESTCONF shows up in
+    "show ip interface brief" as it would on the real device.
+    """
+
+    def __init__(self, hostname, ip):
+        self.hostname = hostname
+        self.ip = ip
+        self.lock = threading.Lock()
+        self.motd = ""
+        self.interfaces = {
+            "GigabitEthernet1": self._interface("GigabitEthernet1", "ethernetCsmacd", ip, True),
+            "GigabitEthernet2": self._interface("GigabitEthernet2", "ethernetCsmacd", None, True),
+            "GigabitEthernet3": self._interface("GigabitEthernet3", "ethernetCsmacd", None, False),
+            "GigabitEthernet4": self._interface("GigabitEthernet4", "ethernetCsmacd", None, True, link=False),
+        }
+
+    @staticmethod
+    def _interface(name, if_type, address=None, enabled=True, link=True, description=""):
+        return {
+            "name": name,
+            "type": if_type,  # iana-if-type identity without prefix
+            "description": description,
+            "enabled": enabled,
+            "address": address,
+            "link": link,  # physical link up; loopbacks always are
+        }
+
+    def create_interface(self, name, if_type="softwareLoopback", address=None, enabled=True, description=""):
+        self.interfaces[name] = self._interface(name, if_type, address, enabled, description=description)
+
+    @staticmethod
+    def oper_status(interface):
+        return "up" if interface["enabled"] and interface["link"] else "down"
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that does not print a traceback when a client hangs up"""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], OSError):
+            super().handle_error(request, client_address)
+
+
+class SSHServer:
+    """Accept loop for a paramiko-based stand-in
+
+    start_channel(channel, interface) is called in its own thread for every
+    session channel a client opens; make_interface() returns the paramiko
+    ServerInterface (a PasswordAuth) that decides which requests to accept.
+    """
+
+    def __init__(self, host, port, host_key, make_interface, start_channel):
+        self._host_key = host_key
+        self._make_interface = make_interface
+        self._start_channel = start_channel
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(100)
+        self._transports = []
+        self._closed = False
+
+    @property
+    def port(self):
+        return self._sock.getsockname()[1]
+
+    def start(self):
+        threading.Thread(target=self._accept_forever, name="fake-ssh-accept", daemon=True).start()
+
+    def _accept_forever(self):
+        while not self._closed:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        transport = paramiko.Transport(client)
+        transport.set_log_channel("bench.ssh")
+        transport.add_server_key(self._host_key)
+        self._transports.append(transport)
+        interface = self._make_interface()
+        try:
+            transport.start_server(server=interface)
+        except (paramiko.SSHException, EOFError, OSError):
+            return
+        while transport.is_active():
+            channel = transport.accept(timeout=1)
+            if channel is not None:
+                threading.Thread(target=self._start_channel, args=(channel, interface), daemon=True).start()
+
+    def stop(self):
+        self._closed = True
+        self._sock.close()
+        for transport in self._transports:
+            transport.close()
+
+
+class PasswordAuth(paramiko.ServerInterface):
+    """Accept admin/cisco and session channels; subclasses enable shell or subsystems
+
+    Subclasses set `ready` once the client asked for its shell or subsystem,
+    so the channel handler does not talk before the client is listening.
+    """
+
+    def __init__(self):
+        self.ready = threading.Event()
+
+    def check_auth_password(self, username, password):
+        if username == USERNAME and password == PASSWORD:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+def generate_host_key():
+    return paramiko.RSAKey.generate(2048)
+
+
+def generate_certificate(directory, addresses):
+    """Write a self-signed certificate for addresses and return (cert_path, key_path)"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "csr1kv-bench")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address(ip)) for ip in addresses]),
+            critical=False,
+        )
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = Path(directory) / "restconf-cert.pem"
+    key_path = Path(directory) / "restconf-key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        )
+    )
+    return str(cert_path), str(key_path)
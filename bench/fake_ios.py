@@ -0,0 +1,107 @@
+from bench.fake_device import Latency, PasswordAuth, SSHServer
+
+
+class _ShellInterface(PasswordAuth):
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.ready.set()
+        return True
+
+
+class FakeIOSServer:
+    """SSH CLI stand-in for the IOS commands netmiko_final sends
+
+    Echoes input like a terminal and answers "show ip interface brief",
+    "show banner motd" and the terminal settings Netmiko applies at login,
+    from the shared FakeRouter state.
+    """
+
+    def __init__(self, router, host, port, host_key, latency=None):
+        self.router = router
+        self.latency = latency or Latency()
+        self.commands = 0
+        self._ssh = SSHServer(host, port, host_key, _ShellInterface, self._serve_channel)
+
+    @property
+    def port(self):
+        return self._ssh.port
+
+    def start(self):
+        self._ssh.start()
+
+    def stop(self):
+        self._ssh.stop()
+
+    @property
+    def prompt(self):
+        return f"{self.router.hostname}#"
+
+    def _serve_channel(self, channel, interface):
+        if not interface.ready.wait(10):
+            channel.close()
+            return
+        try:
+            channel.sendall(f"\r\n{self.prompt}".encode())
+            line = ""
+            previous = ""
+            while True:
+                data = channel.recv(4096)
+                if not data:
+                    return
+                for char in data.decode(errors="replace"):
+                    if char == "\n" and previous == "\r":
+                        previous = char
+                        continue  # second half of a CRLF
+                    previous = char
+                    if char < " " and char not in "\r\n":
+                        continue  # e.g. the NUL byte Netmiko's is_alive() sends
+                    if char in "\r\n":
+                        output = self._run(line.strip())
+                        channel.sendall(f"\r\n{output}{self.prompt}".encode())
+                        line = ""
+                    else:
+                        line += char
+                        channel.sendall(char.encode())  # echo
+        except OSError:
+            return
+        finally:
+            channel.close()
+
+    def _run(self, command):
+        """Return the output of one CLI line, each line ending in CRLF"""
+        if not command:
+            return ""
+        self.commands += 1
+        self.latency.sleep()
+        words = command.split()
+        if command.startswith("terminal ") or words[0] in ("exit", "end"):
+            return ""
+        if command == "show ip interface brief":
+            return self._show_ip_interface_brief()
+        if command == "show banner motd":
+            with self.router.lock:
+                motd = self.router.motd
+            return "".join(f"{line}\r\n" for line in motd.splitlines())
+        return "\r\n".join([
+            f"{' ' * (len(self.prompt) + len(words[0]))}^",
+            "% Invalid input detected at '^' marker.",
+            "",
+        ]) + "\r\n"
+
+    def _show_ip_interface_brief(self):
+        router = self.router
+        lines = [f"{'Interface':<23}{'IP-Address':<16}OK? Method {'Status':<22}Protocol"]
+        with router.lock:
+            for interface in router.interfaces.values():
+                if not interface["enabled"]:
+                    status = "administratively down"
+                else:
+                    status = router.oper_status(interface)
+                lines.append(
+                    f"{interface['name']:<23}{interface['address'] or 'unassigned':<16}"
+                    f"YES {'NVRAM' if interface['address'] else 'unset':<7}{status:<22}"
+                    f"{router.oper_status(interface)}"
+                )
+        return "".join(f"{line}\r\n" for line in lines)
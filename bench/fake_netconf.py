@@ -0,0 +1,236 @@
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+from bench.fake_device import Latency, PasswordAuth, SSHServer
+
+NC_NS = "urn:ietf:params:xml:ns:netconf:base:1.0"
+IF_NS = "urn:ietf:params:xml:ns:yang:ietf-interfaces"
+IP_NS = "urn:ietf:params:xml:ns:yang:ietf-ip"
+IANA_NS = "urn:ietf:params:xml:ns:yang:iana-if-type"
+EOM = b"]]>]]>"  # base:1.0 end-of-message framing
+
+# Only base:1.0 is advertised, so ncclient keeps end-of-message framing
+CAPABILITIES = (
+    "urn:ietf:params:netconf:base:1.0",
+    "urn:ietf:params:netconf:capability:writable-running:1.0",
+    "urn:ietf:params:netconf:capability:candidate:1.0",
+    f"{IF_NS}?module=ietf-interfaces",
+    f"{IP_NS}?module=ietf-ip",
+)
+
+
+class _RPCError(Exception):
+    def __init__(self, tag, message):
+        super().__init__(message)
+        self.tag = tag
+
+
+def _local(element):
+    return etree.QName(element).localname
+
+
+def _find(element, *names):
+    """First descendant matching the local-name path, ignoring namespaces"""
+    path = "/".join(f"*[local-name()='{name}']" for name in names)
+    found = element.xpath(f".//{path}")
+    return found[0] if found else None
+
+
+def _text(element, name, default=None):
+    child = _find(element, name)
+    return child.text.strip() if child is not None and child.text else default
+
+
+def _operation(element):
+    return element.get("operation") or element.get(f"{{{NC_NS}}}operation")
+
+
+class _NetconfInterface(PasswordAuth):
+    def check_channel_subsystem_request(self, channel, name):
+        if name != "netconf":
+            return False
+        self.ready.set()
+        return True
+
+
+class FakeNetconfServer:
+    """NETCONF-over-SSH stand-in answering the RPCs netconf_final sends
+
+    Supports get-config, get and edit-config on ietf-interfaces (including the
+    create/delete/merge operations and default-operation "none" with their
+    data-exists/data-missing errors), commit, discard-changes and
+    close-session, using base:1.0 framing.
+    """
+
+    def __init__(self, router, host, port, host_key, latency=None):
+        self.router = router
+        self.latency = latency or Latency()
+        self.rpcs = 0
+        self._ssh = SSHServer(host, port, host_key, _NetconfInterface, self._serve_channel)
+
+    @property
+    def port(self):
+        return self._ssh.port
+
+    def start(self):
+        self._ssh.start()
+
+    def stop(self):
+        self._ssh.stop()
+
+    def _serve_channel(self, channel, interface):
+        if not interface.ready.wait(10):
+            channel.close()
+            return
+        capabilities = "".join(f"<capability>{c}</capability>" for c in CAPABILITIES)
+        hello = (
+            f'<?xml version="1.0" encoding="UTF-8"?><hello xmlns="{NC_NS}">'
+            f"<capabilities>{capabilities}</capabilities><session-id>{channel.get_id()}</session-id></hello>"
+        )
+        try:
+            channel.sendall(hello.encode() + EOM)
+            buffer = b""
+            hello_seen = False
+            while True:
+                data = channel.recv(65536)
+                if not data:
+                    return
+                buffer += data
+                while EOM in buffer:
+                    message, buffer = buffer.split(EOM, 1)
+                    if not hello_seen:
+                        hello_seen = True  # the client's hello needs no reply
+                        continue
+                    reply, close = self._handle(message)
+                    channel.sendall(reply.encode() + EOM)
+                    if close:
+                        return
+        except OSError:
+            return
+        finally:
+            channel.close()
+
+    def _handle(self, message):
+        """Return (reply xml, close session)"""
+        self.rpcs += 1
+        rpc = etree.fromstring(message.strip())
+        message_id = rpc.get("message-id", "")
+        operation = rpc[0]
+        name = _local(operation)
+        self.latency.sleep()
+
+        try:
+            if name in ("get-config", "get"):
+                body = f"<data>{self._data(operation, state=name == 'get')}</data>"
+            elif name == "edit-config":
+                self._edit_config(operation)
+                body = "<ok/>"
+            elif name in ("commit", "discard-changes", "lock", "unlock"):
+                body = "<ok/>"
+            elif name == "close-session":
+                return self._reply(message_id, "<ok/>"), True
+            else:
+                raise _RPCError("operation-not-supported", f"{name} is not supported")
+        except _RPCError as error:
+            body = (
+                "<rpc-error><error-type>application</error-type>"
+                f"<error-tag>{error.tag}</error-tag><error-severity>error</error-severity>"
+                f'<error-message xml:lang="en">{escape(str(error))}</error-message></rpc-error>'
+            )
+        return self._reply(message_id, body), False
+
+    @staticmethod
+    def _reply(message_id, body):
+        return f'<rpc-reply xmlns="{NC_NS}" message-id="{escape(message_id)}">{body}</rpc-reply>'
+
+    def _data(self, operation, state):
+        """Render the interfaces (or interfaces-state) subtree selected by the filter"""
+        selection = _find(operation, "filter")
+        wanted_state = selection is not None and _find(selection, "interfaces-state") is not None
+        wanted_config = selection is None or _find(selection, "interfaces") is not None
+        # Every <name>x</name> selects one interface; an empty <name/> selects them all
+        names = set()
+        if selection is not None:
+            names = {
+                element.text.strip()
+                for element in selection.xpath(".//*[local-name()='name']")
+                if element.text and element.text.strip()
+            }
+
+        router = self.router
+        with router.lock:
+            interfaces = [
+                dict(interface) for interface in router.interfaces.values()
+                if not names or interface["name"] in names
+            ]
+        if not interfaces:
+            return ""
+
+        parts = []
+        if wanted_config:
+            rows = []
+            for interface in interfaces:
+                address = ""
+                if interface["address"]:
+                    address = (
+                        f'<ipv4 xmlns="{IP_NS}"><address><ip>{interface["address"]}</ip>'
+                        "<netmask>255.255.255.0</netmask></address></ipv4>"
+                    )
+                rows.append(
+                    f"<interface><name>{escape(interface['name'])}</name>"
+                    f"<description>{escape(interface['description'])}</description>"
+                    f'<type xmlns:ianaift="{IANA_NS}">ianaift:{interface["type"]}</type>'
+                    f"<enabled>{'true' if interface['enabled'] else 'false'}</enabled>{address}</interface>"
+                )
+            parts.append(f'<interfaces xmlns="{IF_NS}">{"".join(rows)}</interfaces>')
+        if state and wanted_state:
+            rows = [
+                f"<interface><name>{escape(interface['name'])}</name>"
+                f'<type xmlns:ianaift="{IANA_NS}">ianaift:{interface["type"]}</type>'
+                f"<admin-status>{'up' if interface['enabled'] else 'down'}</admin-status>"
+                f"<oper-status>{router.oper_status(interface)}</oper-status></interface>"
+                for interface in interfaces
+            ]
+            parts.append(f'<interfaces-state xmlns="{IF_NS}">{"".join(rows)}</interfaces-state>')
+        return "".join(parts)
+
+    def _edit_config(self, operation):
+        default_operation = _text(operation, "default-operation", "merge")
+        config = _find(operation, "config")
+        if config is None:
+            raise _RPCError("missing-element", "config is required")
+
+        router = self.router
+        with router.lock:
+            for element in config.xpath(".//*[local-name()='interfaces']/*[local-name()='interface']"):
+                name = _text(element, "name")
+                existing = router.interfaces.get(name)
+                op = _operation(element) or default_operation
+                if op == "create" and existing is not None:
+                    raise _RPCError("data-exists", f"{name} already exists")
+                if op == "delete" and existing is None:
+                    raise _RPCError("data-missing", f"{name} does not exist")
+                if op in ("delete", "remove"):
+                    router.interfaces.pop(name, None)
+                    continue
+                if existing is None and op == "none":
+                    # default-operation none: child edits need an existing parent
+                    if any(_operation(child) for child in element.iterdescendants()):
+                        raise _RPCError("data-missing", f"{name} does not exist")
+                    continue
+                if existing is None or op == "replace":
+                    router.create_interface(
+                        name,
+                        (_text(element, "type") or "softwareLoopback").split(":")[-1],
+                        _text(element, "ip"),
+                        _text(element, "enabled", "true") == "true",
+                        _text(element, "description", ""),
+                    )
+                    continue
+                enabled = _text(element, "enabled")
+                if enabled is not None:
+                    existing["enabled"] = enabled == "true"
+                description = _text(element, "description")
+                if description is not None:
+                    existing["description"] = description
@@ -0,0 +1,169 @@
+import base64
+import json
+import ssl
+import threading
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench.fake_device import PASSWORD, USERNAME, Latency, QuietHTTPServer
+
+DATA_PREFIX = "/restconf/data/"
+INTERFACES = "ietf-interfaces:interfaces/interface="
+INTERFACES_STATE = "ietf-interfaces:interfaces-state/interface="
+INTERFACES_STATE_LIST = "ietf-interfaces:interfaces-state"
+
+
+def _interface_json(interface):
+    body = {
+        "name": interface["name"],
+        "description": interface["description"],
+        "type": f"iana-if-type:{interface['type']}",
+        "enabled": interface["enabled"],
+    }
+    if interface["address"]:
+        body["ietf-ip:ipv4"] = {"address": [{"ip": interface["address"], "netmask": "255.255.255.0"}]}
+    return body
+
+
+def _state_json(router, interface):
+    return {
+        "name": interface["name"],
+        "type": f"iana-if-type:{interface['type']}",
+        "admin-status": "up" if interface["enabled"] else "down",
+        "oper-status": router.oper_status(interface),
+    }
+
+
+def _fields(query):
+    """Leaf names kept by a fields=interface(a;b;c) query, or None for all"""
+    fields = parse_qs(query).get("fields")
+    if not fields or "(" not in fields[0]:
+        return None
+    return set(fields[0].split("(", 1)[1].rstrip(")").split(";"))
+
+
+class FakeRestconfServer:
+    """HTTPS stand-in for the ietf-interfaces RESTCONF paths restconf_final uses"""
+
+    def __init__(self, router, host, port, cert_path, key_path, latency=None):
+        self.router = router
+        self.latency = latency or Latency()
+        self._server = QuietHTTPServer((host, port), self._handler_class())
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        # Handshake lazily in the per-connection thread instead of in the accept loop
+        self._server.socket = context.wrap_socket(
+            self._server.socket, server_side=True, do_handshake_on_connect=False
+        )
+        self.requests = 0
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _handler_class(self):
+        server = self
+        router = self.router
+        expected_auth = "Basic " + base64.b64encode(f"{USERNAME}:{PASSWORD}".encode()).decode()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the router
+
+            def _reply(self, code, body=None):
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(code)
+                if data:
+                    self.send_header("Content-Type", "application/yang-data+json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _route(self):
+                """Return (resource, interface name) or (None, None)"""
+                path = unquote(self.path.split("?")[0])
+                if not path.startswith(DATA_PREFIX):
+                    return None, None
+                path = path[len(DATA_PREFIX):]
+                if path == INTERFACES_STATE_LIST:
+                    return INTERFACES_STATE_LIST, None
+                for resource in (INTERFACES, INTERFACES_STATE):
+                    if path.startswith(resource):
+                        return resource, path[len(resource):]
+                return None, None
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _handle(self):
+                server.requests += 1
+                body = self._body() if self.command in ("PUT", "PATCH") else None
+                server.latency.sleep()
+                if self.headers.get("Authorization") != expected_auth:
+                    return self._reply(401)
+                resource, name = self._route()
+                if resource is None:
+                    return self._reply(404)
+
+                with router.lock:
+                    if resource == INTERFACES_STATE_LIST:
+                        if self.command != "GET":
+                            return self._reply(405)
+                        keep = _fields(urlsplit(self.path).query)
+                        rows = [
+                            {key: value for key, value in _state_json(router, interface).items()
+                             if keep is None or key in keep}
+                            for interface in router.interfaces.values()
+                        ]
+                        return self._reply(200, {"ietf-interfaces:interfaces-state": {"interface": rows}})
+                    interface = router.interfaces.get(name)
+                    if resource == INTERFACES_STATE:
+                        if self.command != "GET":
+                            return self._reply(405)
+                        if interface is None:
+                            return self._reply(404)
+                        return self._reply(200, {"ietf-interfaces:interface": _state_json(router, interface)})
+
+                    if self.command == "GET":
+                        if interface is None:
+                            return self._reply(404)
+                        return self._reply(200, {"ietf-interfaces:interface": _interface_json(interface)})
+                    if self.command == "DELETE":
+                        if interface is None:
+                            return self._reply(404)
+                        del router.interfaces[name]
+                        return self._reply(204)
+
+                    data = (body or {}).get("ietf-interfaces:interface", {})
+                    if self.command == "PUT":
+                        addresses = data.get("ietf-ip:ipv4", {}).get("address", [])
+                        router.create_interface(
+                            name,
+                            data.get("type", "iana-if-type:softwareLoopback").split(":")[-1],
+                            addresses[0]["ip"] if addresses else None,
+                            data.get("enabled", True),
+                            data.get("description", ""),
+                        )
+                        return self._reply(204 if interface else 201)
+                    # PATCH merges into an existing interface
+                    if interface is None:
+                        return self._reply(404)
+                    if "enabled" in data:
+                        interface["enabled"] = data["enabled"]
+                    if "description" in data:
+                        interface["description"] = data["description"]
+                    return self._reply(204)
+
+            do_GET = do_PUT = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-restconf", daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
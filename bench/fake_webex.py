@@ -0,0 +1,149 @@
+import datetime
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+from bench.fake_device import Latency, QuietHTTPServer
+
+
+def _form_fields(content_type, body):
+    """Decode a multipart/form-data body into {name: text or (filename, size)}"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        filename = part.get_filename()
+        payload = part.get_payload(decode=True) or b""
+        fields[name] = (filename, len(payload)) if filename else payload.decode(errors="replace")
+    return fields
+
+
+class FakeWebexServer:
+    """Stand-in for the Webex messages API the bot polls and posts to
+
+    add_message() drops a message into the room as a user would. Replies
+    posted by the bot are kept in `replies` with the time they arrived, and
+    wait_for_replies() blocks until enough have come in.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None):
+        self.latency = latency or Latency()
+        self._lock = threading.Condition()
+        self._messages = []  # oldest first
+        self._by_id = {}
+        self.replies = []  # {"roomId", "text", "files", "at"}
+        self.requests = 0
+        self._server = QuietHTTPServer((host, port), self._handler_class())
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def api_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def add_message(self, text, room_id):
+        with self._lock:
+            number = len(self._messages) + 1
+            created = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds")
+            message = {
+                "id": f"bench-message-{number:08d}",
+                "roomId": room_id,
+                "text": text,
+                "personEmail": "bench@example.com",
+                "created": created.replace("+00:00", "Z"),
+            }
+            self._messages.append(message)
+            self._by_id[message["id"]] = message
+            return message
+
+    def wait_for_replies(self, count, timeout):
+        """Wait until at least count replies arrived; return whether they did"""
+        with self._lock:
+            return self._lock.wait_for(lambda: len(self.replies) >= count, timeout)
+
+    def _page(self, query):
+        room_id = query.get("roomId", [None])[0]
+        page_size = int(query.get("max", ["50"])[0])
+        before = query.get("beforeMessage", [None])[0]
+        with self._lock:
+            items = [m for m in reversed(self._messages) if room_id in (None, m["roomId"])]
+        if before:
+            ids = [m["id"] for m in items]
+            items = items[ids.index(before) + 1:] if before in ids else []
+        return items[:page_size]
+
+    def _record_reply(self, content_type, body):
+        if content_type.startswith("multipart/form-data"):
+            fields = _form_fields(content_type, body)
+        else:
+            fields = json.loads(body or b"{}")
+        with self._lock:
+            self.replies.append({
+                "roomId": fields.get("roomId"),
+                "text": fields.get("text"),
+                "files": fields.get("files"),
+                "at": time.monotonic(),
+            })
+            self._lock.notify_all()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, code, body=None):
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _authorized(self):
+                return (self.headers.get("Authorization") or "").startswith("Bearer ")
+
+            def do_GET(self):
+                server.requests += 1
+                server.latency.sleep()
+                if not self._authorized():
+                    return self._reply(401, {"message": "Unauthorized"})
+                url = urlparse(self.path)
+                if url.path == "/v1/messages":
+                    return self._reply(200, {"items": server._page(parse_qs(url.query))})
+                if url.path.startswith("/v1/messages/"):
+                    message = server._by_id.get(url.path.rsplit("/", 1)[1])
+                    return self._reply(200, message) if message else self._reply(404, {"message": "Not found"})
+                self._reply(404, {"message": "Not found"})
+
+            def do_POST(self):
+                server.requests += 1
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                server.latency.sleep()
+                if not self._authorized():
+                    return self._reply(401, {"message": "Unauthorized"})
+                if urlparse(self.path).path != "/v1/messages":
+                    return self._reply(404, {"message": "Not found"})
+                server._record_reply(self.headers.get("Content-Type", ""), body)
+                self._reply(200, {"id": f"bench-reply-{len(server.replies):08d}"})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-webex", daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
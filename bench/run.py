@@ -0,0 +1,364 @@
+"""Offline benchmark against simulated CSR1KV routers and a simulated Webex API
+
+Run from the repository root:
+
+    python -m bench.run --paths restconf,netconf,netmiko,webex --commands 200 --latency 0.02
+
+The restconf, netconf and netmiko paths drive the real *_final modules through
+the bot's Dispatcher against local stand-ins bound to 127.0.0.11, 127.0.0.12, ...;
+restconf_async drives restconf_async from one event loop instead of threads.
+The webex path starts ipa2024_final.py against the fake Webex API and times
+each chat message until its reply is posted. Use --json to keep the results,
+including the session pool and cache counters, and --baseline to fail when a
+path got slower than a previous run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import netconf_final
+import netmiko_final
+import restconf_async
+import restconf_final
+from dispatcher import Dispatcher
+from interface_cache import interface_cache
+from interface_state import interface_state
+from inventory import inventory
+from metrics import Metrics, metrics
+
+from bench.fake_device import PASSWORD, USERNAME, FakeRouter, Latency, generate_certificate, generate_host_key
+from bench.fake_ios import FakeIOSServer
+from bench.fake_netconf import FakeNetconfServer
+from bench.fake_restconf import FakeRestconfServer
+from bench.fake_webex import FakeWebexServer
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+STUDENT_ID = restconf_final.STUDENT_ID
+ROOM_ID = "bench-room"
+PATHS = ("restconf", "restconf_async", "netconf", "netmiko", "webex")
+
+LOOPBACK_CYCLE = ("create", "status", "disable", "status", "enable", "status", "delete", "status")
+WORKLOADS = {
+    "restconf": LOOPBACK_CYCLE,
+    "restconf_async": LOOPBACK_CYCLE,
+    "netconf": LOOPBACK_CYCLE,
+    "netmiko": ("gigabit_status", "motd"),
+}
+# Chat commands the bot answers without touching a router
+WEBEX_MESSAGES = (
+    (f"/{STUDENT_ID} restconf", "Ok: Restconf"),
+    (f"/{STUDENT_ID} netconf", "Ok: Netconf"),
+)
+
+
+def _device_call(path, command, router_ip):
+    if path == "restconf":
+        return getattr(restconf_final, command)(router_ip, "Restconf")
+    if path == "netconf":
+        return getattr(netconf_final, command)(router_ip, "Netconf")
+    if command == "gigabit_status":
+        return netmiko_final.gigabit_status(router_ip)
+    return netmiko_final.get_motd(router_ip)
+
+
+def run_device_path(path, router_ips, args, results):
+    """Run args.commands commands, each router walking the workload in order"""
+    workload = WORKLOADS[path]
+    errors = []
+    lock = threading.Lock()
+
+    def job(command, router_ip):
+        start = time.perf_counter()
+        try:
+            reply = _device_call(path, command, router_ip)
+        except Exception as exc:
+            reply = f"Error: {exc}"
+        elapsed = time.perf_counter() - start
+        results.observe("bench_path_seconds", elapsed, path=path)
+        results.observe("bench_command_seconds", elapsed, path=path, command=command)
+        if not reply or reply.startswith("Error"):
+            with lock:
+                errors.append(f"{command} {router_ip}: {reply}")
+
+    dispatcher = Dispatcher(max_workers=args.concurrency, max_pending=args.commands)
+    start = time.perf_counter()
+    for i in range(args.commands):
+        router_ip = router_ips[i % len(router_ips)]
+        command = workload[(i // len(router_ips)) % len(workload)]
+        dispatcher.submit(router_ip, job, command, router_ip)
+    dispatcher.shutdown(wait=True)
+    return time.perf_counter() - start, errors
+
+
+def run_async_path(path, router_ips, args, results):
+    """Like run_device_path, with every router's commands as coroutines on one event loop"""
+    workload = WORKLOADS[path]
+    errors = []
+
+    async def router_jobs(router_ip, commands, limit):
+        for command in commands:
+            async with limit:
+                start = time.perf_counter()
+                try:
+                    reply = await getattr(restconf_async, command)(router_ip, "Restconf")
+                except Exception as exc:
+                    reply = f"Error: {exc}"
+                elapsed = time.perf_counter() - start
+            results.observe("bench_path_seconds", elapsed, path=path)
+            results.observe("bench_command_seconds", elapsed, path=path, command=command)
+            if not reply or reply.startswith("Error"):
+                errors.append(f"{command} {router_ip}: {reply}")
+
+    async def main():
+        limit = asyncio.Semaphore(args.concurrency)
+        jobs = {router_ip: [] for router_ip in router_ips}
+        for i in range(args.commands):
+            router_ip = router_ips[i % len(router_ips)]
+            jobs[router_ip].append(workload[(i // len(router_ips)) % len(workload)])
+        try:
+            await asyncio.gather(*(router_jobs(router_ip, commands, limit) for router_ip, commands in jobs.items()))
+        finally:
+            await restconf_async.aclose()
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return time.perf_counter() - start, errors
+
+
+def run_webex_path(webex, args, results, workdir):
+    """Start the bot against the fake Webex API and time message -> reply"""
+    env = {
+        **os.environ,
+        "WEBEX_TOKEN": "bench-token",
+        "ROOM_ID": ROOM_ID,
+        "WEBEX_API_URL": webex.api_url,
+        "CURSOR_FILE": str(Path(workdir) / "webex_cursor.json"),
+        "JOBS_FILE": str(Path(workdir) / "jobs.sqlite3"),
+        # The bench's simulated routers, not the repo's hosts file, and no background
+        # collection hitting them while the replies are timed
+        "INVENTORY_FILE": str(Path(workdir) / "hosts"),
+        "INTERFACE_STATE_INTERVAL": "0",
+        "POLL_MIN_INTERVAL": str(args.poll_interval),
+        "POLL_MAX_INTERVAL": str(args.poll_interval),
+        "PYTHONUNBUFFERED": "1",
+        # Every message is timed against its own reply, so do not merge replies
+        "WEBEX_COALESCE": "0",
+    }
+    env.pop("WEBHOOK_PORT", None)
+    log_path = Path(workdir) / "bot.log"
+    with open(log_path, "w") as log:
+        bot = subprocess.Popen(
+            [sys.executable, "ipa2024_final.py"], cwd=REPO_DIR, env=env,
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+        )
+    errors = []
+    try:
+        deadline = time.monotonic() + 60
+        while not Path(env["CURSOR_FILE"]).exists():
+            if bot.poll() is not None or time.monotonic() > deadline:
+                return 0.0, [f"bot did not start, see {log_path}"]
+            time.sleep(0.05)
+
+        start = time.perf_counter()
+        sent = 0
+        while sent < args.commands:
+            # Send a burst of messages the way a busy room would, then wait for every reply
+            burst = min(args.concurrency, args.commands - sent)
+            first = len(webex.replies)
+            sent_at = []
+            for i in range(burst):
+                text, _ = WEBEX_MESSAGES[(sent + i) % len(WEBEX_MESSAGES)]
+                webex.add_message(text, ROOM_ID)
+                sent_at.append(time.monotonic())
+            if not webex.wait_for_replies(first + burst, args.reply_timeout):
+                errors.append(f"only {len(webex.replies) - first}/{burst} replies within {args.reply_timeout}s")
+                break
+            for i in range(burst):
+                reply = webex.replies[first + i]
+                _, expected = WEBEX_MESSAGES[(sent + i) % len(WEBEX_MESSAGES)]
+                results.observe("bench_path_seconds", reply["at"] - sent_at[i], path="webex")
+                results.observe("bench_command_seconds", reply["at"] - sent_at[i], path="webex", command=expected)
+                if reply["text"] != expected:
+                    errors.append(f"expected {expected!r}, got {reply['text']!r}")
+            sent += burst
+        return time.perf_counter() - start, errors
+    finally:
+        bot.terminate()
+        try:
+            bot.wait(10)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+
+
+def write_inventory(routers, workdir):
+    """Point the backends at an inventory listing the simulated routers"""
+    path = Path(workdir) / "hosts"
+    lines = ["[routers]"] + [
+        f"{router.hostname} ansible_host={router.ip} ansible_user={USERNAME} ansible_password={PASSWORD}"
+        for router in routers
+    ]
+    path.write_text("\n".join(lines) + "\n")
+    inventory.configure(path)
+
+
+def start_devices(paths, router_ips, args, workdir):
+    """Start the stand-ins needed by paths; return the servers to stop afterwards"""
+    latency = Latency(args.latency, args.jitter)
+    routers = [FakeRouter(f"CSR1KV-Pod1-{i + 1}", ip) for i, ip in enumerate(router_ips)]
+    write_inventory(routers, workdir)
+    for router in routers:
+        router.motd = "Authorized access only"
+    servers = []
+    if "restconf" in paths or "restconf_async" in paths:
+        cert_path, key_path = generate_certificate(workdir, router_ips)
+        servers += [
+            FakeRestconfServer(router, router.ip, args.restconf_port, cert_path, key_path, latency)
+            for router in routers
+        ]
+        restconf_final.PORT = args.restconf_port
+        restconf_final.close_sessions()
+    if "netconf" in paths or "netmiko" in paths:
+        host_key = generate_host_key()
+        if "netconf" in paths:
+            servers += [
+                FakeNetconfServer(router, router.ip, args.netconf_port, host_key, latency) for router in routers
+            ]
+            netconf_final.PORT = args.netconf_port
+        if "netmiko" in paths:
+            servers += [FakeIOSServer(router, router.ip, args.ssh_port, host_key, latency) for router in routers]
+            netmiko_final.PORT = args.ssh_port
+    for server in servers:
+        server.start()
+    return servers
+
+
+def summarize(results, timings):
+    """Return {path: {"commands", "errors", "elapsed", "per_second", "p50", "p95", "p99"}}"""
+    rows = {row["labels"]["path"]: row for row in results.snapshot().get("bench_path_seconds", [])}
+    summary = {}
+    for path, (elapsed, errors) in timings.items():
+        row = rows.get(path, {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0})
+        summary[path] = {
+            "commands": row["count"],
+            "errors": len(errors),
+            "elapsed": elapsed,
+            "per_second": row["count"] / elapsed if elapsed else 0.0,
+            "p50": row["p50"],
+            "p95": row["p95"],
+            "p99": row["p99"],
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'path':<16}{'commands':>9}{'errors':>8}{'elapsed s':>11}{'cmd/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for path, row in summary.items():
+        print(
+            f"{path:<16}{row['commands']:>9}{row['errors']:>8}{row['elapsed']:>11.2f}{row['per_second']:>9.1f}"
+            f"{row['p50'] * 1000:>9.1f}{row['p95'] * 1000:>9.1f}{row['p99'] * 1000:>9.1f}"
+        )
+
+
+def compare(summary, baseline_path, tolerance):
+    """Return the regressions against a previous --json result"""
+    baseline = json.loads(Path(baseline_path).read_text())["summary"]
+    regressions = []
+    for path, row in summary.items():
+        before = baseline.get(path)
+        if not before:
+            continue
+        if row["per_second"] < before["per_second"] * (1 - tolerance):
+            regressions.append(f"{path}: {row['per_second']:.1f} cmd/s, was {before['per_second']:.1f}")
+        if row["p95"] > before["p95"] * (1 + tolerance):
+            regressions.append(f"{path}: p95 {row['p95'] * 1000:.1f} ms, was {before['p95'] * 1000:.1f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", default="restconf,restconf_async,netconf,netmiko,webex", help="comma-separated subset of " + ",".join(PATHS))
+    parser.add_argument("--routers", type=int, default=5, help="simulated routers (127.0.0.11 upwards)")
+    parser.add_argument("--commands", type=int, default=100, help="commands per path")
+    parser.add_argument("--concurrency", type=int, default=5, help="worker threads, or messages per burst for webex")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every simulated request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra random seconds per request")
+    parser.add_argument("--restconf-port", type=int, default=8443)
+    parser.add_argument("--netconf-port", type=int, default=8830)
+    parser.add_argument("--ssh-port", type=int, default=8022)
+    parser.add_argument("--webex-port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="bot poll interval for the webex path")
+    parser.add_argument("--reply-timeout", type=float, default=30.0)
+    parser.add_argument("--no-cache", action="store_true", help="disable the interface state caches")
+    parser.add_argument("--fast-cli", action="store_true", help="use Netmiko fast CLI mode")
+    parser.add_argument("--json", help="write summary, per-command and per-phase metrics to this file")
+    parser.add_argument("--baseline", help="previous --json result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    paths = [path for path in args.paths.split(",") if path]
+    unknown = set(paths) - set(PATHS)
+    if unknown:
+        parser.error(f"unknown paths: {', '.join(sorted(unknown))}")
+    router_ips = [f"127.0.0.{11 + i}" for i in range(args.routers)]
+    # Tables are collected on demand here; the bot also refreshes them in the background
+    interface_state.configure(netmiko_final.get_interfaces, source="Netmiko")
+    if args.no_cache:
+        interface_cache.ttl = 0
+        interface_state.max_age = 0
+    if args.fast_cli:
+        netmiko_final.configure(fast_cli=True)
+
+    results = Metrics()
+    timings = {}
+    with tempfile.TemporaryDirectory(prefix="ipa-bench-") as workdir:
+        servers = start_devices(paths, router_ips, args, workdir)
+        webex = None
+        try:
+            for path in paths:
+                print(f"Running {path} ...", file=sys.stderr)
+                if path == "webex":
+                    webex = FakeWebexServer("127.0.0.1", args.webex_port, Latency(args.latency, args.jitter))
+                    webex.start()
+                    timings[path] = run_webex_path(webex, args, results, workdir)
+                elif path == "restconf_async":
+                    timings[path] = run_async_path(path, router_ips, args, results)
+                else:
+                    timings[path] = run_device_path(path, router_ips, args, results)
+                for error in timings[path][1][:5]:
+                    print(f"  {path} error: {error}", file=sys.stderr)
+        finally:
+            netconf_final.session_pool.close_all()
+            netmiko_final.connection_cache.close_all()
+            restconf_final.close_sessions()
+            for server in servers:
+                server.stop()
+            if webex:
+                webex.stop()
+
+    summary = summarize(results, timings)
+    print_summary(summary)
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "args": vars(args),
+            "summary": summary,
+            "commands": results.snapshot().get("bench_command_seconds", []),
+            "device_phases": metrics.snapshot().get("ipa_device_seconds", []),
+            "stats": metrics.stats(),
+        }, indent=2))
+    if args.baseline:
+        regressions = compare(summary, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
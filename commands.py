@@ -0,0 +1,172 @@
+import re
+from collections import namedtuple
+
+# Dotted-quad IPv4 address, 0-255 per octet
+IP_RE = re.compile(r"(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)")
+
+NO_COMMAND = "Error: No command found."
+NO_METHOD = "Error: No method specified"
+NO_IP = "Error: No IP specified"
+BAD_TARGET = "Error: Invalid IP list, use <IP>,<IP>,..."
+
+
+class Command(namedtuple("Command", "name handler needs_method needs_ip fanout allow_all takes_text subcommands unknown_router")):
+    """One chat command
+
+    handler(ip, method, text, context) returns the reply text or (reply,
+    attachment); context is whatever the caller passed to execute().
+    needs_ip commands reply unknown_router for IPs outside the router list;
+    allow_all also accepts "<command> all" for the whole fleet. takes_text
+    keeps the rest of the message (e.g. the MOTD), and subcommands maps a
+    following word to another command ("showrun diff").
+    """
+
+
+# What a chat message asked for: reply is set when it can be answered without running anything
+Request = namedtuple("Request", "method command target text reply")
+
+
+class CommandRegistry:
+    """Command table, message tokenizer and router lookup for the bot
+
+    Messages have the form "<prefix> [method] [target] <command> [args...]",
+    where target is a router IP, "all" or a comma-separated IP list. They are
+    parsed in one pass over the tokens, and commands and method backends
+    (modules with create/delete/... functions) are found by dict lookup, so
+    adding either never touches the parser.
+    """
+
+    def __init__(self, prefix, routers=(), commands=None, backends=None, router_index=None):
+        self.prefix = prefix
+        self._commands = {} if commands is None else commands
+        self._backends = {} if backends is None else backends
+        self._router_index = {} if router_index is None else router_index
+        if router_index is None:
+            self.set_routers(routers)
+
+    def scoped(self, prefix, routers=None):
+        """Return a registry sharing these commands and backends with its own prefix
+
+        Without routers it also shares this registry's router list, including
+        later set_routers() calls.
+        """
+        if routers is None:
+            return CommandRegistry(prefix, commands=self._commands, backends=self._backends,
+                                   router_index=self._router_index)
+        return CommandRegistry(prefix, routers, self._commands, self._backends)
+
+    def set_routers(self, routers):
+        routers = tuple(routers)
+        # One assignment, so readers never see the tuple and set out of step
+        self._router_index["routers"] = (routers, frozenset(routers))
+
+    @property
+    def routers(self):
+        return self._router_index["routers"][0]
+
+    def is_router(self, ip):
+        return ip in self._router_index["routers"][1]
+
+    def add_backend(self, method, module):
+        self._backends[method] = module
+
+    def get(self, name):
+        return self._commands.get(name)
+
+    def command(self, name, needs_method=False, needs_ip=True, fanout=False, allow_all=False,
+                takes_text=False, subcommands=None, unknown_router=NO_IP):
+        """Decorator registering handler(ip, method, text, context) as a command"""
+        def register(handler):
+            self._commands[name] = Command(
+                name, handler, needs_method, needs_ip, fanout, allow_all, takes_text,
+                subcommands or {}, unknown_router,
+            )
+            return handler
+        return register
+
+    def method_command(self, name, fanout=True):
+        """Register a command run by the backend module the user chose ("restconf", "netconf", ...)"""
+        def run(ip, method, text, context):
+            backend = getattr(self._backends[method], name)
+            # A room (the usual context) works on its own student's interface
+            student_id = getattr(context, "student_id", None)
+            if student_id is None:
+                return backend(ip, method.capitalize())
+            return backend(ip, method.capitalize(), student_id=student_id)
+        self.command(name, needs_method=True, fanout=fanout)(run)
+
+    def targets(self, target):
+        """Return the routers named by "all" or a comma-separated IP list, else None
+
+        Repeated IPs are listed once, in the order they were first given.
+        """
+        if not target:
+            return None
+        if target.lower() == "all":
+            return self.routers
+        if "," in target:
+            return tuple(dict.fromkeys(ip for ip in target.split(",") if ip))
+        return None
+
+    def _is_target(self, token):
+        return IP_RE.fullmatch(token) is not None or self.targets(token) is not None
+
+    def parse(self, message):
+        """Return the Request in a chat message, or None if it is not for this bot"""
+        tokens = message.split()
+        if len(tokens) < 2 or tokens[0] != self.prefix:
+            return None
+
+        method = tokens[1].lower()
+        if method in self._backends:
+            position = 2
+            if len(tokens) == 2:
+                return Request(method, None, None, None, f"Ok: {method.capitalize()}")
+        else:
+            method = None
+            position = 1
+
+        target = None
+        if self._is_target(tokens[position]):
+            target = tokens[position]
+            if "," in target:
+                ips = self.targets(target)
+                if not ips or not all(IP_RE.fullmatch(ip) for ip in ips):
+                    return Request(method, None, None, None, BAD_TARGET)
+            position += 1
+            if position == len(tokens):
+                return Request(method, None, target, None, NO_COMMAND)
+        elif method:
+            # "<method> <anything but a router>" only selects the method
+            return Request(method, None, None, None, f"Ok: {method.capitalize()}")
+
+        name = tokens[position].lower()
+        rest = tokens[position + 1:]
+        command = self._commands.get(name)
+        if command and rest:
+            word = rest[0].lower()
+            if word in command.subcommands:
+                name = command.subcommands[word]
+                command = self._commands.get(name)
+                rest = rest[1:]
+            elif word == "all" and target is None and command.allow_all:
+                target = "all"
+                rest = rest[1:]
+        text = " ".join(rest) if command and command.takes_text and rest else None
+        return Request(method, name, target, text, None)
+
+    def execute(self, name, ip, method, text=None, context=None):
+        """Run a command and return (reply, attachment)"""
+        if not name:
+            return None, None
+        command = self._commands.get(name)
+        if command is None:
+            return NO_COMMAND, None
+        if command.needs_method and method not in self._backends:
+            return NO_METHOD, None
+        if command.needs_ip and not ip:
+            return NO_IP, None
+        if ip and not (command.allow_all and ip == "all") and not self.is_router(ip):
+            return command.unknown_router, None
+        result = command.handler(ip, method, text, context)
+        return result if isinstance(result, tuple) else (result, None)
@@ -0,0 +1,119 @@
+import datetime
+import difflib
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+STORE_DIR = Path("config_store")
+KEEP = 50  # snapshots kept per router
+
+# Lines IOS rewrites on every "show running-config" even when nothing changed
+VOLATILE_PREFIXES = (
+    "Building configuration",
+    "Current configuration :",
+    "! Last configuration change at",
+    "! NVRAM config last updated at",
+)
+
+
+def normalize(config_text):
+    """Drop volatile header lines so identical configurations hash the same"""
+    lines = [line.rstrip() for line in config_text.splitlines()]
+    return "\n".join(line for line in lines if not line.startswith(VOLATILE_PREFIXES)).strip("\n") + "\n"
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=path.name, dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ConfigStore:
+    """Versioned running-config snapshots per router
+
+    Snapshots are normalized, gzip-compressed and stored under their SHA-256,
+    so an unchanged configuration costs one history entry and no new object.
+    Each router keeps its last `keep` versions in history/<router>.json;
+    objects no longer referenced by any history are removed when trimming.
+    """
+
+    def __init__(self, root=STORE_DIR, keep=KEEP):
+        self.root = Path(root)
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def _object_path(self, digest):
+        return self.root / "objects" / digest[:2] / f"{digest}.gz"
+
+    def _history_path(self, router):
+        return self.root / "history" / f"{router}.json"
+
+    def history(self, router):
+        """Return [{"hash", "time"}, ...] oldest first"""
+        try:
+            return json.loads(self._history_path(router).read_text())
+        except (OSError, ValueError):
+            return []
+
+    def load(self, digest):
+        with gzip.open(self._object_path(digest), "rt") as snapshot:
+            return snapshot.read()
+
+    def save(self, router, config_text):
+        """Store a snapshot; return (entry, previous entry or None, changed)"""
+        text = normalize(config_text)
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        with self._lock:
+            history = self.history(router)
+            previous = history[-1] if history else None
+            if previous and previous["hash"] == digest:
+                return previous, previous, False
+
+            object_path = self._object_path(digest)
+            if not object_path.exists():
+                _write_atomic(object_path, gzip.compress(text.encode()))
+            entry = {"hash": digest, "time": datetime.datetime.now().isoformat(timespec="seconds")}
+            history.append(entry)
+            trimmed = len(history) > self.keep
+            history = history[-self.keep:]
+            _write_atomic(self._history_path(router), json.dumps(history, indent=1).encode())
+            if trimmed:
+                # The caller may still diff against the previous version
+                self._prune(keep={previous["hash"]})
+            return entry, previous, True
+
+    def _prune(self, keep=()):
+        referenced = set(keep)
+        for path in (self.root / "history").glob("*.json"):
+            try:
+                referenced.update(entry["hash"] for entry in json.loads(path.read_text()))
+            except (OSError, ValueError):
+                return  # never delete objects while a history is unreadable
+        for path in (self.root / "objects").glob("*/*.gz"):
+            if path.name[:-3] not in referenced:
+                path.unlink(missing_ok=True)
+
+    def diff(self, old_digest, new_digest):
+        """Return only the changed lines (with @@ hunk headers) between two snapshots"""
+        lines = list(difflib.unified_diff(
+            self.load(old_digest).splitlines(), self.load(new_digest).splitlines(), n=0, lineterm=""
+        ))
+        return lines[2:]  # drop the ---/+++ file header
+
+
+config_store = ConfigStore()
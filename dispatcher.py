@@ -0,0 +1,77 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the dispatcher cannot accept another job in time"""
+
+
+class Dispatcher:
+    """Run chat commands on a bounded worker pool
+
+    Jobs that share a key (the router IP) run one after another in the order
+    they were submitted, jobs for different keys run in parallel. At most
+    ``max_pending`` jobs can be queued or running at once; when that limit is
+    reached submit() blocks for up to ``submit_timeout`` seconds and then
+    raises QueueFullError, so a burst of chat messages cannot open an
+    unlimited number of device sessions.
+    """
+
+    def __init__(self, max_workers=5, max_pending=20, submit_timeout=30):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ipa-worker")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._submit_timeout = submit_timeout
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._queues = {}  # key -> jobs waiting behind the one currently running
+        self._pending = 0
+
+    def submit(self, key, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) behind any earlier job with the same key"""
+        if not self._slots.acquire(timeout=self._submit_timeout):
+            raise QueueFullError(f"Too many pending commands ({self._pending})")
+
+        job = (func, args, kwargs)
+        with self._lock:
+            self._pending += 1
+            waiting = self._queues.get(key)
+            if waiting is not None:
+                waiting.append(job)
+                return
+            self._queues[key] = deque()
+        self._executor.submit(self._run, key, job)
+
+    def _run(self, key, job):
+        func, args, kwargs = job
+        try:
+            func(*args, **kwargs)
+        except Exception as exc:
+            print(f"Error running job for {key}: {exc}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+                waiting = self._queues[key]
+                next_job = waiting.popleft() if waiting else None
+                if next_job is None:
+                    del self._queues[key]
+                if not self._pending:
+                    self._idle.notify_all()
+            self._slots.release()
+
+        # Hand the next job for this key back to the pool instead of running it
+        # here, so a busy router cannot hold on to a worker thread forever.
+        if next_job is not None:
+            self._executor.submit(self._run, key, next_job)
+
+    def pending(self):
+        """Return the number of queued and running jobs"""
+        with self._lock:
+            return self._pending
+
+    def shutdown(self, wait=True):
+        """Stop the pool, first draining every queued job when wait is True"""
+        if wait:
+            with self._idle:
+                self._idle.wait_for(lambda: not self._pending)
+        self._executor.shutdown(wait=wait)
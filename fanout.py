@@ -0,0 +1,53 @@
+import threading
+
+
+class FanOut:
+    """Collect one result per router and report them together
+
+    record() is called from the worker jobs as each router finishes. As soon
+    as every router has answered, or `timeout` seconds after start(),
+    on_complete(results) is called exactly once with {router_ip: message};
+    routers that did not answer in time are reported as timed out and their
+    late results are dropped.
+    """
+
+    def __init__(self, router_ips, on_complete, timeout=60):
+        self.router_ips = tuple(router_ips)
+        self._on_complete = on_complete
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._results = {}
+        self._done = False
+        self._timer = None
+
+    def start(self):
+        self._timer = threading.Timer(self._timeout, self._finish)
+        self._timer.daemon = True
+        self._timer.start()
+
+    @property
+    def done(self):
+        with self._lock:
+            return self._done
+
+    def record(self, router_ip, message):
+        with self._lock:
+            if self._done:
+                return
+            self._results[router_ip] = message
+            complete = len(self._results) == len(self.router_ips)
+        if complete:
+            self._finish()
+
+    def _finish(self):
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+            results = {
+                router_ip: self._results.get(router_ip, f"Error: No reply within {self._timeout}s")
+                for router_ip in self.router_ips
+            }
+        if self._timer:
+            self._timer.cancel()
+        self._on_complete(results)
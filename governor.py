@@ -0,0 +1,284 @@
+import functools
+import socket
+import threading
+import time
+import weakref
+from contextlib import ExitStack, contextmanager
+
+from metrics import metrics
+
+MAX_SESSIONS = 2  # sessions open to one router at a time, idle pooled ones included, over all backends
+FAILURE_THRESHOLD = 3  # consecutive connection failures that open the breaker
+PROBE_INTERVAL = 10  # seconds between reachability probes of an open router
+PROBE_TIMEOUT = 3  # TCP connect timeout of a probe
+ACQUIRE_TIMEOUT = 120  # longest wait for a free session slot
+RECLAIM_INTERVAL = 1  # seconds between attempts to close idle sessions while waiting for a slot
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class GovernorError(RuntimeError):
+    pass
+
+
+class DeviceDownError(GovernorError):
+    """Raised without contacting a router whose breaker is open"""
+
+
+class DeviceBusyError(GovernorError):
+    """Raised when no session slot for the router became free in time"""
+
+
+class _Device:
+    def __init__(self, max_sessions):
+        self.slots = threading.BoundedSemaphore(max_sessions)
+        self.open = 0  # slots taken, i.e. sessions open to the router
+
+
+class _Breaker:
+    def __init__(self):
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial = False  # a half-open call is deciding the breaker's state
+        self.last_error = None
+
+
+class Governor:
+    """Per-router session cap and per-service circuit breaker shared by every backend
+
+    Every session a backend opens to a router, whatever the protocol, holds
+    one of the router's max_sessions slots from take_slot() until it is
+    closed, including while it sits idle in a pool, so the bot never has more
+    sessions open than the router accepts. When the slots are taken, the
+    reclaimers the pools registered are asked to close idle sessions to make
+    room. Breakers are kept per (router_ip, port) and wrap each call with
+    breaker(), so a dead RESTCONF server does not block SSH to the same
+    router. Exceptions listed in failures count as connection failures;
+    after failure_threshold of them in a row the breaker opens and calls
+    fail at once with DeviceDownError instead of waiting through the
+    backend's timeouts. A background thread probes the port of every open
+    breaker with a TCP connect every probe_interval seconds; once a probe
+    succeeds the breaker is half-open and exactly one call is let through to
+    decide whether it closes or opens again.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, failure_threshold=FAILURE_THRESHOLD,
+                 probe_interval=PROBE_INTERVAL, probe_timeout=PROBE_TIMEOUT, acquire_timeout=ACQUIRE_TIMEOUT):
+        self.max_sessions = max_sessions
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._devices = {}  # router_ip -> _Device
+        self._breakers = {}  # (router_ip, port) -> _Breaker
+        self._reclaimers = []
+        self._prober = None
+
+    def configure(self, max_sessions=None, failure_threshold=None, probe_interval=None, probe_timeout=None,
+                  acquire_timeout=None):
+        """Change the limits; slot counts apply to routers first seen afterwards"""
+        with self._lock:
+            if max_sessions is not None:
+                self.max_sessions = max_sessions
+                self._devices = {}
+            if failure_threshold is not None:
+                self.failure_threshold = failure_threshold
+            if probe_interval is not None:
+                self.probe_interval = probe_interval
+            if probe_timeout is not None:
+                self.probe_timeout = probe_timeout
+            if acquire_timeout is not None:
+                self.acquire_timeout = acquire_timeout
+
+    def _device(self, router_ip):
+        with self._lock:
+            device = self._devices.get(router_ip)
+            if device is None:
+                device = self._devices[router_ip] = _Device(self.max_sessions)
+            return device
+
+    def _breaker(self, router_ip, port):
+        # Called with self._lock held
+        breaker = self._breakers.get((router_ip, port))
+        if breaker is None:
+            breaker = self._breakers[(router_ip, port)] = _Breaker()
+        return breaker
+
+    def check(self, router_ip, port):
+        """Raise DeviceDownError if a call to router_ip:port would be refused now"""
+        if self.is_down(router_ip, port):
+            raise DeviceDownError(f"{router_ip}:{port} is unreachable, waiting for it to recover")
+
+    def admit(self, router_ip, port):
+        """Let one call through or raise DeviceDownError; a half-open breaker admits a single trial
+
+        Every admitted call must end in record_success, record_failure or release.
+        """
+        with self._lock:
+            breaker = self._breaker(router_ip, port)
+            if breaker.state == OPEN or (breaker.state == HALF_OPEN and breaker.trial):
+                raise DeviceDownError(f"{router_ip}:{port} is unreachable, waiting for it to recover")
+            if breaker.state == HALF_OPEN:
+                breaker.trial = True
+
+    def release(self, router_ip, port):
+        """End an admitted call that says nothing about reachability"""
+        with self._lock:
+            self._breaker(router_ip, port).trial = False
+
+    def record_success(self, router_ip, port):
+        with self._lock:
+            breaker = self._breaker(router_ip, port)
+            if breaker.state != CLOSED:
+                print(f"{router_ip}:{port} is reachable again")
+            breaker.failures = 0
+            breaker.state = CLOSED
+            breaker.trial = False
+
+    def record_failure(self, router_ip, port, error=None):
+        with self._lock:
+            breaker = self._breaker(router_ip, port)
+            breaker.failures += 1
+            breaker.last_error = error
+            breaker.trial = False
+            if breaker.state == HALF_OPEN or (breaker.state == CLOSED and breaker.failures >= self.failure_threshold):
+                breaker.state = OPEN
+                breaker.opened_at = time.monotonic()
+                print(f"{router_ip}:{port} marked unreachable after {breaker.failures} failures: {error}")
+                self._start_prober()
+
+    @contextmanager
+    def breaker(self, router_ip, port, failures=(OSError,), ignore=()):
+        """Admit one call to router_ip:port; exceptions in failures (but not ignore) count against it
+
+        Slots are not touched here; they belong to the sessions (see take_slot).
+        """
+        self.admit(router_ip, port)
+        try:
+            yield
+        except failures as exc:
+            if isinstance(exc, ignore):
+                self.release(router_ip, port)
+            else:
+                self.record_failure(router_ip, port, exc)
+            raise
+        except BaseException:
+            self.release(router_ip, port)
+            raise
+        else:
+            self.record_success(router_ip, port)
+
+    def add_reclaimer(self, reclaim):
+        """Register reclaim(router_ip) -> True if it closed one of its idle sessions to router_ip"""
+        with self._lock:
+            self._reclaimers.append(reclaim)
+
+    def _reclaim(self, router_ip):
+        with self._lock:
+            reclaimers = list(self._reclaimers)
+        for reclaim in reclaimers:
+            try:
+                if reclaim(router_ip):
+                    return True
+            except Exception as exc:
+                print(f"Error closing an idle session to {router_ip}: {exc}")
+        return False
+
+    def take_slot(self, router_ip):
+        """Take a slot for a session about to be opened to router_ip and return its release()
+
+        Idle sessions of the pools are closed to make room; DeviceBusyError if
+        no slot became free within acquire_timeout.
+        """
+        device = self._device(router_ip)
+        deadline = time.monotonic() + self.acquire_timeout
+        while not device.slots.acquire(blocking=False):
+            if self._reclaim(router_ip) and device.slots.acquire(blocking=False):
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeviceBusyError(f"No free session to {router_ip} after {self.acquire_timeout}s")
+            # A session that went idle meanwhile is reclaimed on the next round
+            if device.slots.acquire(timeout=min(remaining, RECLAIM_INTERVAL)):
+                break
+        with self._lock:
+            device.open += 1
+        return functools.partial(self._release_slot, device)
+
+    def _release_slot(self, device):
+        with self._lock:
+            device.open -= 1
+        device.slots.release()
+
+    def hold(self, session, release):
+        """Tie a slot from take_slot() to session until drop(session) or until it is garbage collected"""
+        session._governor_slot = weakref.finalize(session, release)
+
+    def drop(self, session):
+        """Release the slot a closed session held; later calls do nothing"""
+        slot = getattr(session, "_governor_slot", None)
+        if slot is not None:
+            slot()
+
+    @contextmanager
+    def sessions(self, router_ips):
+        """Hold one slot on each of several routers for one run (e.g. Ansible), taken in a fixed order"""
+        with ExitStack() as stack:
+            for router_ip in sorted(set(router_ips)):
+                stack.callback(self.take_slot(router_ip))
+            yield
+
+    def is_down(self, router_ip, port):
+        with self._lock:
+            breaker = self._breakers.get((router_ip, port))
+            return breaker is not None and (breaker.state == OPEN or (breaker.state == HALF_OPEN and breaker.trial))
+
+    def _start_prober(self):
+        # Called with self._lock held
+        if self._prober is None:
+            self._prober = threading.Thread(target=self._probe_forever, name="governor-probe", daemon=True)
+            self._prober.start()
+
+    def _probe_forever(self):
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                down = [key for key, breaker in self._breakers.items() if breaker.state == OPEN]
+            for router_ip, port in down:
+                if self._probe(router_ip, port):
+                    with self._lock:
+                        breaker = self._breakers.get((router_ip, port))
+                        if breaker is not None and breaker.state == OPEN:
+                            breaker.state = HALF_OPEN
+                            print(f"{router_ip}:{port} answered a probe, letting the next call through")
+
+    def _probe(self, router_ip, port):
+        try:
+            with socket.create_connection((router_ip, port), timeout=self.probe_timeout):
+                return True
+        except OSError:
+            return False
+
+    def stats(self):
+        """{"router_ip:port": {"open", "half_open", "failures"}} for every breaker"""
+        with self._lock:
+            return {
+                f"{router_ip}:{port}": {
+                    "open": int(breaker.state == OPEN),
+                    "half_open": int(breaker.state == HALF_OPEN),
+                    "failures": breaker.failures,
+                }
+                for (router_ip, port), breaker in self._breakers.items()
+            }
+
+    def session_stats(self):
+        """{router_ip: {"open": sessions open}}"""
+        with self._lock:
+            return {router_ip: {"open": device.open} for router_ip, device in self._devices.items()}
+
+
+governor = Governor()
+metrics.register_stats("ipa_governor_breaker", governor.stats, label="target")
+metrics.register_stats("ipa_governor_sessions", governor.session_stats, label="router")
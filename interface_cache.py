@@ -0,0 +1,72 @@
+import threading
+import time
+
+from metrics import metrics
+
+TTL = 10  # seconds a cached existence/status answer stays valid
+
+
+class InterfaceStateCache:
+    """Short-lived per-router cache of an interface's existence and status
+
+    restconf_final and netconf_final look here before sending the existence
+    check that precedes every write, and update the entry after their own
+    successful writes, so most precondition checks are answered from memory.
+    Entries expire after ttl seconds to pick up changes made outside the bot.
+    """
+
+    def __init__(self, ttl=TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # (router_ip, interface) -> {"exists": (value, at), "status": ((admin, oper), at)}
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, router_ip, interface, field):
+        with self._lock:
+            cached = self._entries.get((router_ip, interface), {}).get(field)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+            return None
+
+    def _set(self, router_ip, interface, field, value):
+        with self._lock:
+            self._entries.setdefault((router_ip, interface), {})[field] = (value, time.monotonic())
+
+    def get_exists(self, router_ip, interface):
+        """Return True/False from the cache, or None on a miss"""
+        return self._get(router_ip, interface, "exists")
+
+    def set_exists(self, router_ip, interface, exists):
+        self._set(router_ip, interface, "exists", exists)
+        if not exists:
+            self.invalidate_status(router_ip, interface)
+
+    def get_status(self, router_ip, interface):
+        """Return (admin_status, oper_status) from the cache, or None on a miss"""
+        return self._get(router_ip, interface, "status")
+
+    def set_status(self, router_ip, interface, admin_status, oper_status):
+        self._set(router_ip, interface, "exists", True)
+        self._set(router_ip, interface, "status", (admin_status, oper_status))
+
+    def invalidate_status(self, router_ip, interface):
+        with self._lock:
+            self._entries.get((router_ip, interface), {}).pop("status", None)
+
+    def invalidate(self, router_ip, interface=None):
+        """Forget one interface, or everything known about a router"""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == router_ip and interface in (None, key[1]):
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+interface_cache = InterfaceStateCache()
+metrics.register_stats("ipa_interface_cache", interface_cache.stats)
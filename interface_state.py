@@ -0,0 +1,196 @@
+import functools
+import inspect
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from inventory import changed_devices, inventory
+from metrics import metrics
+
+INTERVAL = 30  # seconds between background collections of one router
+MAX_AGE = 60  # oldest table answered from memory
+WORKERS = 4  # routers collected at the same time
+
+InterfaceRecord = namedtuple("InterfaceRecord", "name admin_status oper_status address")
+# interfaces: {name: InterfaceRecord}; collected_at is time.monotonic(), collected_on a wall-clock timestamp
+Snapshot = namedtuple("Snapshot", "router_ip interfaces collected_at collected_on")
+
+
+class InterfaceStateStore:
+    """In-memory interface table per router, kept fresh in the background
+
+    collect(router_ip) returns the router's InterfaceRecords in one device
+    round trip; source names the backend behind it in error replies. start()
+    collects every router every `interval` seconds;
+    get() answers from memory while the table is younger than max_age and
+    otherwise, or when refresh is asked for, collects live. Writes made by the
+    bot call invalidate() (see `invalidates`), and a table collected before
+    the last write is never served.
+    """
+
+    def __init__(self, collect=None, interval=INTERVAL, max_age=MAX_AGE, workers=WORKERS, source=None):
+        self._collect = collect
+        self.source = source
+        self.interval = interval
+        self.max_age = max_age
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._snapshots = {}  # router_ip -> Snapshot
+        self._changed = {}  # router_ip -> time of the last write
+        self._router_locks = {}  # one collection per router at a time
+        self._thread = None
+        self._stop = threading.Event()
+        self.hits = 0
+        self.collections = 0
+        self.errors = 0
+
+    def configure(self, collect=None, interval=None, max_age=None, source=None):
+        if collect is not None:
+            self._collect = collect
+        if source is not None:
+            self.source = source
+        if interval is not None:
+            self.interval = interval
+        if max_age is not None:
+            self.max_age = max_age
+
+    def _fresh(self, router_ip, max_age):
+        snapshot = self._snapshots.get(router_ip)
+        if snapshot is None or time.monotonic() - snapshot.collected_at > max_age:
+            return None
+        if snapshot.collected_at < self._changed.get(router_ip, 0):
+            return None
+        return snapshot
+
+    def peek(self, router_ip, max_age=None, source=None):
+        """Return the router's table if it is fresh enough, without touching the device
+
+        With source set, only a table collected by that backend is returned.
+        """
+        if source is not None and (self.source or "").lower() != source.lower():
+            return None
+        with self._lock:
+            snapshot = self._fresh(router_ip, self.max_age if max_age is None else max_age)
+            if snapshot is not None:
+                self.hits += 1
+            return snapshot
+
+    def get(self, router_ip, max_age=None, refresh=False):
+        """Return the router's table, collecting it live when stale or when refresh is set"""
+        if not refresh:
+            snapshot = self.peek(router_ip, max_age)
+            if snapshot is not None:
+                return snapshot
+        return self._load(router_ip, max_age, refresh)
+
+    def _load(self, router_ip, max_age=None, refresh=False):
+        """Collect the router's table unless a fresh one turned up meanwhile; never counted as a hit"""
+        with self._lock:
+            router_lock = self._router_locks.setdefault(router_ip, threading.Lock())
+        started = time.monotonic()
+        with router_lock:
+            # Another caller may have collected while we waited
+            with self._lock:
+                snapshot = self._fresh(router_ip, self.max_age if max_age is None else max_age)
+                if snapshot is not None and (not refresh or snapshot.collected_at >= started):
+                    return snapshot
+            return self._collect_now(router_ip)
+
+    def _collect_now(self, router_ip):
+        collected_at = time.monotonic()
+        try:
+            records = self._collect(router_ip)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        snapshot = Snapshot(
+            router_ip,
+            {record.name: record for record in records},
+            collected_at,
+            time.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        with self._lock:
+            self.collections += 1
+            if collected_at >= self._changed.get(router_ip, 0):
+                self._snapshots[router_ip] = snapshot
+        return snapshot
+
+    def invalidate(self, router_ip):
+        """Forget the router's table after a change made through the bot"""
+        with self._lock:
+            self._changed[router_ip] = time.monotonic()
+            self._snapshots.pop(router_ip, None)
+
+    def start(self, routers):
+        """Collect routers() in the background every interval seconds"""
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(
+                target=self._run, args=(routers,), name="interface-state", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, routers):
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="interface-state") as pool:
+            while not self._stop.is_set():
+                router_ips = routers()
+                # Checked without peek() so the poller's own reads are not counted as cache hits
+                with self._lock:
+                    due = [router_ip for router_ip in router_ips if self._fresh(router_ip, self.interval) is None]
+                for router_ip, error in zip(due, pool.map(self._collect_quietly, due)):
+                    if error:
+                        print(f"Error collecting interface state from {router_ip}: {error}")
+                self._stop.wait(self.interval / 2)
+
+    def _collect_quietly(self, router_ip):
+        try:
+            self._load(router_ip, max_age=self.interval)
+        except Exception as exc:
+            return exc
+        return None
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "routers": len(self._snapshots),
+                "hits": self.hits,
+                "collections": self.collections,
+                "errors": self.errors,
+            }
+
+
+interface_state = InterfaceStateStore()
+metrics.register_stats("ipa_interface_state", interface_state.stats)
+
+
+def _on_inventory_change(old, new):
+    # An edited or re-addressed router may be a different device now
+    for router_ip in changed_devices(old, new):
+        interface_state.invalidate(router_ip)
+
+
+inventory.subscribe(_on_inventory_change)
+
+
+def invalidates(func):
+    """Decorator for write functions taking router_ip first: drop its table once they return"""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(router_ip, *args, **kwargs):
+            try:
+                return await func(router_ip, *args, **kwargs)
+            finally:
+                interface_state.invalidate(router_ip)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(router_ip, *args, **kwargs):
+        try:
+            return func(router_ip, *args, **kwargs)
+        finally:
+            interface_state.invalidate(router_ip)
+    return wrapper
@@ -0,0 +1,236 @@
+import json
+import os
+import shlex
+import threading
+from collections import namedtuple
+from pathlib import Path
+from types import MappingProxyType
+
+try:
+    import yaml
+except ImportError:  # PyYAML comes with ansible-core; without it only INI and JSON inventories load
+    yaml = None
+
+INVENTORY_FILE = Path("hosts")
+CHECK_INTERVAL = 5  # seconds between checks of the inventory file for changes
+
+
+class UnknownDeviceError(KeyError):
+    pass
+
+
+class Device(namedtuple("Device", "name ip username password secret vars")):
+    """One router: inventory hostname, management IP, login, enable secret and all host variables"""
+
+    @classmethod
+    def from_vars(cls, name, host_vars):
+        return cls(
+            name,
+            host_vars.get("ansible_host", name),
+            host_vars.get("ansible_user"),
+            host_vars.get("ansible_password"),
+            host_vars.get("ansible_become_password"),
+            MappingProxyType(dict(host_vars)),
+        )
+
+
+class Inventory:
+    """Immutable index of one version of the inventory, by management IP and by hostname"""
+
+    def __init__(self, devices=()):
+        self.devices = tuple(devices)
+        self._by_ip = MappingProxyType({device.ip: device for device in self.devices})
+        self._by_name = MappingProxyType({device.name: device for device in self.devices})
+        self._ips = tuple(self._by_ip)
+
+    def get(self, key):
+        """Return the Device with this IP or hostname, or None"""
+        return self._by_ip.get(key) or self._by_name.get(key)
+
+    def ips(self):
+        return self._ips
+
+    def name_for(self, ip):
+        device = self._by_ip.get(ip)
+        return device.name if device else None
+
+    def __contains__(self, key):
+        return key in self._by_ip or key in self._by_name
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __len__(self):
+        return len(self.devices)
+
+
+def parse_ini(text):
+    """Parse an Ansible INI inventory into {hostname: vars}, applying [group:vars] and [all:vars]"""
+    hosts = {}
+    groups = {}  # group -> hostnames
+    group_vars = {}
+    section = "ungrouped"
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line or line.startswith(("#", ";")):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1].strip()
+            continue
+        fields = shlex.split(line, comments=True)
+        if not fields:
+            continue
+        group, _, kind = section.partition(":")
+        if kind == "vars":
+            key, _, value = line.partition("=")
+            group_vars.setdefault(group, {})[key.strip()] = value.strip().strip("\"'")
+        elif kind == "children":
+            continue
+        else:
+            name = fields[0]
+            host_vars = hosts.setdefault(name, {})
+            for field in fields[1:]:
+                key, _, value = field.partition("=")
+                host_vars[key] = value  # kept as strings, passwords may look like numbers
+            groups.setdefault(group, []).append(name)
+
+    for name, host_vars in hosts.items():
+        merged = dict(group_vars.get("all", {}))
+        for group, members in groups.items():
+            if name in members:
+                merged.update(group_vars.get(group, {}))
+        merged.update(host_vars)
+        hosts[name] = merged
+    return hosts
+
+
+def parse_structured(data, inherited=None, hosts=None):
+    """Walk an Ansible YAML/JSON inventory ({group: {hosts, vars, children}}) into {hostname: vars}"""
+    hosts = {} if hosts is None else hosts
+    for group in (data or {}).values():
+        if not isinstance(group, dict):
+            continue
+        group_vars = {**(inherited or {}), **(group.get("vars") or {})}
+        for name, host_vars in (group.get("hosts") or {}).items():
+            hosts[name] = {**hosts.get(name, {}), **group_vars, **(host_vars or {})}
+        parse_structured(group.get("children"), group_vars, hosts)
+    return hosts
+
+
+def load(path):
+    """Read an inventory file (INI, YAML or JSON) into an Inventory"""
+    path = Path(path)
+    text = path.read_text()
+    if path.suffix == ".json":
+        hosts = parse_structured(json.loads(text))
+    elif path.suffix in (".yml", ".yaml"):
+        if yaml is None:
+            raise ValueError(f"PyYAML is needed to read {path}")
+        try:
+            hosts = parse_structured(yaml.safe_load(text))
+        except yaml.YAMLError as exc:
+            raise ValueError(str(exc)) from exc
+    else:
+        hosts = parse_ini(text)
+    return Inventory(Device.from_vars(name, host_vars) for name, host_vars in hosts.items())
+
+
+def changed_devices(old, new):
+    """Return the IPs whose device entry was added, removed or edited between two inventories"""
+    ips = set(old.ips()) | set(new.ips())
+    return {ip for ip in ips if old.get(ip) != new.get(ip)}
+
+
+class InventoryStore:
+    """The current Inventory, loaded once and swapped whole when the file changes
+
+    Lookups read the current immutable snapshot without locking or
+    re-parsing. watch() starts a thread that checks the file's modification
+    time every check_interval seconds; after a successful reload each
+    subscriber is called with (old, new) so it can drop state for devices
+    that changed. A file that fails to parse is reported and the previous
+    version stays in use.
+    """
+
+    def __init__(self, path=INVENTORY_FILE, check_interval=CHECK_INTERVAL):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._current = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def configure(self, path=None, check_interval=None):
+        """Point at another inventory file and load it now"""
+        if path is not None:
+            self.path = Path(path)
+        if check_interval is not None:
+            self.check_interval = check_interval
+        self.reload(force=True)
+
+    def current(self):
+        if self._current is None:
+            self.reload(force=True)
+        return self._current
+
+    def get(self, key):
+        return self.current().get(key)
+
+    def device(self, key):
+        """Return the Device for an IP or hostname, or raise UnknownDeviceError"""
+        device = self.current().get(key)
+        if device is None:
+            raise UnknownDeviceError(f"{key} is not in the inventory {self.path}")
+        return device
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def reload(self, force=False):
+        """Re-read the file if it changed (or when force is set); return whether it was swapped"""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as exc:
+                if self._current is None:
+                    print(f"Error reading inventory: {exc}")
+                    self._current = Inventory()
+                return False
+            if not force and mtime == self._mtime:
+                return False
+            try:
+                new = load(self.path)
+            except (OSError, ValueError) as exc:
+                print(f"Error reading inventory {self.path}: {exc}")
+                if self._current is None:
+                    self._current = Inventory()
+                return False
+            old = self._current
+            self._current = new
+            self._mtime = mtime
+        if old is not None:
+            for callback in self._subscribers:
+                try:
+                    callback(old, new)
+                except Exception as exc:
+                    print(f"Error applying inventory change: {exc}")
+        return True
+
+    def watch(self):
+        """Reload automatically in a background thread"""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="inventory-watch", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            if self.reload():
+                print(f"Inventory reloaded: {len(self._current)} devices")
+
+    def stop(self):
+        self._stop.set()
+
+
+inventory = InventoryStore()
@@ -6,19 +6,32 @@
 #######################################################################################
 # 1. Import libraries for API requests, JSON formatting, time, os, (restconf_final or netconf_final), netmiko_final, and ansible_final.
 
-import json
+import atexit
+import functools
 import os
-import time
+import queue
+import threading
 from pathlib import Path
 
-import requests
 from dotenv import load_dotenv
-from requests_toolbelt.multipart.encoder import MultipartEncoder  # type: ignore
 
 import restconf_final
 import netconf_final  # type: ignore
 import netmiko_final  # type: ignore
 import ansible_final  # type: ignore
+from commands import CommandRegistry
+from dispatcher import Dispatcher, QueueFullError
+from fanout import FanOut
+from governor import governor
+from interface_cache import interface_cache
+from interface_state import interface_state
+from inventory import inventory
+from job_store import DONE, job_store
+from metrics import MetricsServer, metrics, start_json_dump
+from rooms import RoomBusyError, RoomSet, load_room_configs
+from uploader import GZIP_THRESHOLD, Attachment, AttachmentUploader, upload_timeout
+from webex_client import Outbox, WebexClient, WebexError
+import webex_webhook
 
 #######################################################################################
 # 2. Assign the Webex access token to the variable ACCESS_TOKEN using environment variables.
@@ -32,261 +45,468 @@ if not ACCESS_TOKEN:
 #######################################################################################
 # 3. Prepare parameters get the latest message for messages API.
 
-roomIdToGetMessages = os.environ.get("ROOM_ID")
-if not roomIdToGetMessages:
-    raise EnvironmentError("Environment variable ROOM_ID is required")
-
-WEBEX_MESSAGES_URL = "https://webexapis.com/v1/messages"
+WEBEX_API_URL = os.environ.get("WEBEX_API_URL", "https://webexapis.com/v1")
 STUDENT_ID = getattr(restconf_final, "STUDENT_ID", "66070014")
-AUTH_HEADER = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
-last_message_id = None
-method_specified = None  # Will store "restconf" or "netconf"
-ROUTER_IPS = ("10.0.15.61", "10.0.15.62", "10.0.15.63", "10.0.15.64", "10.0.15.65")
-VALID_COMMANDS = ("create", "delete", "enable", "disable", "status", "gigabit_status", "showrun", "motd")
+# Routers and their logins come from the Ansible inventory (INI, YAML or JSON), re-read when it changes
+inventory.configure(
+    os.environ.get("INVENTORY_FILE", inventory.path),
+    float(os.environ.get("INVENTORY_CHECK_INTERVAL", inventory.check_interval)),
+)
+inventory.watch()
+ROUTER_IPS = inventory.current().ips()
+FANOUT_TIMEOUT = float(os.environ.get("FANOUT_TIMEOUT", 60))  # per-device limit for "all"/list targets
 
-while 1:
-    time.sleep(1)
+# Rooms served by this process: ROOMS_FILE (JSON list of {"room_id", "student_id", "routers"}),
+# else ROOM_IDS (comma-separated) or ROOM_ID, each with STUDENT_ID and every inventory router
+ROOM_IDS = [room_id for room_id in os.environ.get("ROOM_IDS", os.environ.get("ROOM_ID", "")).split(",") if room_id]
+if not ROOM_IDS and not os.environ.get("ROOMS_FILE"):
+    raise EnvironmentError("Environment variable ROOM_ID, ROOM_IDS or ROOMS_FILE is required")
+ROOM_CONFIGS = load_room_configs(os.environ.get("ROOMS_FILE"), ROOM_IDS, STUDENT_ID)
 
-    getParameters = {"roomId": roomIdToGetMessages, "max": 1} # get the latest message
+# Commands run on a bounded worker pool: different routers in parallel, the same router in order.
+MAX_PENDING = int(os.environ.get("MAX_PENDING_COMMANDS", 20))
+dispatcher = Dispatcher(
+    max_workers=int(os.environ.get("WORKER_THREADS", len(ROUTER_IPS))),
+    max_pending=MAX_PENDING,
+)
+BUSY_REPLY = "Error: Too many pending commands, please try again later"
+# Each room may hold only its share of the pending slots, so a busy room cannot starve the rest
+ROOM_MAX_PENDING = int(os.environ.get("ROOM_MAX_PENDING", max(1, MAX_PENDING // len(ROOM_CONFIGS))))
 
-    try:
-        r = requests.get(
-            WEBEX_MESSAGES_URL,
-            params=getParameters,
-            headers=AUTH_HEADER,
-            timeout=10,
-        )
-    except requests.RequestException as exc:
-        print(f"Error fetching messages: {exc}")
-        continue
+# Every accepted command is logged in SQLite before it is queued, so a restart resumes or reports it
+job_store.configure(os.environ.get("JOBS_FILE", job_store.path))
+job_store.prune(float(os.environ.get("JOBS_KEEP_DAYS", 7)))
+atexit.register(job_store.close)
 
-    if r.status_code != 200:
-        raise Exception(
-            "Incorrect reply from Webex Teams API. Status code: {}".format(r.status_code)
-        )
+# Sessions each router accepts at once over every backend, and the breaker that stops
+# waiting on a router after GOVERNOR_FAILURE_THRESHOLD connection failures in a row
+governor.configure(
+    max_sessions=int(os.environ.get("GOVERNOR_MAX_SESSIONS", governor.max_sessions)),
+    failure_threshold=int(os.environ.get("GOVERNOR_FAILURE_THRESHOLD", governor.failure_threshold)),
+    probe_interval=float(os.environ.get("GOVERNOR_PROBE_INTERVAL", governor.probe_interval)),
+)
 
-    json_data = r.json()
+# RESTCONF keep-alive pool size and (connect, read) timeouts per router
+restconf_final.configure(
+    pool_maxsize=int(os.environ.get("RESTCONF_POOL_SIZE", restconf_final.POOL_MAXSIZE)),
+    timeout=float(os.environ["RESTCONF_TIMEOUT"]) if "RESTCONF_TIMEOUT" in os.environ else None,
+)
 
-    if not json_data.get("items"):
-        print("There are no messages in the room yet.")
-        continue
+# How long cached Loopback existence/status answers stay valid
+interface_cache.ttl = float(os.environ.get("INTERFACE_CACHE_TTL", interface_cache.ttl))
 
-    message_info = json_data["items"][0]
-    message_id = message_info.get("id")
-    if message_id == last_message_id:
-        continue  # ignore duplicate polling of the same message
-    last_message_id = message_id
+# Interface tables collected in the background (INTERFACE_STATE_INTERVAL=0 collects on demand only)
+# with one batched request per router; gigabit_status and status answer from a table younger than
+# INTERFACE_STATE_MAX_AGE. INTERFACE_STATE_SOURCE picks netmiko (show ip int brief, the default),
+# restconf or netconf; status uses the table only when the room's method collected it.
+INTERFACE_STATE_SOURCES = {"restconf": restconf_final, "netconf": netconf_final, "netmiko": netmiko_final}
+INTERFACE_STATE_SOURCE = os.environ.get("INTERFACE_STATE_SOURCE", "netmiko").lower()
+interface_state.configure(
+    INTERFACE_STATE_SOURCES[INTERFACE_STATE_SOURCE].get_interfaces,
+    source=INTERFACE_STATE_SOURCE.capitalize(),
+    interval=float(os.environ.get("INTERFACE_STATE_INTERVAL", interface_state.interval)),
+    max_age=float(os.environ.get("INTERFACE_STATE_MAX_AGE", interface_state.max_age)),
+)
+interface_state.start(lambda: inventory.current().ips())
+atexit.register(interface_state.stop)
 
-    message = message_info.get("text", "")
-    print("Received message: " + message)
+# Parallelism for "showrun all", and Ansible runs in flight at once (one worker process each)
+SHOWRUN_FORKS = int(os.environ.get("SHOWRUN_FORKS", len(ROUTER_IPS)))
+ansible_final.configure(workers=int(os.environ.get("ANSIBLE_WORKERS", ansible_final.WORKERS)))
 
-## 4. Provide the URL to the Webex Teams messages API, and extract location from the received message.
+# Opt-in adaptive Netmiko reads on the cached SSH sessions
+netmiko_final.configure(fast_cli=os.environ.get("NETMIKO_FAST_CLI", "").lower() in ("1", "true", "yes"))
 
-    normalized = message.strip()
-    parts = normalized.split()
-    if len(parts) < 2 or parts[0] != f"/{STUDENT_ID}": # check if the message starts with my student ID
-        continue
+# One keep-alive session for every Webex call; replies are posted by a background outbox
+# that merges replies still waiting for the same room into one message under load
+webex = WebexClient(ACCESS_TOKEN, WEBEX_API_URL, max_attempts=int(os.environ.get("WEBEX_MAX_ATTEMPTS", 5)))
+outbox = Outbox(webex, coalesce=os.environ.get("WEBEX_COALESCE", "1").lower() in ("1", "true", "yes"))
+outbox.start()
+atexit.register(outbox.close)
 
-    # Parse command structure: /{STUDENT_ID} [method/IP/command] [IP/command] [command]
-    
-    command = None
-    ip = None
-    responseMessage = None
-    motd_message = None  # For MOTD command with message
-    
-    # Check if parts[1] is a method declaration
-    if parts[1].lower() in ("restconf", "netconf"):
-        if parts[1].lower() == "restconf":
-            method_specified = "restconf"
-            responseMessage = "Ok: Restconf"
-        else:
-            method_specified = "netconf"
-            responseMessage = "Ok: Netconf"
-        
-        # If only method is specified, send response and continue
-        if len(parts) == 2:
-            pass  # Will send responseMessage below
-        else:
-            # More parts after method, continue parsing
-            if len(parts) >= 3:
-                # Check if parts[2] is IP
-                if parts[2] in ROUTER_IPS:
-                    ip = parts[2]
-                    if len(parts) >= 4:
-                        command = parts[3].lower()
-                        # Check if it's MOTD with message
-                        if command == "motd" and len(parts) >= 5:
-                            motd_message = " ".join(parts[4:])
-                    else:
-                        responseMessage = "Error: No command found."
-                else:
-                    # parts[2] might be a command without IP
-                    command = parts[2].lower()
-                    ip = None
-            else:
-                responseMessage = None
-    else:
-        # No method in parts[1], check if it's IP or command
-        # Check if parts[1] looks like an IP address (contains dots)
-        if "." in parts[1]:
-            ip = parts[1]
-            if len(parts) >= 3:
-                command = parts[2].lower()
-                # Check if it's MOTD with message
-                if command == "motd" and len(parts) >= 4:
-                    motd_message = " ".join(parts[3:])
-            else:
-                responseMessage = "Error: No command found."
-        else:
-            # parts[1] is likely a command
-            command = parts[1].lower()
-            ip = None
-    
-    print(f"Method: {method_specified}, IP: {ip}, Command: {command}, MOTD: {motd_message}")
+# Latency metrics: Prometheus text on http://127.0.0.1:METRICS_PORT/metrics, and/or a JSON file
+if os.environ.get("METRICS_PORT"):
+    metrics_server = MetricsServer(int(os.environ["METRICS_PORT"]))
+    metrics_server.start()
+    print(f"Serving metrics on port {metrics_server.port}")
+if os.environ.get("METRICS_JSON"):
+    start_json_dump(os.environ["METRICS_JSON"], float(os.environ.get("METRICS_JSON_INTERVAL", 60)))
 
 #######################################################################################
 # 5. Complete the logic for each command
-    attachment_path = None
-    if responseMessage is None:
-        responseMessage = None
-
-        
-        # Check if method is specified for commands that need it
-        if command and command in VALID_COMMANDS:
-            # MOTD command doesn't require method
-            if command == "motd":
-                if not ip:
-                    responseMessage = "Error: No IP specified"
-                elif ip not in ROUTER_IPS:
-                    responseMessage = "Error: No MOTD Configured"
-                elif motd_message:
-                    # Set MOTD using Ansible
-                    try:
-                        response = ansible_final.set_motd(ip, motd_message)
-                        responseMessage = response.get("msg", "Error: Ansible")
-                    except Exception as exc:
-                        print(f"Error setting MOTD: {exc}")
-                        responseMessage = "Error: Ansible"
-                else:
-                    # Get MOTD using Netmiko
-                    try:
-                        responseMessage = netmiko_final.get_motd(ip)
-                    except Exception as exc:
-                        print(f"Error getting MOTD: {exc}")
-                        responseMessage = "Error: No MOTD Configured"
-            # gigabit_status and showrun also don't require method
-            elif command == "gigabit_status":
-                try:
-                    responseMessage = netmiko_final.gigabit_status(ip)
-                except Exception as exc:
-                    print(f"Error running gigabit_status: {exc}")
-                    responseMessage = "Error: Netmiko"
-            elif command == "showrun":
-                if not ip:
-                    responseMessage = "Error: No IP specified"
-                elif ip not in ROUTER_IPS:
-                    responseMessage = "Error: No IP specified"
-                else:
-                    try:
-                        response = ansible_final.showrun(ip)
-                        responseMessage = response.get("msg", "Error: Ansible")
-                        if response.get("status") == "OK":
-                            attachment_path = response.get("path")
-                        print(responseMessage)
-                    except Exception as exc:
-                        print(f"Error running showrun: {exc}")
-                        responseMessage = "Error: Ansible"
-            # Other commands require method
-            elif not method_specified:
-                responseMessage = "Error: No method specified"
-            elif not ip:
-                responseMessage = "Error: No IP specified"
-            elif ip not in ROUTER_IPS:
-                responseMessage = "Error: No IP specified"
-            elif command == "create":
-                if method_specified == "restconf":
-                    responseMessage = restconf_final.create(ip, method_specified.capitalize())
-                elif method_specified == "netconf":
-                    responseMessage = netconf_final.create(ip, method_specified.capitalize())
-            elif command == "delete":
-                if method_specified == "restconf":
-                    responseMessage = restconf_final.delete(ip, method_specified.capitalize())
-                elif method_specified == "netconf":
-                    responseMessage = netconf_final.delete(ip, method_specified.capitalize())
-            elif command == "enable":
-                if method_specified == "restconf":
-                    responseMessage = restconf_final.enable(ip, method_specified.capitalize())
-                elif method_specified == "netconf":
-                    responseMessage = netconf_final.enable(ip, method_specified.capitalize())
-            elif command == "disable":
-                if method_specified == "restconf":
-                    responseMessage = restconf_final.disable(ip, method_specified.capitalize())
-                elif method_specified == "netconf":
-                    responseMessage = netconf_final.disable(ip, method_specified.capitalize())
-            elif command == "status":
-                if method_specified == "restconf":
-                    responseMessage = restconf_final.status(ip, method_specified.capitalize())
-                elif method_specified == "netconf":
-                    responseMessage = netconf_final.status(ip, method_specified.capitalize())
-        elif command:
-            responseMessage = "Error: No command found."
-
-    if not responseMessage:
-        continue
+
+registry = CommandRegistry(f"/{STUDENT_ID}", ROUTER_IPS)
+# Rooms without their own router list follow the inventory as it changes
+inventory.subscribe(lambda old, new: registry.set_routers(new.ips()))
+
+# Loopback commands run through the backend the room selected with "restconf"/"netconf"
+registry.add_backend("restconf", restconf_final)
+registry.add_backend("netconf", netconf_final)
+for name in ("create", "delete", "enable", "disable", "status"):
+    registry.method_command(name)
+
+
+@registry.command("motd", fanout=True, takes_text=True, unknown_router="Error: No MOTD Configured")
+def motd(ip, method, motd_message, room):
+    """Set the MOTD with Ansible when a message is given, else read it with Netmiko"""
+    if motd_message:
+        try:
+            response = ansible_final.set_motd(ip, motd_message)
+            return response.get("msg", "Error: Ansible")
+        except Exception as exc:
+            print(f"Error setting MOTD: {exc}")
+            return "Error: Ansible"
+    try:
+        return netmiko_final.get_motd(ip)
+    except Exception as exc:
+        print(f"Error getting MOTD: {exc}")
+        return "Error: No MOTD Configured"
+
+
+@registry.command("gigabit_status", needs_ip=False, fanout=True, takes_text=True)
+def gigabit_status(ip, method, text, room):
+    """Interface summary from memory; "gigabit_status refresh" reads the router now"""
+    try:
+        return netmiko_final.gigabit_status(ip, refresh=(text or "").lower() == "refresh")
+    except Exception as exc:
+        print(f"Error running gigabit_status: {exc}")
+        return "Error: Netmiko"
+
+
+@registry.command("showrun", allow_all=True, subcommands={"diff": "showrun_diff"})
+def showrun(ip, method, text, room):
+    if ip == "all":
+        return showrun_all(room)
+    try:
+        response = ansible_final.showrun(ip, room.student_id)
+        responseMessage = response.get("msg", "Error: Ansible")
+        print(responseMessage)
+        if response.get("status") == "OK":
+            return responseMessage, showrun_attachment(response)
+        return responseMessage
+    except Exception as exc:
+        print(f"Error running showrun: {exc}")
+        return "Error: Ansible"
+
+
+@registry.command("showrun_diff")
+def showrun_diff(ip, method, text, room):
+    """Post only the lines that changed since the previous backup, no attachment"""
+    try:
+        return ansible_final.showrun_diff(ip, room.student_id).get("msg", "Error: Ansible")
+    except Exception as exc:
+        print(f"Error running showrun diff: {exc}")
+        return "Error: Ansible"
+
 
 #######################################################################################
 # 6. Complete the code to post the message to the Webex Teams room.
 
-    if attachment_path and not MultipartEncoder:
-        responseMessage = "Error: Ansible"
-        attachment_path = None
+def post_message(room_id, responseMessage, attachment=None, on_sent=None):
+    """Post a reply to a Webex Teams room; replies with a file go to the background uploader
 
-    file_handle = None
-    if attachment_path and MultipartEncoder:
-        file_path = Path(attachment_path)
-        try:
-            file_handle = file_path.open("rb")
-        except OSError as exc:
-            print(f"Error opening attachment: {exc}")
-            responseMessage = "Error: Ansible"
-            payload = json.dumps({"roomId": roomIdToGetMessages, "text": responseMessage})
-            HTTPHeaders = {
-                "Authorization": f"Bearer {ACCESS_TOKEN}",
-                "Content-Type": "application/json",
-            }
-        else:
-            encoder = MultipartEncoder(
-                fields={
-                    "roomId": roomIdToGetMessages,
-                    "text": responseMessage,
-                    "files": (file_path.name, file_handle, "text/plain"),
-                }
-            )
-            payload = encoder
-            HTTPHeaders = {
-                "Authorization": f"Bearer {ACCESS_TOKEN}",
-                "Content-Type": encoder.content_type,
-            }
+    on_sent() runs once Webex has accepted the reply, and never for a reply that was dropped.
+    """
+    if attachment:
+        uploader.submit(room_id, responseMessage, attachment, on_sent)
+        return
+    outbox.send(room_id, responseMessage, on_sent)
+
+
+def post_attachment(room_id, text, filename, data, content_type):
+    """Uploader callback: one multipart POST of a reply and its file, streamed from memory"""
+    return webex.post_file(room_id, text, filename, data, content_type, timeout=upload_timeout(len(data)))
+
+
+def on_upload_failure(room_id, text, attachment, error, on_sent=None):
+    """Still answer the command when its file could not be delivered"""
+    if isinstance(error, OSError):
+        post_message(room_id, "Error: Ansible", on_sent=on_sent)
     else:
-        postData = {"roomId": roomIdToGetMessages, "text": responseMessage}
-        payload = json.dumps(postData)
-        HTTPHeaders = {
-            "Authorization": f"Bearer {ACCESS_TOKEN}",
-            "Content-Type": "application/json",
-        }
+        post_message(room_id, f"{text} (Error: attachment upload failed)", on_sent=on_sent)
+
+
+def showrun_attachment(response):
+    """Attachment for a showrun result: the collected text, else the saved file"""
+    path = response.get("path")
+    return Attachment(Path(path).name, response.get("content"), path)
+
+
+# Backups are posted off the worker threads so a slow upload never holds a router's queue
+uploader = AttachmentUploader(
+    post_attachment,
+    on_failure=on_upload_failure,
+    workers=int(os.environ.get("UPLOAD_WORKERS", 2)),
+    gzip_threshold=int(os.environ.get("ATTACHMENT_GZIP_THRESHOLD", GZIP_THRESHOLD)),
+)
+atexit.register(uploader.shutdown)
+metrics.register_stats("ipa_uploader", uploader.stats)
+
+
+def showrun_all(room):
+    """Back up every router of the room in parallel, posting each file as soon as it is ready"""
+    def on_result(router_name, response):
+        if response.get("status") == "OK":
+            post_message(room.room_id, f"{response['msg']} ({router_name})", showrun_attachment(response))
 
     try:
-        r = requests.post(
-            WEBEX_MESSAGES_URL,
-            data=payload,
-            headers=HTTPHeaders,
-            timeout=10,
+        summary = ansible_final.showrun_all(
+            on_result=on_result, forks=SHOWRUN_FORKS, router_ips=room.registry.routers, student_id=room.student_id,
         )
+    except Exception as exc:
+        print(f"Error running showrun all: {exc}")
+        return "Error: Ansible"
+    if not summary:
+        return "Error: Ansible"
+
+    ok = sum(1 for response in summary.values() if response.get("status") == "OK")
+    lines = [
+        f"{router_name}: {'OK' if response.get('status') == 'OK' else 'FAIL'}"
+        for router_name, response in sorted(summary.items())
+    ]
+    return f"showrun all: {ok}/{len(summary)} OK\n" + "\n".join(lines)
+
+
+def run_command(room, job_id, command, ip, method, motd_message, label=""):
+    """Worker job: execute a command and post its reply as soon as it finishes"""
+    try:
+        if not job_store.start(job_id):
+            return  # already run before a restart
+        # The job counts as replied only once Webex took the reply; otherwise a restart reports it
+        on_sent = functools.partial(job_store.replied, job_id)
+        try:
+            with metrics.timer("ipa_command_seconds", command=command, router=ip or "none"):
+                responseMessage, attachment = room.registry.execute(command, ip, method, motd_message, room)
+        except Exception:
+            responseMessage = "Error: " + command
+            job_store.finish(job_id, responseMessage)
+            post_message(room.room_id, label + responseMessage, on_sent=on_sent)
+            raise
+        job_store.finish(job_id, responseMessage)
+        if responseMessage:
+            post_message(room.room_id, label + responseMessage, attachment, on_sent)
+        else:
+            job_store.replied(job_id)
     finally:
-        if file_handle:
-            file_handle.close()
+        room.release()
 
-    if r.status_code != 200:
-        raise Exception(
-            "Incorrect reply from Webex Teams API. Status code: {}".format(r.status_code)
-        )
+
+def run_fanout_job(room, fan, sent, job_id, command, ip, method, motd_message):
+    """Worker job: run one router's share of a fan-out command"""
+    responseMessage = None
+    try:
+        if not job_store.start(job_id):
+            responseMessage = "Error: Already handled"
+        else:
+            with metrics.timer("ipa_command_seconds", command=command, router=ip):
+                responseMessage, _ = room.registry.execute(command, ip, method, motd_message, room)
+    except Exception as exc:
+        print(f"Error running {command} on {ip}: {exc}")
+        responseMessage = "Error: " + command
+    finally:
+        room.release()
+    job_store.finish(job_id, responseMessage)
+    fan.record(ip, responseMessage or "Error: No command found.")
+    if fan.done and sent.is_set():
+        # Reported with the others, or as timed out if it came too late
+        job_store.replied(job_id)
+
+
+def submit_job(room, key, func, *args):
+    """Queue a worker job charged to the room's share of the pool"""
+    room.acquire()
+    try:
+        dispatcher.submit(key, func, room, *args)
+    except QueueFullError:
+        room.release()
+        raise
+
+
+def start_fanout(room, job_ids, command, router_ips, method, motd_message):
+    """Run a command on several routers at once and post one combined reply"""
+    sent = threading.Event()
+
+    def on_sent():
+        # Jobs finishing after this see sent set and mark themselves
+        sent.set()
+        job_store.replied(*job_ids.values())
+
+    def on_complete(results):
+        post_message(room.room_id, "\n".join(f"{ip}: {results[ip]}" for ip in router_ips), on_sent=on_sent)
+
+    fan = FanOut(router_ips, on_complete, timeout=FANOUT_TIMEOUT)
+    fan.start()
+    # Each router's job goes through its own queue, so it still runs in order with
+    # other commands for that router while different routers run in parallel.
+    for ip in router_ips:
+        try:
+            submit_job(room, ip, run_fanout_job, fan, sent, job_ids[ip], command, ip, method, motd_message)
+        except (QueueFullError, RoomBusyError) as exc:
+            print(exc)
+            job_store.reject([job_ids[ip]], BUSY_REPLY)
+            fan.record(ip, BUSY_REPLY)
+
+
+#######################################################################################
+# 4. Provide the URL to the Webex Teams messages API, and extract location from the received message.
+
+def handle_message(room, message_info):
+    """Parse one Webex message and hand the command it contains to the worker pool"""
+    message = message_info.get("text", "")
+    print("Received message: " + message)
+
+    # /{STUDENT_ID} [method] [IP/all/IP list] command [args]
+    request = room.registry.parse(message)
+    if request is None:
+        return
+    if request.method:
+        room.method = request.method
+
+    print(f"Method: {room.method}, IP: {request.target}, Command: {request.command}, MOTD: {request.text}")
+
+    if request.reply:
+        post_message(room.room_id, request.reply)
+        return
+    if not request.command:
+        return
+
+    command = room.registry.get(request.command)
+    targets = room.registry.targets(request.target)
+    fanout = bool(targets and command and command.fanout)
+    # Logged before it is queued; a message seen before (webhook and poll, or after a restart) is not run again
+    job_ids = job_store.add(
+        room.room_id, message_info.get("id", ""), request.command, targets if fanout else [request.target],
+        room.method, request.text, fanout,
+    )
+    if job_ids is None:
+        print(f"Message {message_info.get('id')} was already handled")
+        return
+    if fanout:
+        start_fanout(room, job_ids, request.command, targets, room.method, request.text)
+        return
+
+    # Hand the command to the worker pool; the reply is posted when the job finishes.
+    job_id = job_ids[request.target]
+    try:
+        submit_job(room, request.target, run_command, job_id, request.command, request.target, room.method, request.text)
+    except (QueueFullError, RoomBusyError) as exc:
+        print(exc)
+        job_store.reject([job_id], BUSY_REPLY)
+        post_message(room.room_id, BUSY_REPLY)
+
+
+def recover_jobs():
+    """Report or resume the commands a previous run accepted but did not finish, once each"""
+    queued, unreported = job_store.recover()
+    for job in unreported:
+        room = rooms.get(job.room_id)
+        if room is not None:
+            label = f"{job.target}: " if job.fanout else ""
+            if job.state == DONE:
+                reply = job.result
+            else:
+                # It may or may not have reached the router, so it is reported rather than run again
+                where = f" on {job.target}" if job.target and not job.fanout else ""
+                reply = f"Error: {job.command}{where} was interrupted by a restart, its result is unknown"
+            if reply:
+                post_message(room.room_id, label + reply, on_sent=functools.partial(job_store.replied, job.id))
+                continue
+        job_store.replied(job.id)
+    for job in queued:
+        room = rooms.get(job.room_id)
+        if room is None:
+            job_store.reject([job.id], "Error: Room no longer served")
+            continue
+        target = job.target or None
+        try:
+            submit_job(room, target, run_command, job.id, job.command, target, job.method, job.text,
+                       f"{job.target}: " if job.fanout else "")
+        except (QueueFullError, RoomBusyError) as exc:
+            print(exc)
+            job_store.reject([job.id], BUSY_REPLY)
+            post_message(room.room_id, BUSY_REPLY)
+    if queued or unreported:
+        print(f"Recovered jobs: {len(queued)} resumed, {len(unreported)} reported")
+
+
+def _webex_get(path, params=None):
+    """GET a Webex API resource and return the decoded JSON, or None if there is nothing to read"""
+    try:
+        return webex.get_json(path, params)
+    except WebexError as exc:
+        print(f"Error fetching messages: {exc}")
+        return None
+
+
+def fetch_message_page(room_id, params):
+    """Polling: return one page of room messages, newest first, or None on error"""
+    getParameters = {"roomId": room_id, **params}
+    json_data = _webex_get("messages", getParameters)
+    if json_data is None:
+        return None
+    return json_data.get("items", [])
+
+
+def fetch_message(message_id):
+    """Webhook: fetch the message a message-created event refers to"""
+    return _webex_get(f"messages/{message_id}")
+
+
+#######################################################################################
+# 7. Receive messages: webhook events when WEBHOOK_PORT is set, polling otherwise.
+
+inbound_message_ids = queue.Queue()  # filled by the webhook receiver
+
+WEBHOOK_PORT = os.environ.get("WEBHOOK_PORT")
+if WEBHOOK_PORT:
+    webhook_server = webex_webhook.WebhookServer(
+        int(WEBHOOK_PORT),
+        lambda data: inbound_message_ids.put(data.get("id")),
+        secret=os.environ.get("WEBHOOK_SECRET"),
+        room_ids=[config["room_id"] for config in ROOM_CONFIGS],
+    )
+    webhook_server.start()
+    print(f"Listening for Webex webhooks on port {webhook_server.port}")
+    if os.environ.get("WEBHOOK_URL"):
+        for config in ROOM_CONFIGS:
+            webex_webhook.register_webhook(
+                webex,
+                os.environ["WEBHOOK_URL"],
+                config["room_id"],
+                secret=os.environ.get("WEBHOOK_SECRET"),
+            )
+    # Keep polling, slowly, in case an event is lost on the way
+    min_poll = max_poll = float(os.environ.get("WEBHOOK_FALLBACK_POLL", 30))
+else:
+    # Poll fast right after activity, back off while a room is idle
+    min_poll = float(os.environ.get("POLL_MIN_INTERVAL", 1))
+    max_poll = float(os.environ.get("POLL_MAX_INTERVAL", 10))
+
+# One cursor per room; with a single room it is CURSOR_FILE itself
+rooms = RoomSet.build(
+    ROOM_CONFIGS,
+    registry,
+    fetch_message_page,
+    os.environ.get("CURSOR_FILE", "webex_cursor.json"),
+    ROOM_MAX_PENDING,
+    min_interval=min_poll,
+    max_interval=max_poll,
+)
+recover_jobs()
+
+while 1:
+    try:
+        message_id = inbound_message_ids.get(timeout=rooms.next_poll_in())
+    except queue.Empty:
+        # Handle each due room's backlog in order, rooms taking turns; cursors move after each message
+        for room, message_info in rooms.poll_due():
+            handle_message(room, message_info)
+            room.poller.mark_done(message_info)
+        continue
+
+    message_info = fetch_message(message_id)
+    room = rooms.get(message_info.get("roomId")) if message_info else None
+    if room is None or room.poller.seen(message_info.get("id")):
+        continue  # already handled through polling
+    handle_message(room, message_info)
+    room.poller.mark_done(message_info, advance=False)
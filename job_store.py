@@ -0,0 +1,162 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+JOBS_FILE = Path("jobs.sqlite3")
+KEEP_DAYS = 7  # finished jobs older than this are pruned at startup
+
+# queued -> running -> done -> replied; running jobs found at startup become interrupted -> replied
+QUEUED, RUNNING, DONE, INTERRUPTED, REPLIED = "queued", "running", "done", "interrupted", "replied"
+
+Job = namedtuple("Job", "id room_id message_id command target method text fanout state result")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    room_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    command TEXT NOT NULL,
+    target TEXT NOT NULL DEFAULT '',
+    method TEXT,
+    text TEXT,
+    fanout INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    result TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    UNIQUE (message_id, target)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+_COLUMNS = "id, room_id, message_id, command, target, method, text, fanout, state, result"
+
+
+class JobStore:
+    """Crash-safe log of the commands the bot accepted, in SQLite
+
+    Every router job is written before it is queued and moves through
+    queued -> running -> done -> replied, each step committed before the
+    bot acts on it. A chat message is recorded once per target, so a message
+    seen again (webhook and poll, or a replayed cursor after a restart) is
+    not run twice. After a crash, recover() returns the jobs that never
+    started, which can simply be queued again, and the jobs whose reply was
+    never posted; jobs that were running are marked interrupted and reported
+    instead of re-run, because the change may or may not have reached the
+    router.
+    """
+
+    def __init__(self, path=JOBS_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._db = None
+
+    def configure(self, path=None):
+        if path is not None:
+            self.close()
+            self.path = Path(path)
+
+    def _connection(self):
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            # WAL keeps commits cheap; NORMAL still survives a crash of the bot process
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params)
+
+    def add(self, room_id, message_id, command, targets, method=None, text=None, fanout=False):
+        """Record a message's job for each target; return {target: job_id}, or None if already recorded"""
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                job_ids = {}
+                for target in targets:
+                    cursor = db.execute(
+                        "INSERT OR IGNORE INTO jobs (room_id, message_id, command, target, method, text, fanout,"
+                        " state, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (room_id, message_id, command, target or "", method, text, int(fanout), QUEUED, now, now),
+                    )
+                    if not cursor.rowcount:
+                        db.execute("ROLLBACK")
+                        return None
+                    job_ids[target] = cursor.lastrowid
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return job_ids
+
+    def _move(self, job_ids, state, result=None, only_from=None):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return 0
+        marks = ",".join("?" * len(job_ids))
+        sql = f"UPDATE jobs SET state = ?, result = COALESCE(?, result), updated = ? WHERE id IN ({marks})"
+        params = [state, result, time.time(), *job_ids]
+        if only_from:
+            sql += f" AND state IN ({','.join('?' * len(only_from))})"
+            params += list(only_from)
+        return self._execute(sql, params).rowcount
+
+    def start(self, job_id):
+        """Mark a job running; False if it already ran or was reported"""
+        return self._move([job_id], RUNNING, only_from=(QUEUED,)) == 1
+
+    def finish(self, job_id, result):
+        self._move([job_id], DONE, result or "", only_from=(RUNNING,))
+
+    def reject(self, job_ids, result):
+        """Close queued jobs that were refused (e.g. a full queue) and already answered"""
+        self._move(job_ids, REPLIED, result, only_from=(QUEUED,))
+
+    def replied(self, *job_ids):
+        """Mark jobs whose reply Webex has accepted"""
+        self._move(job_ids, REPLIED, only_from=(DONE, INTERRUPTED))
+
+    def get(self, job_id):
+        row = self._execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(*row) if row else None
+
+    def _select(self, state):
+        rows = self._execute(f"SELECT {_COLUMNS} FROM jobs WHERE state = ? ORDER BY id", (state,)).fetchall()
+        return [Job(*row) for row in rows]
+
+    def recover(self):
+        """Return (queued, unreported) jobs left by the previous run, oldest first
+
+        queued jobs never started and can be run again. unreported jobs
+        finished (done) or were cut off while running (now interrupted)
+        without their reply being posted.
+        """
+        self._execute(
+            "UPDATE jobs SET state = ?, updated = ? WHERE state = ?", (INTERRUPTED, time.time(), RUNNING)
+        )
+        queued = self._select(QUEUED)
+        unreported = sorted(self._select(DONE) + self._select(INTERRUPTED), key=lambda job: job.id)
+        return queued, unreported
+
+    def prune(self, keep_days=KEEP_DAYS):
+        """Delete replied jobs older than keep_days; return how many went"""
+        cutoff = time.time() - keep_days * 86400
+        return self._execute("DELETE FROM jobs WHERE state = ? AND updated < ?", (REPLIED, cutoff)).rowcount
+
+    def counts(self):
+        return dict(self._execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+job_store = JobStore()
@@ -0,0 +1,235 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW = 1024  # most recent samples per series used for the percentiles
+
+HELP = {
+    "ipa_webex_request_seconds": "Webex API calls by operation (get, post)",
+    "ipa_command_seconds": "Bot commands from dispatch to reply, by command and router",
+    "ipa_device_seconds": "Device calls by backend, phase (setup, connect, rpc, parse, close) and router",
+    "ipa_netconf_pool": "Pooled NETCONF sessions: handshakes made and saved by reuse",
+    "ipa_netmiko_cache": "Cached SSH sessions: logins made, logins saved by reuse and sessions held",
+    "ipa_uploader": "Background file uploads: posted, failed, retried and bytes saved by gzip",
+    "ipa_interface_cache": "Loopback existence/status cache: hits, misses and entries",
+    "ipa_interface_state": "Background interface tables: routers held, answers from memory, collections and errors",
+    "ipa_governor_breaker": "Circuit breaker per router and port: open, half-open and consecutive failures",
+    "ipa_governor_sessions": "Device sessions the bot holds open per router, idle pooled ones included",
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class _Series:
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        # Nearest-rank percentile over the recent window
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class Metrics:
+    """Thread-safe registry of latency timers
+
+    Each (name, labels) pair keeps a running count and sum plus a window of
+    recent samples for p50/p95/p99. Components can also register a stats()
+    callable whose counters are read at export time. The registry is exported
+    as a Prometheus summary (counters as gauges) by MetricsServer and as JSON
+    by dump_json().
+    """
+
+    def __init__(self, window=WINDOW):
+        self._window = window
+        self._lock = threading.Lock()
+        self._series = {}  # name -> {sorted label tuple: _Series}
+        self._stats = {}  # name -> (callable returning {counter: number}, label or None)
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(name, {}).get(key)
+            if series is None:
+                series = self._series[name][key] = _Series(self._window)
+            series.count += 1
+            series.total += seconds
+            series.samples.append(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the with-block, including blocks that raise"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def register_stats(self, name, collect, label=None):
+        """Export collect() -> {counter: number} as the gauges name_<counter>
+
+        With label, collect() returns {value: {counter: number}} and each value
+        becomes that label on the gauges (e.g. one set per router).
+        """
+        with self._lock:
+            self._stats[name] = (collect, label)
+
+    def stats(self):
+        """Return {name: {counter: number}} (labelled: {name: {value: {counter: number}}}) from every stats callable"""
+        with self._lock:
+            collectors = sorted(self._stats.items())
+        result = {}
+        for name, (collect, _) in collectors:
+            try:
+                result[name] = dict(collect())
+            except Exception as exc:
+                print(f"Error reading {name} stats: {exc}")
+        return result
+
+    def export(self):
+        """The JSON document served on /metrics.json and written by dump_json()"""
+        return {"time": time.time(), "metrics": self.snapshot(), "stats": self.stats()}
+
+    def snapshot(self):
+        """Return {name: [{"labels", "count", "sum", "p50", "p95", "p99"}, ...]}"""
+        with self._lock:
+            result = {}
+            for name, by_labels in sorted(self._series.items()):
+                rows = []
+                for key, series in sorted(by_labels.items()):
+                    row = {"labels": dict(key), "count": series.count, "sum": series.total}
+                    for q, value in series.quantiles().items():
+                        row[f"p{int(q * 100)}"] = value
+                    rows.append(row)
+                result[name] = rows
+            return result
+
+    def render_prometheus(self):
+        """Render every series in the Prometheus text exposition format"""
+        lines = []
+        for name, rows in self.snapshot().items():
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} summary")
+            for row in rows:
+                labels = sorted(row["labels"].items())
+                for q in QUANTILES:
+                    value = row[f"p{int(q * 100)}"]
+                    lines.append(f"{name}{_format_labels(labels + [('quantile', q)])} {value:.6f}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {row['sum']:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {row['count']}")
+        with self._lock:
+            labels = {name: label for name, (_, label) in self._stats.items()}
+        for name, counters in self.stats().items():
+            label = labels.get(name)
+            if label is None:
+                rows = {(): counters}
+            else:
+                rows = {((label, value),): row for value, row in sorted(counters.items())}
+            gauges = {}
+            for row_labels, row in rows.items():
+                for counter, value in row.items():
+                    gauges.setdefault(counter, []).append(f"{name}_{counter}{_format_labels(row_labels)} {value}")
+            for counter, samples in sorted(gauges.items()):
+                lines.append(f"# HELP {name}_{counter} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name}_{counter} gauge")
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path):
+        """Write snapshot() to path atomically"""
+        path = os.path.abspath(path)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path), dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w") as tmp:
+                json.dump(self.export(), tmp, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            print(f"Error writing metrics: {exc}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+metrics = Metrics()
+
+
+class MetricsServer:
+    """Serve /metrics (Prometheus text) and /metrics.json (same document as dump_json) on a local port"""
+
+    def __init__(self, port, registry=metrics, host="127.0.0.1"):
+        self._registry = registry
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = server._registry.render_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(server._registry.export()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def start_json_dump(path, interval=60, registry=metrics):
+    """Rewrite path with a JSON snapshot every interval seconds and once more at exit"""
+    def dump_forever():
+        while True:
+            time.sleep(interval)
+            registry.dump_json(path)
+
+    threading.Thread(target=dump_forever, name="metrics-json", daemon=True).start()
+    atexit.register(registry.dump_json, path)
@@ -0,0 +1,52 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import netconf_final
+
+# ncclient is blocking, so NETCONF calls run on a dedicated thread pool that also
+# bounds how many device operations are in flight. The pooled sessions from
+# netconf_final are reused, and replies are the same strings it returns.
+MAX_CONCURRENCY = 16
+
+_executor = None
+
+
+def configure(max_concurrency):
+    """Change the number of NETCONF calls allowed in flight at once"""
+    global MAX_CONCURRENCY, _executor
+    MAX_CONCURRENCY = max_concurrency
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="netconf-async")
+    return _executor
+
+
+async def _offload(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), func, *args)
+
+
+async def create(router_ip, method="Netconf", student_id=netconf_final.STUDENT_ID):
+    return await _offload(netconf_final.create, router_ip, method, student_id)
+
+
+async def delete(router_ip, method="Netconf", student_id=netconf_final.STUDENT_ID):
+    return await _offload(netconf_final.delete, router_ip, method, student_id)
+
+
+async def enable(router_ip, method="Netconf", student_id=netconf_final.STUDENT_ID):
+    return await _offload(netconf_final.enable, router_ip, method, student_id)
+
+
+async def disable(router_ip, method="Netconf", student_id=netconf_final.STUDENT_ID):
+    return await _offload(netconf_final.disable, router_ip, method, student_id)
+
+
+async def status(router_ip, method="Netconf", student_id=netconf_final.STUDENT_ID):
+    return await _offload(netconf_final.status, router_ip, method, student_id)
@@ -1,242 +1,483 @@
+import atexit
+import functools
+import threading
+import time
+from xml.sax.saxutils import escape
+
+from lxml import etree
 from ncclient import manager
-import xmltodict
+from ncclient.operations.rpc import RPCError
+from ncclient.transport.errors import AuthenticationError, TransportError
+
+from governor import governor
+from interface_cache import interface_cache
+from interface_state import InterfaceRecord, interface_state, invalidates
+from inventory import changed_devices, inventory
+from metrics import metrics
 
 STUDENT_ID = "66070014"
 INTERFACE_NAME = f"Loopback{STUDENT_ID}"
+NC_NS = "urn:ietf:params:xml:ns:netconf:base:1.0"
+IF_NS = "urn:ietf:params:xml:ns:yang:ietf-interfaces"
+
+PORT = 830  # NETCONF over SSH
+KEEPALIVE_INTERVAL = 30  # seconds between SSH keepalives on pooled sessions
+IDLE_TIMEOUT = 300  # close pooled sessions that have not been used for this long
+
+
+def _timed(phase, router_ip):
+    return metrics.timer("ipa_device_seconds", backend="netconf", phase=phase, router=router_ip)
 
 
 def _get_manager(router_ip):
-    """Create and return a NETCONF manager connection"""
-    return manager.connect(
-        host=router_ip,
-        port=830,
-        username="admin",
-        password="cisco",
-        hostkey_verify=False
-    )
+    """Create and return a NETCONF manager connection, holding a governor slot until _close"""
+    device = inventory.device(router_ip)
+    release = governor.take_slot(router_ip)
+    try:
+        with _timed("connect", router_ip):
+            m = manager.connect(
+                host=router_ip,
+                port=PORT,
+                username=device.username,
+                password=device.password,
+                hostkey_verify=False
+            )
+    except BaseException:
+        release()
+        raise
+    governor.hold(m, release)
+    # Keep the SSH transport alive while the session sits idle in the pool
+    transport = getattr(m._session, "_transport", None)
+    if transport is not None:
+        transport.set_keepalive(KEEPALIVE_INTERVAL)
+    return m
+
+
+def _close(m, router_ip):
+    with _timed("close", router_ip):
+        try:
+            m.close_session()
+        except Exception:
+            pass
+        finally:
+            governor.drop(m)
+
+
+class SessionPool:
+    """Per-router pool of long-lived NETCONF sessions
+
+    Sessions are handed out one caller at a time and returned to the pool
+    afterwards, so a warm session skips the SSH handshake and hello exchange.
+    Dead sessions are dropped on checkout, a session that breaks mid-RPC is
+    replaced once transparently, and a background thread closes sessions that
+    stayed idle for longer than idle_timeout. Every open session holds a
+    governor slot; reclaim() gives one up when another backend needs it.
+    """
+
+    def __init__(self, connect, idle_timeout=IDLE_TIMEOUT, reap_interval=KEEPALIVE_INTERVAL):
+        self._connect = connect
+        self._idle_timeout = idle_timeout
+        self._reap_interval = reap_interval
+        self._lock = threading.Lock()
+        self._idle = {}  # router_ip -> [(manager, last_used), ...]
+        self._reaper = None
+        self.handshakes = 0
+        self.handshakes_saved = 0
+
+    def _acquire(self, router_ip):
+        """Return (manager, reused) for router_ip, connecting if no warm session is left"""
+        with self._lock:
+            idle = self._idle.get(router_ip, [])
+            while idle:
+                m, _ = idle.pop()
+                if m.connected:
+                    self.handshakes_saved += 1
+                    return m, True
+                _close(m, router_ip)
+
+        m = self._connect(router_ip)
+        with self._lock:
+            self.handshakes += 1
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_forever, name="netconf-pool-reaper", daemon=True)
+                self._reaper.start()
+        return m, False
+
+    def _release(self, router_ip, m):
+        if not m.connected:
+            _close(m, router_ip)
+            return
+        with self._lock:
+            self._idle.setdefault(router_ip, []).append((m, time.monotonic()))
+
+    def run(self, router_ip, func):
+        """Call func(manager) on a pooled session and return its result"""
+        with governor.breaker(router_ip, PORT, failures=(TransportError, OSError), ignore=(AuthenticationError,)):
+            while True:
+                m, reused = self._acquire(router_ip)
+                try:
+                    with _timed("rpc", router_ip):
+                        result = func(m)
+                except TransportError:
+                    _close(m, router_ip)
+                    # A warm session may have been dropped by the router; retry once on a fresh one
+                    if reused:
+                        with self._lock:
+                            self.handshakes_saved -= 1
+                        continue
+                    raise
+                except Exception:
+                    self._release(router_ip, m)
+                    raise
+                self._release(router_ip, m)
+                return result
 
+    def _reap_forever(self):
+        while True:
+            time.sleep(self._reap_interval)
+            self.evict_idle()
 
-def _loopback_config_xml(enabled=True, operation="merge"):
-    """Generate NETCONF XML configuration for loopback interface"""
-    last_three = STUDENT_ID[-3:]
+    def evict_idle(self):
+        """Close sessions that are disconnected or idle for longer than idle_timeout"""
+        cutoff = time.monotonic() - self._idle_timeout
+        stale = []
+        with self._lock:
+            for router_ip, idle in self._idle.items():
+                keep = []
+                for m, last_used in idle:
+                    if last_used < cutoff or not m.connected:
+                        stale.append((router_ip, m))
+                    else:
+                        keep.append((m, last_used))
+                idle[:] = keep
+        for router_ip, m in stale:
+            _close(m, router_ip)
+
+    def reclaim(self, router_ip):
+        """Close the longest-idle session to router_ip; False if none is idle"""
+        with self._lock:
+            idle = self._idle.get(router_ip)
+            if not idle:
+                return False
+            m, _ = idle.pop(0)
+        _close(m, router_ip)
+        return True
+
+    def close_all(self):
+        with self._lock:
+            sessions = [(router_ip, m) for router_ip, idle in self._idle.items() for m, _ in idle]
+            self._idle.clear()
+        for router_ip, m in sessions:
+            _close(m, router_ip)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "handshakes": self.handshakes,
+                "handshakes_saved": self.handshakes_saved,
+                "idle_sessions": sum(len(idle) for idle in self._idle.values()),
+            }
+
+
+session_pool = SessionPool(_get_manager)
+atexit.register(session_pool.close_all)
+governor.add_reclaimer(session_pool.reclaim)
+metrics.register_stats("ipa_netconf_pool", session_pool.stats)
+
+
+def _on_inventory_change(old, new):
+    # Logins may have changed; pooled sessions are reopened on next use
+    if changed_devices(old, new):
+        session_pool.close_all()
+
+
+inventory.subscribe(_on_inventory_change)
+
+
+def _interface_name(student_id=STUDENT_ID):
+    """Loopback interface configured for student_id"""
+    return f"Loopback{student_id}"
+
+
+def _loopback_address(student_id=STUDENT_ID):
+    last_three = student_id[-3:]
     octet_x = int(last_three[0])
     octet_y = int(last_three[1:])
-    ipv4_address = f"172.{octet_x}.{octet_y}.1"
-    
-    enabled_str = "true" if enabled else "false"
-    operation_attr = f'operation="{operation}"' if operation else ""
-    
-    return f"""
-    <config>
-        <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-            <interface {operation_attr}>
-                <name>{INTERFACE_NAME}</name>
-                <description>Loopback interface for student id {STUDENT_ID}</description>
-                <type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">ianaift:softwareLoopback</type>
-                <enabled>{enabled_str}</enabled>
-                <ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip">
-                    <address>
-                        <ip>{ipv4_address}</ip>
-                        <netmask>255.255.255.0</netmask>
-                    </address>
-                </ipv4>
-            </interface>
-        </interfaces>
-    </config>
-    """
+    return f"172.{octet_x}.{octet_y}.1"
+
 
+# Payloads only depend on the interface, so each is built once and reused for every router
+@functools.lru_cache(maxsize=None)
+def _loopback_config_xml(student_id=STUDENT_ID, enabled=True, operation="merge"):
+    """Generate NETCONF XML configuration for a student's loopback interface"""
+    operation_attr = f' operation="{operation}"' if operation else ""
+    return (
+        f'<config><interfaces xmlns="{IF_NS}"><interface{operation_attr}>'
+        f"<name>{escape(_interface_name(student_id))}</name>"
+        f"<description>Loopback interface for student id {escape(student_id)}</description>"
+        '<type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">ianaift:softwareLoopback</type>'
+        f"<enabled>{'true' if enabled else 'false'}</enabled>"
+        '<ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip">'
+        f"<address><ip>{_loopback_address(student_id)}</ip><netmask>255.255.255.0</netmask></address>"
+        "</ipv4></interface></interfaces></config>"
+    )
 
-def netconf_edit_config(m, netconf_config):
-    """Execute NETCONF edit-config operation"""
-    return m.edit_config(target="running", config=netconf_config)
 
+@functools.lru_cache(maxsize=None)
+def _delete_config_xml(name=INTERFACE_NAME):
+    # operation="delete" makes the router refuse with data-missing if there is nothing to delete
+    return (
+        f'<config><interfaces xmlns="{IF_NS}"><interface operation="delete">'
+        f"<name>{escape(name)}</name></interface></interfaces></config>"
+    )
 
-def _interface_exists(router_ip):
-    """Check if loopback interface exists using NETCONF"""
-    netconf_filter = f"""
-    <filter>
-        <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-            <interface>
-                <name>{INTERFACE_NAME}</name>
-            </interface>
-        </interfaces>
-    </filter>
+
+@functools.lru_cache(maxsize=None)
+def _enabled_config_xml(name=INTERFACE_NAME, enabled=True):
+    # Sent with default-operation "none", so a missing interface is reported as data-missing instead of being created
+    return (
+        f'<config><interfaces xmlns="{IF_NS}"><interface><name>{escape(name)}</name>'
+        f"<enabled operation=\"merge\">{'true' if enabled else 'false'}</enabled>"
+        "</interface></interfaces></config>"
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _state_filter(names=None):
+    """Subtree filter selecting name and statuses of the named interfaces (a tuple), or of all of them"""
+    if names:
+        rows = "".join(
+            f"<interface><name>{escape(name)}</name><admin-status/><oper-status/></interface>" for name in names
+        )
+    else:
+        rows = "<interface><name/><admin-status/><oper-status/></interface>"
+    return f'<filter><interfaces-state xmlns="{IF_NS}">{rows}</interfaces-state></filter>'
+
+
+# Reply parsing: precompiled XPath over the lxml tree ncclient already built, no dict conversion
+_NAMESPACES = {"nc": NC_NS, "if": IF_NS}
+_REPLY_OK = etree.XPath("boolean(/nc:rpc-reply/nc:ok)", namespaces=_NAMESPACES)
+_REPLY_ERROR_TAGS = etree.XPath("/nc:rpc-reply/nc:rpc-error/nc:error-tag/text()", namespaces=_NAMESPACES)
+_STATE_ROWS = etree.XPath("/nc:rpc-reply/nc:data/if:interfaces-state/if:interface", namespaces=_NAMESPACES)
+_ROW_NAME = etree.XPath("string(if:name)", namespaces=_NAMESPACES)
+_ROW_ADMIN = etree.XPath("string(if:admin-status)", namespaces=_NAMESPACES)
+_ROW_OPER = etree.XPath("string(if:oper-status)", namespaces=_NAMESPACES)
+
+
+def _reply_root(reply):
+    """The <rpc-reply> element of an ncclient reply, parsing it only if ncclient has not"""
+    root = getattr(reply, "_root", None)
+    if root is None:
+        root = etree.fromstring(reply.xml.encode())
+    return root.getroottree()
+
+
+def _reply_ok(reply):
+    """Return (ok, error tags) of an edit-config/commit reply"""
+    root = _reply_root(reply)
+    if _REPLY_OK(root):
+        return True, []
+    return False, _REPLY_ERROR_TAGS(root)
+
+
+def netconf_edit_config(m, netconf_config, default_operation=None):
+    """Execute NETCONF edit-config operation
+
+    Writes go straight to running when the device allows it; devices that
+    only expose a candidate datastore get edit-config + commit, with the
+    candidate discarded again if either step fails.
     """
-    
+    if ":writable-running" in m.server_capabilities or ":candidate" not in m.server_capabilities:
+        return m.edit_config(target="running", config=netconf_config, default_operation=default_operation)
+
     try:
-        m = _get_manager(router_ip)
-        netconf_reply = m.get_config(source="running", filter=netconf_filter)
-        netconf_reply_dict = xmltodict.parse(netconf_reply.xml)
-        m.close_session()
-        
-        # Check if interface exists in the reply
-        interface_data = netconf_reply_dict.get('rpc-reply', {}).get('data', {}).get('interfaces', {}).get('interface')
-        
-        if interface_data:
-            return True
-        return False
-    except Exception as e:
-        # print(f"Error checking interface existence: {e}")
-        return False
+        m.edit_config(target="candidate", config=netconf_config, default_operation=default_operation)
+        return m.commit()
+    except RPCError:
+        m.discard_changes()
+        raise
+
+
+def _rpc_error_tag(error):
+    """Return the error-tag of an rpc-error (e.g. data-exists, data-missing)"""
+    return getattr(error, "tag", None)
 
 
-def create(router_ip, method="Netconf"):
+def _status_message(admin_status, oper_status, method, interface_name=INTERFACE_NAME):
+    if admin_status == 'up' and oper_status == 'up':
+        return f"Interface {interface_name.lower()} is enabled (checked by {method})"
+    elif admin_status == 'down' and oper_status == 'down':
+        return f"Interface {interface_name.lower()} is disabled (checked by {method})"
+    else:
+        return f"Interface {interface_name.lower()} admin-status={admin_status} oper-status={oper_status} (checked by {method})"
+
+
+def get_interfaces(router_ip, names=None):
+    """Return InterfaceRecords for names (default every interface) from one NETCONF get"""
+    names = tuple(names) if names else None
+    netconf_reply = session_pool.run(router_ip, lambda m: m.get(filter=_state_filter(names)))
+    with _timed("parse", router_ip):
+        records = []
+        for row in _STATE_ROWS(_reply_root(netconf_reply)):
+            name = _ROW_NAME(row)
+            if not names or name in names:
+                records.append(InterfaceRecord(name, _ROW_ADMIN(row) or "unknown", _ROW_OPER(row) or "unknown", None))
+    return records
+
+
+@invalidates
+def create(router_ip, method="Netconf", student_id=STUDENT_ID):
     """Create loopback interface using NETCONF"""
-    # Check if interface already exists
-    if _interface_exists(router_ip):
-        return f"Cannot create: Interface {INTERFACE_NAME.lower()}"
-    
+    interface_name = _interface_name(student_id)
+    if interface_cache.get_exists(router_ip, interface_name) is True:
+        return f"Cannot create: Interface {interface_name.lower()}"
+    # operation="create" makes the router refuse with data-exists if the interface is already there
     try:
-        m = _get_manager(router_ip)
-        netconf_config = _loopback_config_xml(enabled=True, operation="merge")
-        netconf_reply = netconf_edit_config(m, netconf_config)
-        xml_data = netconf_reply.xml
-        print(xml_data)
-        m.close_session()
-        
-        if '<ok/>' in xml_data:
-            return f"Interface {INTERFACE_NAME.lower()} is created successfully using {method}"
+        netconf_config = _loopback_config_xml(student_id, enabled=True, operation="create")
+        netconf_reply = session_pool.run(router_ip, lambda m: netconf_edit_config(m, netconf_config))
+        ok, error_tags = _reply_ok(netconf_reply)
+        if ok:
+            interface_cache.set_exists(router_ip, interface_name, True)
+            interface_cache.invalidate_status(router_ip, interface_name)
+            return f"Interface {interface_name.lower()} is created successfully using {method}"
         else:
-            return f"Cannot create: Interface {INTERFACE_NAME.lower()}"
+            print(f"Error: no <ok/> in reply ({', '.join(error_tags) or 'no rpc-error'})")
+            interface_cache.invalidate(router_ip, interface_name)
+            return f"Cannot create: Interface {interface_name.lower()}"
+    except RPCError as e:
+        if _rpc_error_tag(e) == "data-exists":
+            interface_cache.set_exists(router_ip, interface_name, True)
+            return f"Cannot create: Interface {interface_name.lower()}"
+        print(f"Error: {e}")
+        interface_cache.invalidate(router_ip, interface_name)
+        return "Error: NETCONF create"
     except Exception as e:
         print(f"Error: {e}")
+        interface_cache.invalidate(router_ip, interface_name)
         return "Error: NETCONF create"
 
 
-def delete(router_ip, method="Netconf"):
+@invalidates
+def delete(router_ip, method="Netconf", student_id=STUDENT_ID):
     """Delete loopback interface using NETCONF"""
-    # Check if interface exists before deleting
-    if not _interface_exists(router_ip):
-        return f"Cannot delete: Interface {INTERFACE_NAME.lower()}"
-    
-    netconf_config = f"""
-    <config>
-        <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-            <interface operation="delete">
-                <name>{INTERFACE_NAME}</name>
-            </interface>
-        </interfaces>
-    </config>
-    """
+    interface_name = _interface_name(student_id)
+    if interface_cache.get_exists(router_ip, interface_name) is False:
+        return f"Cannot delete: Interface {interface_name.lower()}"
+    netconf_config = _delete_config_xml(interface_name)
 
     try:
-        m = _get_manager(router_ip)
-        netconf_reply = netconf_edit_config(m, netconf_config)
-        xml_data = netconf_reply.xml
-        print(xml_data)
-        m.close_session()
-        
-        if '<ok/>' in xml_data:
-            return f"Interface {INTERFACE_NAME.lower()} is deleted successfully using {method}"
+        netconf_reply = session_pool.run(router_ip, lambda m: netconf_edit_config(m, netconf_config))
+        ok, error_tags = _reply_ok(netconf_reply)
+        if ok:
+            interface_cache.set_exists(router_ip, interface_name, False)
+            return f"Interface {interface_name.lower()} is deleted successfully using {method}"
         else:
-            return f"Cannot delete: Interface {INTERFACE_NAME.lower()}"
+            print(f"Error: no <ok/> in reply ({', '.join(error_tags) or 'no rpc-error'})")
+            interface_cache.invalidate(router_ip, interface_name)
+            return f"Cannot delete: Interface {interface_name.lower()}"
+    except RPCError as e:
+        if _rpc_error_tag(e) == "data-missing":
+            interface_cache.set_exists(router_ip, interface_name, False)
+            return f"Cannot delete: Interface {interface_name.lower()}"
+        print(f"Error: {e}")
+        interface_cache.invalidate(router_ip, interface_name)
+        return "Error: NETCONF delete"
     except Exception as e:
         print(f"Error: {e}")
+        interface_cache.invalidate(router_ip, interface_name)
         return "Error: NETCONF delete"
 
 
-def enable(router_ip, method="Netconf"):
+@invalidates
+def enable(router_ip, method="Netconf", student_id=STUDENT_ID):
     """Enable loopback interface using NETCONF"""
-    # Check if interface exists before enabling
-    if not _interface_exists(router_ip):
-        return f"Cannot enable: Interface {INTERFACE_NAME.lower()}"
-    
-    netconf_config = f"""
-    <config>
-        <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-            <interface>
-                <name>{INTERFACE_NAME}</name>
-                <enabled>true</enabled>
-            </interface>
-        </interfaces>
-    </config>
-    """
+    interface_name = _interface_name(student_id)
+    if interface_cache.get_exists(router_ip, interface_name) is False:
+        return f"Cannot enable: Interface {interface_name.lower()}"
+    netconf_config = _enabled_config_xml(interface_name, enabled=True)
 
     try:
-        m = _get_manager(router_ip)
-        netconf_reply = netconf_edit_config(m, netconf_config)
-        xml_data = netconf_reply.xml
-        print(xml_data)
-        m.close_session()
-        
-        if '<ok/>' in xml_data:
-            return f"Interface {INTERFACE_NAME.lower()} is enabled successfully using {method}"
+        netconf_reply = session_pool.run(
+            router_ip, lambda m: netconf_edit_config(m, netconf_config, default_operation="none")
+        )
+        ok, error_tags = _reply_ok(netconf_reply)
+        if ok:
+            interface_cache.invalidate_status(router_ip, interface_name)
+            return f"Interface {interface_name.lower()} is enabled successfully using {method}"
         else:
-            return f"Cannot enable: Interface {INTERFACE_NAME.lower()}"
+            print(f"Error: no <ok/> in reply ({', '.join(error_tags) or 'no rpc-error'})")
+            interface_cache.invalidate(router_ip, interface_name)
+            return f"Cannot enable: Interface {interface_name.lower()}"
+    except RPCError as e:
+        if _rpc_error_tag(e) == "data-missing":
+            interface_cache.set_exists(router_ip, interface_name, False)
+            return f"Cannot enable: Interface {interface_name.lower()}"
+        print(f"Error: {e}")
+        interface_cache.invalidate(router_ip, interface_name)
+        return "Error: NETCONF enable"
     except Exception as e:
         print(f"Error: {e}")
+        interface_cache.invalidate(router_ip, interface_name)
         return "Error: NETCONF enable"
 
 
-def disable(router_ip, method="Netconf"):
+@invalidates
+def disable(router_ip, method="Netconf", student_id=STUDENT_ID):
     """Disable loopback interface using NETCONF"""
-    # Check if interface exists before disabling
-    if not _interface_exists(router_ip):
-        return f"Cannot shutdown: Interface {INTERFACE_NAME.lower()}"
-    
-    netconf_config = f"""
-    <config>
-        <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-            <interface>
-                <name>{INTERFACE_NAME}</name>
-                <enabled>false</enabled>
-            </interface>
-        </interfaces>
-    </config>
-    """
+    interface_name = _interface_name(student_id)
+    if interface_cache.get_exists(router_ip, interface_name) is False:
+        return f"Cannot shutdown: Interface {interface_name.lower()}"
+    netconf_config = _enabled_config_xml(interface_name, enabled=False)
 
     try:
-        m = _get_manager(router_ip)
-        netconf_reply = netconf_edit_config(m, netconf_config)
-        xml_data = netconf_reply.xml
-        print(xml_data)
-        m.close_session()
-        
-        if '<ok/>' in xml_data:
-            return f"Interface {INTERFACE_NAME.lower()} is shutdowned successfully using {method}"
+        netconf_reply = session_pool.run(
+            router_ip, lambda m: netconf_edit_config(m, netconf_config, default_operation="none")
+        )
+        ok, error_tags = _reply_ok(netconf_reply)
+        if ok:
+            interface_cache.invalidate_status(router_ip, interface_name)
+            return f"Interface {interface_name.lower()} is shutdowned successfully using {method}"
         else:
-            return f"Cannot shutdown: Interface {INTERFACE_NAME.lower()}"
+            print(f"Error: no <ok/> in reply ({', '.join(error_tags) or 'no rpc-error'})")
+            interface_cache.invalidate(router_ip, interface_name)
+            return f"Cannot shutdown: Interface {interface_name.lower()}"
+    except RPCError as e:
+        if _rpc_error_tag(e) == "data-missing":
+            interface_cache.set_exists(router_ip, interface_name, False)
+            return f"Cannot shutdown: Interface {interface_name.lower()}"
+        print(f"Error: {e}")
+        interface_cache.invalidate(router_ip, interface_name)
+        return "Error: NETCONF disable"
     except Exception as e:
         print(f"Error: {e}")
+        interface_cache.invalidate(router_ip, interface_name)
         return "Error: NETCONF disable"
 
 
-def status(router_ip, method="Netconf"):
+def status(router_ip, method="Netconf", student_id=STUDENT_ID):
     """Get status of loopback interface using NETCONF"""
-    if not _interface_exists(router_ip):
-        return f"No Interface loopback{STUDENT_ID} (checked by Netconf)"
-    netconf_filter = f"""
-    <filter>
-        <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-            <interface>
-                <name>{INTERFACE_NAME}</name>
-            </interface>
-        </interfaces-state>
-    </filter>
-    """
-
+    interface_name = _interface_name(student_id)
+    if interface_cache.get_exists(router_ip, interface_name) is False:
+        return f"No Interface {interface_name.lower()} (checked by Netconf)"
+    cached_status = interface_cache.get_status(router_ip, interface_name)
+    if cached_status is not None:
+        return _status_message(*cached_status, method, interface_name)
+    # The background-collected interface table, unless it predates a write;
+    # only a table this backend collected may be reported as checked by it
+    snapshot = interface_state.peek(router_ip, source=method)
+    if snapshot is not None:
+        record = snapshot.interfaces.get(interface_name)
+        if record is None:
+            return f"No Interface {interface_name.lower()} (checked by Netconf)"
+        return _status_message(record.admin_status, record.oper_status, method, interface_name)
     try:
-        m = _get_manager(router_ip)
-        # Use Netconf get operation to get interfaces-state information
-        netconf_reply = m.get(filter=netconf_filter)
-        print(netconf_reply)
-        netconf_reply_dict = xmltodict.parse(netconf_reply.xml)
-        m.close_session()
-
-        # Check if there is data returned from netconf_reply_dict
-        interface_data = netconf_reply_dict.get('rpc-reply', {}).get('data', {}).get('interfaces-state', {}).get('interface')
-        
-        if interface_data:
-            # extract admin_status and oper_status from netconf_reply_dict
-            admin_status = interface_data.get('admin-status', 'unknown')
-            oper_status = interface_data.get('oper-status', 'unknown')
-            
-            if admin_status == 'up' and oper_status == 'up':
-                return f"Interface {INTERFACE_NAME.lower()} is enabled (checked by {method})"
-            elif admin_status == 'down' and oper_status == 'down':
-                return f"Interface {INTERFACE_NAME.lower()} is disabled (checked by {method})"
-            else:
-                return f"Interface {INTERFACE_NAME.lower()} admin-status={admin_status} oper-status={oper_status} (checked by {method})"
+        records = get_interfaces(router_ip, [interface_name])
     except Exception as e:
         print(f"Error: {e}")
         return "Error: NETCONF status"
+    if not records:
+        interface_cache.set_exists(router_ip, interface_name, False)
+        return f"No Interface {interface_name.lower()} (checked by Netconf)"
+    record = records[0]
+    interface_cache.set_status(router_ip, interface_name, record.admin_status, record.oper_status)
+    return _status_message(record.admin_status, record.oper_status, method, interface_name)
@@ -1,51 +1,281 @@
+import atexit
+import threading
+import time
+
 from netmiko import ConnectHandler
 from netmiko.exceptions import NetmikoTimeoutException, NetmikoAuthenticationException
 
+from governor import GovernorError, governor
+from interface_state import InterfaceRecord, interface_state
+from inventory import changed_devices, inventory
+from metrics import metrics
+
+PORT = 22  # SSH CLI
+IDLE_TIMEOUT = 300  # drop cached SSH sessions that have not been used for this long
+FAST_CLI = False  # opt-in: adaptive prompt-based reads instead of the fixed delay factor
+READ_TIMEOUT = 20  # upper bound for a single command in fast CLI mode
+
+
+def configure(fast_cli=None, idle_timeout=None):
+    """Switch fast CLI mode and/or the idle timeout; cached sessions are closed"""
+    global FAST_CLI, IDLE_TIMEOUT
+    if fast_cli is not None:
+        FAST_CLI = fast_cli
+    if idle_timeout is not None:
+        IDLE_TIMEOUT = idle_timeout
+    connection_cache.close_all()
+
+
+def _device(router_ip):
+    login = inventory.device(router_ip)
+    device = { "device_type": "cisco_ios", "ip": router_ip, "port": PORT, "username": login.username, "password": login.password, "conn_timeout": 25, "banner_timeout": 120, "auth_timeout": 25, "global_delay_factor": 2, "fast_cli": False, }
+    if FAST_CLI:
+        device.update({"global_delay_factor": 1, "fast_cli": True})
+    return device
 
-def gigabit_status(router_ip):
-    device = { "device_type": "cisco_ios", "ip": router_ip, "username": "admin", "password": "cisco", "conn_timeout": 25, "banner_timeout": 120, "auth_timeout": 25, "global_delay_factor": 2, "fast_cli": False, }
+
+def _timed(phase, router_ip):
+    return metrics.timer("ipa_device_seconds", backend="netmiko", phase=phase, router=router_ip)
+
+
+def _connect(router_ip):
+    """Log in over SSH; the session holds a governor slot until _disconnect"""
+    release = governor.take_slot(router_ip)
     try:
-        with ConnectHandler(**device) as ssh:
-            result = ssh.send_command("show ip interface brief", use_textfsm=True)
-            if not isinstance(result, list):  # fallback if TextFSM fails
-                result = [
-                    {"interface": line.split()[0], "status": line.split()[4]}
-                    for line in ssh.send_command("show ip interface brief").splitlines()
-                    if line and not line.lower().startswith("interface")
-                ]
-
-            up = down = admin_down = 0
-            statuses = []
-            for r in result:
-                name, status = r["interface"], r["status"].lower()
-                statuses.append(f"{name} {status}")
-                if status == "up":
-                    up += 1
-                elif status == "down":
-                    down += 1
-                elif "administratively down" in status:
-                    admin_down += 1
-
-            return f"{', '.join(statuses)} -> {up} up, {down} down, {admin_down} administratively down"
-
-    except (NetmikoTimeoutException, NetmikoAuthenticationException) as e:
-        return f"Error: Netmiko ({e})"
+        with _timed("connect", router_ip):
+            ssh = ConnectHandler(**_device(router_ip))
+    except BaseException:
+        release()
+        raise
+    governor.hold(ssh, release)
+    return ssh
+
+
+def _send_command(ssh, command, **kwargs):
+    if FAST_CLI:
+        # The prompt of a warm session is already known, so skip re-discovering it
+        kwargs.update({"read_timeout": READ_TIMEOUT, "auto_find_prompt": False})
+    # TextFSM parsing, when requested, happens inside send_command and is counted here
+    with _timed("rpc", ssh.host):
+        return ssh.send_command(command, **kwargs)
+
+
+def _disconnect(ssh):
+    with _timed("close", ssh.host):
+        try:
+            ssh.disconnect()
+        except Exception:
+            pass
+        finally:
+            governor.drop(ssh)
+
+
+class ConnectionCache:
+    """Keep one logged-in SSH session per router
+
+    A session is used by one caller at a time. Before reuse it is probed with
+    is_alive(); dead or idle-expired sessions are replaced by a fresh login,
+    and a command that fails on a reused session is retried once after
+    logging in again. A cached session keeps its governor slot; reclaim()
+    logs it out when another backend needs the slot.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._entries = {}  # router_ip -> [connection or None, last_used, lock]
+        self._reaper = None
+        self.logins = 0
+        self.logins_saved = 0
+
+    def _entry(self, router_ip):
+        with self._lock:
+            entry = self._entries.get(router_ip)
+            if entry is None:
+                entry = self._entries[router_ip] = [None, 0.0, threading.Lock()]
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_forever, name="netmiko-cache-reaper", daemon=True)
+                self._reaper.start()
+            return entry
+
+    def run(self, router_ip, func):
+        """Call func(connection) on the cached session for router_ip"""
+        entry = self._entry(router_ip)
+        with entry[2]:
+            with governor.breaker(router_ip, PORT, failures=(NetmikoTimeoutException, OSError, EOFError)):
+                while True:
+                    ssh = entry[0]
+                    reused = ssh is not None and time.monotonic() - entry[1] < IDLE_TIMEOUT and ssh.is_alive()
+                    if not reused:
+                        if ssh is not None:
+                            _disconnect(ssh)
+                        entry[0] = None
+                        ssh = self._connect(router_ip)
+                        entry[0] = ssh
+                        self.logins += 1
+                    try:
+                        result = func(ssh)
+                    except (NetmikoTimeoutException, NetmikoAuthenticationException):
+                        raise
+                    except Exception:
+                        _disconnect(ssh)
+                        entry[0] = None
+                        # The router may have closed a warm session under us; log in again once
+                        if reused:
+                            continue
+                        raise
+                    if reused:
+                        self.logins_saved += 1
+                    entry[1] = time.monotonic()
+                    return result
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(max(IDLE_TIMEOUT / 4, 1))
+            self.close_idle()
+
+    def close_idle(self):
+        """Disconnect sessions that have been idle for longer than IDLE_TIMEOUT"""
+        with self._lock:
+            entries = list(self._entries.values())
+        cutoff = time.monotonic() - IDLE_TIMEOUT
+        for entry in entries:
+            # Skip sessions that are in use right now
+            if entry[0] is None or not entry[2].acquire(blocking=False):
+                continue
+            try:
+                if entry[0] is not None and entry[1] < cutoff:
+                    _disconnect(entry[0])
+                    entry[0] = None
+            finally:
+                entry[2].release()
+
+    def reclaim(self, router_ip):
+        """Log out of the router's cached session unless it is in use; True if one was closed"""
+        with self._lock:
+            entry = self._entries.get(router_ip)
+        if entry is None or entry[0] is None or not entry[2].acquire(blocking=False):
+            return False
+        try:
+            if entry[0] is None:
+                return False
+            _disconnect(entry[0])
+            entry[0] = None
+            return True
+        finally:
+            entry[2].release()
+
+    def stats(self):
+        with self._lock:
+            cached = sum(1 for entry in self._entries.values() if entry[0] is not None)
+        return {"logins": self.logins, "logins_saved": self.logins_saved, "cached_sessions": cached}
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            with entry[2]:
+                if entry[0] is not None:
+                    _disconnect(entry[0])
+                    entry[0] = None
+
+
+connection_cache = ConnectionCache(_connect)
+atexit.register(connection_cache.close_all)
+governor.add_reclaimer(connection_cache.reclaim)
+metrics.register_stats("ipa_netmiko_cache", connection_cache.stats)
+
+
+def _on_inventory_change(old, new):
+    # Logins may have changed; cached sessions log in again on next use
+    if changed_devices(old, new):
+        connection_cache.close_all()
+
+
+inventory.subscribe(_on_inventory_change)
+
+
+def _parse_brief(output):
+    """Fallback parser for "show ip interface brief" when TextFSM is unavailable"""
+    rows = []
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) < 6 or fields[0].lower() == "interface":
+            continue
+        # Status may be two words ("administratively down"), so take it from both ends
+        rows.append({
+            "interface": fields[0],
+            "ip_address": fields[1],
+            "status": " ".join(fields[4:-1]),
+            "proto": fields[-1],
+        })
+    return rows
+
+
+def _collect_interfaces(ssh):
+    result = _send_command(ssh, "show ip interface brief", use_textfsm=True)
+    if not isinstance(result, list):  # fallback if TextFSM fails
+        output = _send_command(ssh, "show ip interface brief")
+        with _timed("parse", ssh.host):
+            result = _parse_brief(output)
+
+    records = []
+    for row in result:
+        status = row["status"].lower()
+        admin_status = "down" if status.startswith("administratively") else "up"
+        address = row.get("ip_address")
+        records.append(InterfaceRecord(
+            row["interface"], admin_status, "down" if admin_status == "down" else status,
+            None if address == "unassigned" else address,
+        ))
+    return records
+
+
+def get_interfaces(router_ip, names=None):
+    """Return InterfaceRecords for names (default every interface) from one show command"""
+    records = connection_cache.run(router_ip, _collect_interfaces)
+    return [record for record in records if not names or record.name in names]
+
+
+def _gigabit_message(snapshot):
+    up = down = admin_down = 0
+    statuses = []
+    for record in snapshot.interfaces.values():
+        # RESTCONF/NETCONF tables may report other oper states (e.g. lower-layer-down); count them as down
+        status = "administratively down" if record.admin_status == "down" else record.oper_status
+        statuses.append(f"{record.name} {status}")
+        if record.admin_status == "down":
+            admin_down += 1
+        elif status == "up":
+            up += 1
+        else:
+            down += 1
+
+    return f"{', '.join(statuses)} -> {up} up, {down} down, {admin_down} administratively down"
+
+
+def gigabit_status(router_ip, refresh=False):
+    """Summarise interface states from the collected table, or live when refresh is set"""
+    try:
+        return _gigabit_message(interface_state.get(router_ip, refresh=refresh))
+
+    # The table may come from RESTCONF or NETCONF, so failures are reported under that name
+    except Exception as e:
+        return f"Error: {interface_state.source or 'Netmiko'} ({e})"
 
 
 def get_motd(router_ip):
     """Get MOTD banner from router using Netmiko"""
-    device = { "device_type": "cisco_ios", "ip": router_ip, "username": "admin", "password": "cisco", "conn_timeout": 25, "banner_timeout": 120, "auth_timeout": 25, "global_delay_factor": 2, "fast_cli": False, }
-    
     try:
-        with ConnectHandler(**device) as ssh:
-            # Use simple show banner motd command
-            result = ssh.send_command("show banner motd").strip() 
-            # Check if MOTD is configured
-            if not result or "not configured" in result.lower():
-                return "Error: No MOTD Configured"
-            return result
-    
-    except (NetmikoTimeoutException, NetmikoAuthenticationException) as e:
+        # Use simple show banner motd command
+        result = connection_cache.run(router_ip, lambda ssh: _send_command(ssh, "show banner motd")).strip()
+        # Check if MOTD is configured
+        if not result or "not configured" in result.lower():
+            return "Error: No MOTD Configured"
+        return result
+
+    except (NetmikoTimeoutException, NetmikoAuthenticationException, GovernorError) as e:
         return f"Error: Netmiko ({e})"
     except Exception as e:
         print(f"Error getting MOTD: {e}")
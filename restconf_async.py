@@ -0,0 +1,203 @@
+import asyncio
+import json
+import weakref
+
+import httpx
+
+import restconf_final
+from restconf_final import (
+    HEADERS, INTERFACE_NAME, STUDENT_ID, _get_urls, _interface_name, _loopback_payload, _state_records,
+    _state_request, _status_message,
+)
+from governor import GovernorError, governor
+from interface_cache import interface_cache
+from interface_state import interface_state, invalidates
+from inventory import inventory
+from metrics import metrics
+
+# One keep-alive httpx.AsyncClient per router and event loop: a client's connections
+# belong to the loop that opened them, so every asyncio.run() gets clients of its own.
+# Replies are the same strings restconf_final returns.
+_clients = weakref.WeakKeyDictionary()  # event loop -> {router_ip: httpx.AsyncClient}
+
+
+def _get_client(router_ip):
+    # Clients of a loop that ended without aclose() cannot be used or closed any more
+    for loop in [loop for loop in _clients if loop.is_closed()]:
+        del _clients[loop]
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(router_ip)
+    if client is None or client.is_closed:
+        timeout = restconf_final.TIMEOUT
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        device = inventory.device(router_ip)
+        # httpx opens sockets out of the governor's sight, so at least never exceed the router's cap
+        limit = min(restconf_final.POOL_MAXSIZE, governor.max_sessions)
+        client = httpx.AsyncClient(
+            auth=(device.username, device.password),
+            headers=HEADERS,
+            verify=False,
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(
+                max_connections=limit,
+                max_keepalive_connections=limit,
+            ),
+        )
+        clients[router_ip] = client
+    return client
+
+
+async def aclose():
+    """Close the running loop's pooled clients; call it before the loop ends"""
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+async def _request(router_ip, method, url, **kwargs):
+    # The breaker is shared with the threaded backends; the session cap is left to the client's pool limits
+    try:
+        with governor.breaker(router_ip, restconf_final.PORT, failures=(httpx.ConnectError, httpx.TimeoutException)):
+            with metrics.timer("ipa_device_seconds", backend="restconf", phase="rpc", router=router_ip):
+                return await _get_client(router_ip).request(method, url, **kwargs)
+    except GovernorError as error:
+        raise httpx.ConnectError(str(error)) from error
+
+
+async def _interface_exists(router_ip, interface_name=INTERFACE_NAME):
+    exists = interface_cache.get_exists(router_ip, interface_name)
+    if exists is not None:
+        return exists
+
+    api_url, _ = _get_urls(router_ip, interface_name)
+    try:
+        resp = await _request(router_ip, "GET", api_url)
+    except httpx.HTTPError as error:
+        raise RuntimeError(f"RESTCONF lookup failed: {error}") from error
+    if resp.status_code in (200, 404):
+        exists = resp.status_code == 200
+        interface_cache.set_exists(router_ip, interface_name, exists)
+        return exists
+    raise RuntimeError(f"RESTCONF lookup failed with status {resp.status_code}")
+
+
+async def get_interfaces(router_ip, names=None):
+    """Return InterfaceRecords for names (default every interface) from one RESTCONF GET"""
+    url, params = _state_request(router_ip, names)
+    try:
+        resp = await _request(router_ip, "GET", url, params=params)
+    except httpx.HTTPError as error:
+        raise RuntimeError(f"RESTCONF interfaces-state failed: {error}") from error
+    with metrics.timer("ipa_device_seconds", backend="restconf", phase="parse", router=router_ip):
+        return _state_records(resp, names)
+
+
+async def _write(router_ip, interface_name, http_method, payload=None):
+    """Send one write; return True on 2xx, False on another status, None on a transport error"""
+    api_url, _ = _get_urls(router_ip, interface_name)
+    data = json.dumps(payload) if payload is not None else None
+    try:
+        resp = await _request(router_ip, http_method, api_url, content=data)
+    except httpx.HTTPError as error:
+        print(error)
+        return None
+
+    if 200 <= resp.status_code <= 299:
+        print(f"STATUS OK: {resp.status_code}")
+        return True
+    print(f"Error. Status Code: {resp.status_code}")
+    interface_cache.invalidate(router_ip, interface_name)
+    return False
+
+
+@invalidates
+async def create(router_ip, method="Restconf", student_id=STUDENT_ID):
+    interface_name = _interface_name(student_id)
+    try:
+        if await _interface_exists(router_ip, interface_name):
+            return f"Cannot create: Interface {interface_name.lower()}"
+    except RuntimeError as error:
+        print(error)
+        return "Error: RESTCONF create"
+
+    if await _write(router_ip, interface_name, "PUT", _loopback_payload(student_id, enabled=True)):
+        interface_cache.set_exists(router_ip, interface_name, True)
+        interface_cache.invalidate_status(router_ip, interface_name)
+        return f"Interface {interface_name.lower()} is created successfully using {method}"
+    return "Error: RESTCONF create"
+
+
+@invalidates
+async def delete(router_ip, method="Restconf", student_id=STUDENT_ID):
+    interface_name = _interface_name(student_id)
+    try:
+        if not await _interface_exists(router_ip, interface_name):
+            return f"Cannot delete: Interface {interface_name.lower()}"
+    except RuntimeError as error:
+        print(error)
+        return "Error: RESTCONF delete"
+
+    if await _write(router_ip, interface_name, "DELETE"):
+        interface_cache.set_exists(router_ip, interface_name, False)
+        return f"Interface {interface_name.lower()} is deleted successfully using {method}"
+    return "Error: RESTCONF delete"
+
+
+@invalidates
+async def enable(router_ip, method="Restconf", student_id=STUDENT_ID):
+    interface_name = _interface_name(student_id)
+    try:
+        if not await _interface_exists(router_ip, interface_name):
+            return f"Cannot enable: Interface {interface_name.lower()}"
+    except RuntimeError as error:
+        print(error)
+        return "Error: RESTCONF enable"
+
+    if await _write(router_ip, interface_name, "PATCH", {"ietf-interfaces:interface": {"enabled": True}}):
+        interface_cache.invalidate_status(router_ip, interface_name)
+        return f"Interface {interface_name.lower()} is enabled successfully using {method}"
+    return "Error: RESTCONF enable"
+
+
+@invalidates
+async def disable(router_ip, method="Restconf", student_id=STUDENT_ID):
+    interface_name = _interface_name(student_id)
+    try:
+        if not await _interface_exists(router_ip, interface_name):
+            return f"Cannot shutdown: Interface {interface_name.lower()}"
+    except RuntimeError as error:
+        print(error)
+        return "Error: RESTCONF disable"
+
+    if await _write(router_ip, interface_name, "PATCH", {"ietf-interfaces:interface": {"enabled": False}}):
+        interface_cache.invalidate_status(router_ip, interface_name)
+        return f"Interface {interface_name.lower()} is shutdowned successfully using {method}"
+    return "Error: RESTCONF disable"
+
+
+async def status(router_ip, method="Restconf", student_id=STUDENT_ID):
+    interface_name = _interface_name(student_id)
+    if interface_cache.get_exists(router_ip, interface_name) is False:
+        return f"No Interface {interface_name.lower()} (checked by {method})"
+    cached_status = interface_cache.get_status(router_ip, interface_name)
+    if cached_status is not None:
+        return _status_message(*cached_status, method, interface_name)
+    # Only a table this backend collected may be reported as checked by it
+    snapshot = interface_state.peek(router_ip, source=method)
+    if snapshot is not None:
+        record = snapshot.interfaces.get(interface_name)
+        if record is None:
+            return f"No Interface {interface_name.lower()} (checked by {method})"
+        return _status_message(record.admin_status, record.oper_status, method, interface_name)
+
+    try:
+        records = await get_interfaces(router_ip, [interface_name])
+    except RuntimeError as error:
+        print(error)
+        return "Error: RESTCONF status"
+    if not records:
+        interface_cache.set_exists(router_ip, interface_name, False)
+        return f"No Interface {interface_name.lower()} (checked by {method})"
+    record = records[0]
+    interface_cache.set_status(router_ip, interface_name, record.admin_status, record.oper_status)
+    return _status_message(record.admin_status, record.oper_status, method, interface_name)
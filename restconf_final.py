@@ -1,35 +1,186 @@
 import json
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+
+from governor import GovernorError, governor
+from interface_cache import interface_cache
+from interface_state import InterfaceRecord, interface_state, invalidates
+from inventory import changed_devices, inventory
+from metrics import metrics
 
 requests.packages.urllib3.disable_warnings()
 
 STUDENT_ID = "66070014"
 INTERFACE_NAME = f"Loopback{STUDENT_ID}"
+# RESTCONF fields filter (RFC 8040) for batched interfaces-state reads
+STATE_FIELDS = "interface(name;admin-status;oper-status)"
 
 HEADERS = {
 	"Accept": "application/yang-data+json",
 	"Content-Type": "application/yang-data+json",
 }
-AUTH = ("admin", "cisco")
+PORT = 443  # HTTPS
+POOL_MAXSIZE = 4  # keep-alive connections kept open per router
+TIMEOUT = (5, 30)  # (connect, read) seconds
+
+_sessions = {}  # router_ip -> requests.Session
+_in_flight = {}  # router_ip -> requests running on its session
+_sessions_lock = threading.Lock()
+
+
+def _timed(phase, router_ip):
+	return metrics.timer("ipa_device_seconds", backend="restconf", phase=phase, router=router_ip)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+	"""Records each new TCP + TLS handshake; reused keep-alive requests skip it
+
+	An open connection holds a governor slot, also while it waits idle in the
+	pool, until close().
+	"""
+
+	def connect(self):
+		slot = getattr(self, "_governor_slot", None)
+		release = None
+		if slot is None or not slot.alive:
+			release = governor.take_slot(self.host)
+		try:
+			with _timed("connect", self.host):
+				super().connect()
+		except BaseException:
+			if release is not None:
+				release()
+			raise
+		if release is not None:
+			governor.hold(self, release)
+
+	def close(self):
+		try:
+			super().close()
+		finally:
+			governor.drop(self)
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+	ConnectionCls = _TimedHTTPSConnection
+
+
+def configure(pool_maxsize=None, timeout=None):
+	"""Change pool size and/or timeouts; open sessions are closed and rebuilt lazily"""
+	global POOL_MAXSIZE, TIMEOUT
+	if pool_maxsize is not None:
+		POOL_MAXSIZE = pool_maxsize
+	if timeout is not None:
+		TIMEOUT = timeout
+	close_sessions()
+
+
+def close_sessions():
+	with _sessions_lock:
+		sessions = list(_sessions.items())
+		_sessions.clear()
+	for router_ip, session in sessions:
+		with _timed("close", router_ip):
+			session.close()
+
+
+def _on_inventory_change(old, new):
+	# Logins may have changed; sessions are rebuilt on next use
+	if changed_devices(old, new):
+		close_sessions()
+
+
+inventory.subscribe(_on_inventory_change)
+
+
+def _get_session(router_ip):
+	"""Return the shared keep-alive session for a router, creating it on first use"""
+	with _sessions_lock:
+		session = _sessions.get(router_ip)
+		if session is None:
+			device = inventory.device(router_ip)
+			session = requests.Session()
+			session.auth = (device.username, device.password)
+			session.headers.update(HEADERS)
+			session.verify = False
+			# One host per session; pool_block caps concurrent connections to the router. Above the
+			# governor's cap a request would wait for a slot while an idle connection sits in the pool
+			pool_maxsize = min(POOL_MAXSIZE, governor.max_sessions)
+			adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True)
+			adapter.poolmanager.pool_classes_by_scheme = {
+				**adapter.poolmanager.pool_classes_by_scheme,
+				"https": _TimedHTTPSConnectionPool,
+			}
+			session.mount("https://", adapter)
+			_sessions[router_ip] = session
+	return session
+
+
+def reclaim(router_ip):
+	"""Close the router's keep-alive connections if no request is using them; True if any were open"""
+	with _sessions_lock:
+		if _in_flight.get(router_ip):
+			return False
+		session = _sessions.pop(router_ip, None)
+	if session is None:
+		return False
+	with _timed("close", router_ip):
+		session.close()
+	return True
+
+
+governor.add_reclaimer(reclaim)
+
+
+def _request(router_ip, method, url, **kwargs):
+	kwargs.setdefault("timeout", TIMEOUT)
+	# Passed per request: a REQUESTS_CA_BUNDLE in the environment would override session.verify
+	kwargs.setdefault("verify", False)
+	with _sessions_lock:
+		_in_flight[router_ip] = _in_flight.get(router_ip, 0) + 1
+	try:
+		with governor.breaker(router_ip, PORT, failures=(requests.ConnectionError, requests.Timeout)):
+			with _timed("rpc", router_ip):
+				return _get_session(router_ip).request(method, url, **kwargs)
+	except GovernorError as error:
+		# Fail fast the way an unreachable router would, so callers need no extra handling
+		raise requests.ConnectionError(str(error)) from error
+	finally:
+		with _sessions_lock:
+			_in_flight[router_ip] -= 1
+
+
+def _base_url(router_ip):
+	host = router_ip if PORT == 443 else f"{router_ip}:{PORT}"
+	return f"https://{host}/restconf/data"
+
 
+def _interface_name(student_id=STUDENT_ID):
+	"""The Loopback a student (a room's tenant) works on"""
+	return f"Loopback{student_id}"
 
-def _get_urls(router_ip):
+
+def _get_urls(router_ip, interface_name=INTERFACE_NAME):
 	"""Generate API URLs for the given router IP"""
-	base_url = f"https://{router_ip}/restconf/data"
-	api_url = f"{base_url}/ietf-interfaces:interfaces/interface={INTERFACE_NAME}"
-	api_url_status = f"{base_url}/ietf-interfaces:interfaces-state/interface={INTERFACE_NAME}"
+	base_url = _base_url(router_ip)
+	api_url = f"{base_url}/ietf-interfaces:interfaces/interface={interface_name}"
+	api_url_status = f"{base_url}/ietf-interfaces:interfaces-state/interface={interface_name}"
 	return api_url, api_url_status
 
 
-def _loopback_payload(enabled=True):
-	last_three = STUDENT_ID[-3:] # รหัส นศ 3 ตัวท้าย
+def _loopback_payload(student_id=STUDENT_ID, enabled=True):
+	last_three = student_id[-3:] # รหัส นศ 3 ตัวท้าย
 	octet_x = int(last_three[0]) # x คือเลขตัวแรก
 	octet_y = int(last_three[1:]) # y คือเลขตัวที่สองและสาม
 	ipv4_address = f"172.{octet_x}.{octet_y}.1"
 	return {
 		"ietf-interfaces:interface": {
-			"name": INTERFACE_NAME,
-			"description": f"Loopback interface for student id {STUDENT_ID}",
+			"name": _interface_name(student_id),
+			"description": f"Loopback interface for student id {student_id}",
 			"type": "iana-if-type:softwareLoopback",
 			"enabled": enabled,
 			"ietf-ip:ipv4": {
@@ -45,153 +196,214 @@ def _loopback_payload(enabled=True):
 	}
 
 # Helpers Functions to check that loopback interface or any GigabitEthernet existence
-def _interface_exists(router_ip):
-	api_url, _ = _get_urls(router_ip)
-	resp = requests.get(api_url, auth=AUTH, headers=HEADERS, verify=False)
-	if resp.status_code == 200:
-		return True
-	if resp.status_code == 404:
-		return False
+def _interface_exists(router_ip, interface_name=INTERFACE_NAME):
+	exists = interface_cache.get_exists(router_ip, interface_name)
+	if exists is not None:
+		return exists
+
+	api_url, _ = _get_urls(router_ip, interface_name)
+	try:
+		resp = _request(router_ip, "GET", api_url)
+	except requests.RequestException as error:
+		raise RuntimeError(f"RESTCONF lookup failed: {error}") from error
+	if resp.status_code in (200, 404):
+		exists = resp.status_code == 200
+		interface_cache.set_exists(router_ip, interface_name, exists)
+		return exists
 	raise RuntimeError(f"RESTCONF lookup failed with status {resp.status_code}")
 
 
-def create(router_ip, method="Restconf"):
+def _state_request(router_ip, names=None):
+	"""(url, params) reading names by key when there is one, else the whole list with a fields filter"""
+	base_url = _base_url(router_ip)
+	if names and len(names) == 1:
+		return f"{base_url}/ietf-interfaces:interfaces-state/interface={names[0]}", None
+	return f"{base_url}/ietf-interfaces:interfaces-state", {"fields": STATE_FIELDS}
+
+
+def _state_records(resp, names=None):
+	"""InterfaceRecords from an interfaces-state reply (a 404 means none of the names exist)"""
+	if resp.status_code == 404:
+		return []
+	if not 200 <= resp.status_code <= 299:
+		raise RuntimeError(f"RESTCONF interfaces-state failed with status {resp.status_code}")
+	data = resp.json()
+	rows = data.get("ietf-interfaces:interface") or (data.get("ietf-interfaces:interfaces-state") or {}).get("interface") or []
+	if isinstance(rows, dict):
+		rows = [rows]
+	return [
+		InterfaceRecord(row.get("name"), row.get("admin-status", "unknown"), row.get("oper-status", "unknown"), None)
+		for row in rows
+		if not names or row.get("name") in names
+	]
+
+
+def get_interfaces(router_ip, names=None):
+	"""Return InterfaceRecords for names (default every interface) from one RESTCONF GET
+
+	A single name is read by key; otherwise the whole interfaces-state list is
+	fetched once with a fields filter, so only names and statuses travel.
+	"""
+	url, params = _state_request(router_ip, names)
 	try:
-		if _interface_exists(router_ip):
-			return f"Cannot create: Interface {INTERFACE_NAME.lower()}"
+		resp = _request(router_ip, "GET", url, params=params)
+	except requests.RequestException as error:
+		raise RuntimeError(f"RESTCONF interfaces-state failed: {error}") from error
+	with _timed("parse", router_ip):
+		return _state_records(resp, names)
+
+
+def _status_message(admin_status, oper_status, method, interface_name=INTERFACE_NAME):
+	if admin_status == "up" and oper_status == "up":
+		return f"Interface {interface_name.lower()} is enabled (checked by {method})"
+	if admin_status == "down" and oper_status == "down":
+		return f"Interface {interface_name.lower()} is disabled (checked by {method})"
+	return (
+		f"Interface {interface_name.lower()} admin-status={admin_status} "
+		f"oper-status={oper_status} (checked by {method})"
+	)
+
+
+@invalidates
+def create(router_ip, method="Restconf", student_id=STUDENT_ID):
+	interface_name = _interface_name(student_id)
+	try:
+		if _interface_exists(router_ip, interface_name):
+			return f"Cannot create: Interface {interface_name.lower()}"
 	except RuntimeError as error:
 		print(error)
 		return "Error: RESTCONF create"
 
-	api_url, _ = _get_urls(router_ip)
-	payload = _loopback_payload(enabled=True)
-	resp = requests.put(
-		api_url,
-		data=json.dumps(payload),
-		auth=AUTH,
-		headers=HEADERS,
-		verify=False,
-	)
+	api_url, _ = _get_urls(router_ip, interface_name)
+	payload = _loopback_payload(student_id, enabled=True)
+	try:
+		resp = _request(router_ip, "PUT", api_url, data=json.dumps(payload))
+	except requests.RequestException as error:
+		print(error)
+		return "Error: RESTCONF create"
 
 	if 200 <= resp.status_code <= 299:
 		print(f"STATUS OK: {resp.status_code}")
-		return f"Interface {INTERFACE_NAME.lower()} is created successfully using {method}"
+		interface_cache.set_exists(router_ip, interface_name, True)
+		interface_cache.invalidate_status(router_ip, interface_name)
+		return f"Interface {interface_name.lower()} is created successfully using {method}"
 
 	print(f"Error. Status Code: {resp.status_code}")
+	# The cached view disagreed with the router; look again next time
+	interface_cache.invalidate(router_ip, interface_name)
 	return "Error: RESTCONF create"
 
 
-def delete(router_ip, method="Restconf"):
+@invalidates
+def delete(router_ip, method="Restconf", student_id=STUDENT_ID):
+	interface_name = _interface_name(student_id)
 	try:
-		if not _interface_exists(router_ip):
-			return f"Cannot delete: Interface {INTERFACE_NAME.lower()}"
+		if not _interface_exists(router_ip, interface_name):
+			return f"Cannot delete: Interface {interface_name.lower()}"
 	except RuntimeError as error:
 		print(error)
 		return "Error: RESTCONF delete"
 
-	api_url, _ = _get_urls(router_ip)
-	resp = requests.delete(
-		api_url,
-		auth=AUTH,
-		headers=HEADERS,
-		verify=False,
-	)
+	api_url, _ = _get_urls(router_ip, interface_name)
+	try:
+		resp = _request(router_ip, "DELETE", api_url)
+	except requests.RequestException as error:
+		print(error)
+		return "Error: RESTCONF delete"
 
 	if 200 <= resp.status_code <= 299:
 		print(f"STATUS OK: {resp.status_code}")
-		return f"Interface {INTERFACE_NAME.lower()} is deleted successfully using {method}"
+		interface_cache.set_exists(router_ip, interface_name, False)
+		return f"Interface {interface_name.lower()} is deleted successfully using {method}"
 
 	print(f"Error. Status Code: {resp.status_code}")
+	# The cached view disagreed with the router; look again next time
+	interface_cache.invalidate(router_ip, interface_name)
 	return "Error: RESTCONF delete"
 
 
-def enable(router_ip, method="Restconf"):
+@invalidates
+def enable(router_ip, method="Restconf", student_id=STUDENT_ID):
+	interface_name = _interface_name(student_id)
 	try:
-		if not _interface_exists(router_ip):
-			return f"Cannot enable: Interface {INTERFACE_NAME.lower()}"
+		if not _interface_exists(router_ip, interface_name):
+			return f"Cannot enable: Interface {interface_name.lower()}"
 	except RuntimeError as error:
 		print(error)
 		return "Error: RESTCONF enable"
 
-	api_url, _ = _get_urls(router_ip)
+	api_url, _ = _get_urls(router_ip, interface_name)
 	payload = {"ietf-interfaces:interface": {"enabled": True}}
-	resp = requests.patch(
-		api_url,
-		data=json.dumps(payload),
-		auth=AUTH,
-		headers=HEADERS,
-		verify=False,
-	)
+	try:
+		resp = _request(router_ip, "PATCH", api_url, data=json.dumps(payload))
+	except requests.RequestException as error:
+		print(error)
+		return "Error: RESTCONF enable"
 
 	if 200 <= resp.status_code <= 299:
 		print(f"STATUS OK: {resp.status_code}")
-		return f"Interface {INTERFACE_NAME.lower()} is enabled successfully using {method}"
+		interface_cache.invalidate_status(router_ip, interface_name)
+		return f"Interface {interface_name.lower()} is enabled successfully using {method}"
 
 	print(f"Error. Status Code: {resp.status_code}")
+	# The cached view disagreed with the router; look again next time
+	interface_cache.invalidate(router_ip, interface_name)
 	return "Error: RESTCONF enable"
 
 
-def disable(router_ip, method="Restconf"):
+@invalidates
+def disable(router_ip, method="Restconf", student_id=STUDENT_ID):
+	interface_name = _interface_name(student_id)
 	try:
-		if not _interface_exists(router_ip):
-			return f"Cannot shutdown: Interface {INTERFACE_NAME.lower()}"
+		if not _interface_exists(router_ip, interface_name):
+			return f"Cannot shutdown: Interface {interface_name.lower()}"
 	except RuntimeError as error:
 		print(error)
 		return "Error: RESTCONF disable"
 
-	api_url, _ = _get_urls(router_ip)
+	api_url, _ = _get_urls(router_ip, interface_name)
 	payload = {"ietf-interfaces:interface": {"enabled": False}}
-	resp = requests.patch(
-		api_url,
-		data=json.dumps(payload),
-		auth=AUTH,
-		headers=HEADERS,
-		verify=False,
-	)
+	try:
+		resp = _request(router_ip, "PATCH", api_url, data=json.dumps(payload))
+	except requests.RequestException as error:
+		print(error)
+		return "Error: RESTCONF disable"
 
 	if 200 <= resp.status_code <= 299:
 		print(f"STATUS OK: {resp.status_code}")
-		return f"Interface {INTERFACE_NAME.lower()} is shutdowned successfully using {method}"
+		interface_cache.invalidate_status(router_ip, interface_name)
+		return f"Interface {interface_name.lower()} is shutdowned successfully using {method}"
 
 	print(f"Error. Status Code: {resp.status_code}")
+	# The cached view disagreed with the router; look again next time
+	interface_cache.invalidate(router_ip, interface_name)
 	return "Error: RESTCONF disable"
 
 
-def status(router_ip, method="Restconf"):
-	_, api_url_status = _get_urls(router_ip)
-	resp = requests.get(
-		api_url_status,
-		auth=AUTH,
-		headers=HEADERS,
-		verify=False,
-	)
-
-	if 200 <= resp.status_code <= 299:
-		print(f"STATUS OK: {resp.status_code}")
-		response_json = resp.json()
-		interface_data = response_json.get("ietf-interfaces:interface")
-
-		if isinstance(interface_data, list):
-			interface_data = interface_data[0]
-
-		if not isinstance(interface_data, dict):
-			return "Error: RESTCONF status"
-
-		admin_status = interface_data.get("admin-status", "unknown")
-		oper_status = interface_data.get("oper-status", "unknown")
-
-		if admin_status == "up" and oper_status == "up":
-			return f"Interface {INTERFACE_NAME.lower()} is enabled (checked by {method})"
-		if admin_status == "down" and oper_status == "down":
-			return f"Interface {INTERFACE_NAME.lower()} is disabled (checked by {method})"
-		return (
-			f"Interface {INTERFACE_NAME.lower()} admin-status={admin_status} "
-			f"oper-status={oper_status} (checked by {method})"
-		)
+def status(router_ip, method="Restconf", student_id=STUDENT_ID):
+	interface_name = _interface_name(student_id)
+	if interface_cache.get_exists(router_ip, interface_name) is False:
+		return f"No Interface {interface_name.lower()} (checked by {method})"
+	cached_status = interface_cache.get_status(router_ip, interface_name)
+	if cached_status is not None:
+		return _status_message(*cached_status, method, interface_name)
+	# The background-collected interface table, unless it predates a write;
+	# only a table this backend collected may be reported as checked by it
+	snapshot = interface_state.peek(router_ip, source=method)
+	if snapshot is not None:
+		record = snapshot.interfaces.get(interface_name)
+		if record is None:
+			return f"No Interface {interface_name.lower()} (checked by {method})"
+		return _status_message(record.admin_status, record.oper_status, method, interface_name)
 
-	if resp.status_code == 404:
-		print(f"STATUS NOT FOUND: {resp.status_code}")
-		return f"No Interface {INTERFACE_NAME.lower()} (checked by {method})"
-
-	print(f"Error. Status Code: {resp.status_code}")
-	return "Error: RESTCONF status"
+	try:
+		records = get_interfaces(router_ip, [interface_name])
+	except RuntimeError as error:
+		print(error)
+		return "Error: RESTCONF status"
+	if not records:
+		interface_cache.set_exists(router_ip, interface_name, False)
+		return f"No Interface {interface_name.lower()} (checked by {method})"
+	record = records[0]
+	interface_cache.set_status(router_ip, interface_name, record.admin_status, record.oper_status)
+	return _status_message(record.admin_status, record.oper_status, method, interface_name)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from webex_poller import MessagePoller
+
+
+class RoomBusyError(RuntimeError):
+    """Raised when a room already has its share of the worker pool"""
+
+
+class Room:
+    """One Webex room served by the bot
+
+    Each room has its own student id, command registry view (prefix and
+    router allowlist), selected method and message cursor, and a cap on how
+    many of its jobs may be queued or running at once, so a noisy room
+    cannot fill the shared dispatcher and starve the others. The cap is never
+    below the room's router count, so an "all" command always fits.
+    """
+
+    def __init__(self, room_id, registry, poller, max_pending, student_id=None):
+        self.room_id = room_id
+        self.student_id = student_id
+        self.registry = registry
+        self.poller = poller
+        self.method = None  # "restconf" or "netconf" once the room picked one
+        self.next_poll = 0.0
+        self._max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one of the room's job slots or raise RoomBusyError"""
+        # The router list can change with the inventory, so the floor is taken per call
+        limit = max(self._max_pending, len(self.registry.routers))
+        with self._lock:
+            if self._pending >= limit:
+                raise RoomBusyError(f"Too many pending commands for room {self.room_id} ({self._pending})")
+            self._pending += 1
+
+    def release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+
+def load_room_configs(path=None, room_ids=None, student_id=None):
+    """Return [{"room_id", "student_id", "routers"}, ...]
+
+    Rooms come from a JSON file (a list of such objects, where student_id and
+    routers are optional) or else from a list of room ids that all share
+    student_id. routers is None for rooms that may use every router.
+    """
+    if path:
+        rooms = json.loads(Path(path).read_text())
+    else:
+        rooms = [{"room_id": room_id} for room_id in room_ids or ()]
+    configs = []
+    for room in rooms:
+        room_student_id = str(room.get("student_id", student_id))
+        # It names the room's interface, URLs and backup files, so only digits are accepted
+        if not room_student_id.isdigit():
+            raise ValueError(f"Invalid student_id {room_student_id!r} for room {room['room_id']}")
+        configs.append({
+            "room_id": room["room_id"],
+            "student_id": room_student_id,
+            "routers": tuple(room["routers"]) if room.get("routers") else None,
+        })
+    if not configs:
+        raise ValueError("No rooms configured")
+    return configs
+
+
+def cursor_path(cursor_file, room_id, shared):
+    """Cursor file for a room: cursor_file itself when it is the only room"""
+    if not shared:
+        return Path(cursor_file)
+    path = Path(cursor_file)
+    tag = hashlib.sha1(room_id.encode()).hexdigest()[:12]
+    return path.with_name(f"{path.stem}-{tag}{path.suffix}")
+
+
+class RoomSet:
+    """All rooms of the bot process, polled on one loop
+
+    Each room's poller keeps its own adaptive interval, so idle rooms are
+    asked for messages less and less often and the API cost follows the
+    active rooms. poll_due() polls only the rooms that are due and then
+    interleaves their new messages round-robin, so a long backlog in one room
+    does not delay the commands of the others.
+    """
+
+    def __init__(self, rooms):
+        self.rooms = list(rooms)
+        self._by_id = {room.room_id: room for room in self.rooms}
+
+    @classmethod
+    def build(cls, configs, registry, fetch_page, cursor_file, max_pending, **poller_options):
+        """Create the rooms; fetch_page(room_id, params) fetches one page of a room"""
+        rooms = []
+        for config in configs:
+            room_id = config["room_id"]
+            poller = MessagePoller(
+                lambda params, room_id=room_id: fetch_page(room_id, params),
+                cursor_path(cursor_file, room_id, len(configs) > 1),
+                **poller_options,
+            )
+            room_registry = registry.scoped(f"/{config['student_id']}", config["routers"])
+            rooms.append(Room(room_id, room_registry, poller, max_pending, config["student_id"]))
+        return cls(rooms)
+
+    def get(self, room_id):
+        return self._by_id.get(room_id)
+
+    def ids(self):
+        return tuple(self._by_id)
+
+    def next_poll_in(self):
+        """Seconds until the next room is due to be polled"""
+        return max(0.0, min(room.next_poll for room in self.rooms) - time.monotonic())
+
+    def poll_due(self):
+        """Yield (room, message) for every due room, one message per room in turn"""
+        backlogs = deque()
+        for room in self.rooms:
+            if room.next_poll > time.monotonic():
+                continue
+            messages = room.poller.poll()
+            room.next_poll = time.monotonic() + room.poller.interval
+            if messages:
+                backlogs.append((room, deque(messages)))
+        while backlogs:
+            room, messages = backlogs.popleft()
+            yield room, messages.popleft()
+            if messages:
+                backlogs.append((room, messages))
@@ -0,0 +1,148 @@
+import gzip
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+GZIP_THRESHOLD = 64 * 1024  # compress attachments larger than this many bytes
+MAX_ATTEMPTS = 4
+BACKOFF = 1.0  # seconds before the first retry, doubled after each failure
+MAX_BACKOFF = 30
+RETRY_STATUS = (429, 500, 502, 503, 504)
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+MIN_RATE = 16 * 1024  # bytes/s assumed for the slowest uplink when sizing the read timeout
+
+
+def upload_timeout(size):
+    """(connect, read) timeout for a body of size bytes, so large files are not cut off"""
+    return CONNECT_TIMEOUT, READ_TIMEOUT + size / MIN_RATE
+
+
+class Attachment(namedtuple("Attachment", "filename content path")):
+    """A file to post: in-memory content (str or bytes) or, failing that, a path on disk"""
+
+    def __new__(cls, filename, content=None, path=None):
+        return super().__new__(cls, filename, content, path)
+
+    def read(self):
+        if self.content is not None:
+            return self.content.encode() if isinstance(self.content, str) else self.content
+        return Path(self.path).read_bytes()
+
+
+class UploadError(RuntimeError):
+    pass
+
+
+class AttachmentUploader:
+    """Background stage that posts messages with file attachments
+
+    submit() returns at once; a small worker pool prepares the body (gzip
+    above gzip_threshold) and calls post(room_id, text, filename, data,
+    content_type), which must return a response with status_code and headers.
+    Connection errors, timeouts, 429 and 5xx are retried with jittered
+    exponential backoff, honouring Retry-After. on_sent(), if given to
+    submit(), is called once the message is posted. After the last attempt
+    on_failure(room_id, text, attachment, error, on_sent) is called instead so
+    the caller can still tell the room.
+    """
+
+    def __init__(self, post, on_failure=None, workers=2, gzip_threshold=GZIP_THRESHOLD,
+                 max_attempts=MAX_ATTEMPTS, backoff=BACKOFF, max_backoff=MAX_BACKOFF):
+        self._post = post
+        self._on_failure = on_failure
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="uploader")
+        self._gzip_threshold = gzip_threshold
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.uploaded = 0
+        self.failed = 0
+        self.retries = 0
+        self.bytes_saved = 0
+
+    def submit(self, room_id, text, attachment, on_sent=None):
+        """Queue one message with its attachment and return a Future"""
+        return self._pool.submit(self._upload, room_id, text, attachment, on_sent)
+
+    def _prepare(self, attachment):
+        """Return (filename, data, content_type), gzipped when large"""
+        data = attachment.read()
+        if self._gzip_threshold is not None and len(data) > self._gzip_threshold:
+            compressed = gzip.compress(data)
+            with self._lock:
+                self.bytes_saved += len(data) - len(compressed)
+            return f"{attachment.filename}.gz", compressed, "application/gzip"
+        return attachment.filename, data, "text/plain"
+
+    def _delay(self, attempt, response):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self._max_backoff)
+            except ValueError:
+                pass
+        delay = min(self._backoff * 2 ** (attempt - 1), self._max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _upload(self, room_id, text, attachment, on_sent=None):
+        try:
+            filename, data, content_type = self._prepare(attachment)
+        except OSError as exc:
+            return self._fail(room_id, text, attachment, exc, on_sent)
+
+        error = None
+        for attempt in range(1, self._max_attempts + 1):
+            response = None
+            try:
+                response = self._post(room_id, text, filename, data, content_type)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                error = exc
+            else:
+                if response.status_code == 200:
+                    with self._lock:
+                        self.uploaded += 1
+                    if on_sent:
+                        try:
+                            on_sent()
+                        except Exception as exc:
+                            print(f"Error after uploading {attachment.filename}: {exc}")
+                    return response
+                if response.status_code not in RETRY_STATUS:
+                    error = UploadError(f"Webex rejected the upload. Status code: {response.status_code}")
+                    break
+                error = UploadError(f"Webex upload failed. Status code: {response.status_code}")
+            if attempt < self._max_attempts:
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self._delay(attempt, response))
+        return self._fail(room_id, text, attachment, error, on_sent)
+
+    def _fail(self, room_id, text, attachment, error, on_sent=None):
+        print(f"Error uploading {attachment.filename}: {error}")
+        with self._lock:
+            self.failed += 1
+        if self._on_failure:
+            try:
+                self._on_failure(room_id, text, attachment, error, on_sent)
+            except Exception as exc:
+                print(f"Error reporting failed upload: {exc}")
+        return None
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "uploaded": self.uploaded,
+                "failed": self.failed,
+                "retries": self.retries,
+                "bytes_saved": self.bytes_saved,
+            }
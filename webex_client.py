@@ -0,0 +1,274 @@
+import io
+import queue
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder  # type: ignore
+
+from metrics import metrics
+
+API_URL = "https://webexapis.com/v1"
+TIMEOUT = 10
+MAX_ATTEMPTS = 5
+BACKOFF = 1.0  # seconds before the first retry, doubled after each failure
+MAX_BACKOFF = 60
+RETRY_STATUS = (500, 502, 503, 504)
+MAX_MESSAGE_CHARS = 7000  # Webex rejects message text above about 7 KB
+
+
+class WebexError(RuntimeError):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _decode(response, operation):
+    # A proxy or outage page can come back as 200 with HTML, which must not escape as a JSON error
+    try:
+        return response.json()
+    except ValueError as exc:
+        raise WebexError(f"Webex {operation} returned a reply that is not JSON: {exc}", response.status_code) from exc
+
+
+class WebexClient:
+    """Webex REST client on one keep-alive session
+
+    The Authorization header is set once on the session. All threads share a
+    rate-limit gate: a 429 closes it for the Retry-After period, so nobody
+    keeps hitting the API while it is throttling. 429, 5xx, connection errors
+    and timeouts are retried up to max_attempts with jittered exponential
+    backoff; request() then returns the last response, or re-raises the
+    connection error if no response came back at all.
+    """
+
+    def __init__(self, token, api_url=API_URL, timeout=TIMEOUT, max_attempts=MAX_ATTEMPTS,
+                 backoff=BACKOFF, max_backoff=MAX_BACKOFF, pool_maxsize=10):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._session = requests.Session()
+        self._session.headers["Authorization"] = f"Bearer {token}"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self.throttled = 0
+        self.retries = 0
+
+    def _wait_for_gate(self):
+        while True:
+            with self._lock:
+                delay = self._blocked_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _throttle(self, seconds):
+        with self._lock:
+            self.throttled += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def _backoff_delay(self, attempt):
+        delay = min(self._backoff * 2 ** (attempt - 1), self._max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _retry_after(self, response, attempt):
+        try:
+            return min(float(response.headers["Retry-After"]), self._max_backoff)
+        except (KeyError, ValueError):
+            return self._backoff_delay(attempt)
+
+    def request(self, method, path, operation, attempts=None, **kwargs):
+        """Send one API request with rate limiting and retries; return the response"""
+        url = path if "://" in path else f"{self.api_url}/{path.lstrip('/')}"
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = attempts or self._max_attempts
+        for attempt in range(1, attempts + 1):
+            self._wait_for_gate()
+            try:
+                with metrics.timer("ipa_webex_request_seconds", operation=operation):
+                    response = self._session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == attempts:
+                    raise
+                delay = self._backoff_delay(attempt)
+            else:
+                if response.status_code == 429:
+                    # Throttled: every thread waits, not just this one
+                    self._throttle(self._retry_after(response, attempt))
+                    delay = 0
+                elif response.status_code in RETRY_STATUS:
+                    delay = self._backoff_delay(attempt)
+                else:
+                    return response
+                if attempt == attempts:
+                    return response
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def get_json(self, path, params=None, operation="get"):
+        """GET and decode a resource; None if it does not exist"""
+        try:
+            r = self.request("GET", path, operation, params=params)
+        except requests.RequestException as exc:
+            raise WebexError(f"Webex {operation} failed: {exc}") from exc
+        if r.status_code == 404:
+            return None
+        if r.status_code != 200:
+            raise WebexError(
+                "Incorrect reply from Webex Teams API. Status code: {}".format(r.status_code), r.status_code
+            )
+        return _decode(r, operation)
+
+    def post_json(self, path, body, operation="post"):
+        """POST a JSON body and return the decoded reply"""
+        return self._send_json("POST", path, body, operation)
+
+    def put_json(self, path, body, operation="put"):
+        """PUT a JSON body (replace a resource) and return the decoded reply"""
+        return self._send_json("PUT", path, body, operation)
+
+    def delete(self, path, operation="delete"):
+        """DELETE a resource; one that is already gone counts as deleted"""
+        try:
+            r = self.request("DELETE", path, operation)
+        except requests.RequestException as exc:
+            raise WebexError(f"Webex {operation} failed: {exc}") from exc
+        if r.status_code not in (200, 204, 404):
+            raise WebexError(
+                "Incorrect reply from Webex Teams API. Status code: {}".format(r.status_code), r.status_code
+            )
+
+    def _send_json(self, method, path, body, operation):
+        try:
+            r = self.request(method, path, operation, json=body)
+        except requests.RequestException as exc:
+            raise WebexError(f"Webex {operation} failed: {exc}") from exc
+        if r.status_code != 200:
+            raise WebexError(
+                "Incorrect reply from Webex Teams API. Status code: {}".format(r.status_code), r.status_code
+            )
+        return _decode(r, operation)
+
+    def post_message(self, room_id, text):
+        """Post a text message to a room"""
+        return self.post_json("messages", {"roomId": room_id, "text": text})
+
+    def post_file(self, room_id, text, filename, data, content_type, timeout=None):
+        """Post a message with one file in a single attempt and return the response
+
+        The multipart body is streamed and cannot be replayed, so retries are
+        left to the caller (see uploader.AttachmentUploader).
+        """
+        encoder = MultipartEncoder(
+            fields={
+                "roomId": room_id,
+                "text": text,
+                "files": (filename, io.BytesIO(data), content_type),
+            }
+        )
+        return self.request(
+            "POST", "messages", "upload", attempts=1,
+            data=encoder,
+            headers={"Content-Type": encoder.content_type},
+            timeout=timeout or self.timeout,
+        )
+
+    def close(self):
+        self._session.close()
+
+
+class Outbox:
+    """Background sender for text replies
+
+    send() only queues the reply. One thread posts the queue in order. When
+    several replies for the same room are already waiting (the bot is busy or
+    Webex is throttling), they are joined into one message of at most
+    max_chars, which saves API calls exactly when they are scarce. A reply
+    that still fails is printed and dropped, so a Webex outage never stops
+    commands from running. on_sent callbacks run only after their reply was
+    posted, so a caller can tell delivered replies from dropped ones.
+    """
+
+    def __init__(self, client, coalesce=True, max_chars=MAX_MESSAGE_CHARS):
+        self._client = client
+        self._coalesce = coalesce
+        self._max_chars = max_chars
+        self._queue = queue.Queue()
+        self._carry = None  # item taken while coalescing that belongs to the next batch
+        self._thread = None
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="webex-outbox", daemon=True)
+        self._thread.start()
+
+    def send(self, room_id, text, on_sent=None):
+        self._queue.put((room_id, text, on_sent))
+
+    def _next(self, block=True):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        return self._queue.get(block=block)
+
+    def _batch(self):
+        """Take the next reply plus any waiting replies to the same room"""
+        room_id, text, on_sent = self._next()
+        if room_id is None:
+            return None, [text], []
+        texts = [text]
+        callbacks = [on_sent] if on_sent else []
+        size = len(text)
+        while self._coalesce:
+            try:
+                item = self._next(block=False)
+            except queue.Empty:
+                break
+            if item[0] != room_id or size + 1 + len(item[1]) > self._max_chars:
+                self._carry = item
+                break
+            texts.append(item[1])
+            if item[2]:
+                callbacks.append(item[2])
+            size += 1 + len(item[1])
+        return room_id, texts, callbacks
+
+    def _run(self):
+        while True:
+            room_id, texts, callbacks = self._batch()
+            if room_id is None:
+                self._queue.task_done()
+                return
+            try:
+                self._client.post_message(room_id, "\n".join(texts))
+                self.sent += 1
+                self.coalesced += len(texts) - 1
+            except Exception as exc:
+                # Anything else escaping here would end the thread and leave every later reply queued
+                print(f"Error posting reply: {exc}")
+                self.failed += len(texts)
+            else:
+                for on_sent in callbacks:
+                    try:
+                        on_sent()
+                    except Exception as exc:
+                        print(f"Error after posting reply: {exc}")
+            for _ in texts:
+                self._queue.task_done()
+
+    def close(self, timeout=10):
+        """Post what is still queued, then stop the sender thread"""
+        if self._thread is None:
+            return
+        self._queue.put((None, None, None))
+        self._thread.join(timeout)
@@ -0,0 +1,122 @@
+import datetime
+import json
+import os
+import tempfile
+from collections import deque
+from pathlib import Path
+
+
+def _now():
+    """Current time in the format of Webex "created" fields, which compare as strings"""
+    created = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds")
+    return created.replace("+00:00", "Z")
+
+
+class MessagePoller:
+    """Incremental Webex message fetcher with a cursor persisted on disk
+
+    poll() returns every message newer than the cursor, oldest first, paging
+    back with beforeMessage when more than one page arrived since the last
+    poll. The caller marks each message done after handling it, which moves
+    the cursor and rewrites the cursor file atomically, so a restart neither
+    replays nor skips messages. On the very first run (no cursor file) the
+    cursor starts at the current time: older messages are not executed, and
+    everything posted from then on is, even if the room was empty.
+
+    The poll interval adapts: it drops to min_interval whenever new messages
+    arrive and grows by backoff up to max_interval while the room is idle.
+    """
+
+    def __init__(self, fetch_page, cursor_path, min_interval=1, max_interval=10,
+                 backoff=1.5, page_size=50, max_pages=5, remember=200):
+        self._fetch_page = fetch_page  # fetch_page(params) -> items newest first, or None on error
+        self._cursor_path = Path(cursor_path)
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._page_size = page_size
+        self._max_pages = max_pages
+        self._cursor = None  # {"id": ..., "created": ...} of the newest handled message
+        self._seen = deque(maxlen=remember)  # ids handled recently, also via webhooks
+        self.interval = min_interval
+        self._load()
+        if self._cursor is None:
+            self._cursor = {"id": None, "created": _now()}
+            self._save()
+
+    def _load(self):
+        try:
+            state = json.loads(self._cursor_path.read_text())
+        except (OSError, ValueError):
+            return
+        self._cursor = state.get("cursor")
+        self._seen.extend(state.get("seen", []))
+
+    def _save(self):
+        state = {"cursor": self._cursor, "seen": list(self._seen)}
+        directory = self._cursor_path.resolve().parent
+        fd, tmp_path = tempfile.mkstemp(prefix=self._cursor_path.name, dir=directory)
+        try:
+            with os.fdopen(fd, "w") as tmp:
+                json.dump(state, tmp)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, self._cursor_path)
+        except OSError as exc:
+            print(f"Error saving message cursor: {exc}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def seen(self, message_id):
+        return message_id in self._seen
+
+    def poll(self):
+        """Return unhandled messages newer than the cursor, oldest first"""
+        new_messages = []
+        before = None
+        for _ in range(self._max_pages):
+            params = {"max": self._page_size}
+            if before:
+                params["beforeMessage"] = before
+            items = self._fetch_page(params)
+            if items is None:
+                return []  # fetch failed; keep the cursor and retry next time
+            reached_cursor = False
+            for message in items:
+                if (
+                    message.get("id") == self._cursor["id"]
+                    or message.get("created", "") < self._cursor["created"]
+                ):
+                    reached_cursor = True
+                    break
+                new_messages.append(message)
+            if reached_cursor or len(items) < self._page_size:
+                break
+            before = items[-1].get("id")
+        else:
+            print(f"Message backlog larger than {self._max_pages} pages, older messages skipped")
+
+        pending = []
+        for message in reversed(new_messages):
+            if message.get("id") not in self._seen:
+                pending.append(message)
+            elif not pending:
+                # Already handled (e.g. via webhook) and nothing older is waiting: move past it
+                self._cursor = {"id": message.get("id"), "created": message.get("created", "")}
+        if new_messages and not pending:
+            self._save()
+        new_messages = pending
+        if new_messages:
+            self.interval = self._min_interval
+        else:
+            self.interval = min(self.interval * self._backoff, self._max_interval)
+        return new_messages
+
+    def mark_done(self, message, advance=True):
+        """Record a handled message; advance the cursor unless it came out of order"""
+        self._seen.append(message.get("id"))
+        if advance:
+            self._cursor = {"id": message.get("id"), "created": message.get("created", "")}
+        self._save()
@@ -0,0 +1,112 @@
+import hashlib
+import hmac
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def verify_signature(secret, body, signature):
+    """Check the X-Spark-Signature header (HMAC-SHA1 of the raw body)"""
+    expected = hmac.new(secret.encode(), body, hashlib.sha1).hexdigest()
+    return hmac.compare_digest(expected, signature or "")
+
+
+def register_webhook(client, target_url, room_id, secret=None, name="ipa-bot"):
+    """Make sure room_id has one messages/created webhook to target_url and return its id
+
+    A webhook left by an earlier start is updated (and re-activated) instead
+    of adding another, since Webex delivers each event once per webhook.
+    Extra copies with the same target and filter are deleted.
+    """
+    body = {
+        "name": name,
+        "targetUrl": target_url,
+        "resource": "messages",
+        "event": "created",
+        "filter": f"roomId={room_id}",
+    }
+    if secret:
+        body["secret"] = secret
+    # Every call raises WebexError after the client's retries
+    listed = client.get_json("webhooks", {"max": 100}, operation="webhook") or {}
+    existing = [
+        hook for hook in listed.get("items", [])
+        if all(hook.get(key) == body[key] for key in ("targetUrl", "resource", "event", "filter"))
+    ]
+    if not existing:
+        return client.post_json("webhooks", body, operation="webhook").get("id")
+
+    hook = existing[0]
+    for duplicate in existing[1:]:
+        client.delete(f"webhooks/{duplicate['id']}", operation="webhook")
+    # The secret is never listed back, so a configured one is always sent again
+    if secret or hook.get("name") != name or hook.get("status", "active") != "active":
+        update = {"name": name, "targetUrl": target_url, "status": "active"}
+        if secret:
+            update["secret"] = secret
+        client.put_json(f"webhooks/{hook['id']}", update, operation="webhook")
+    return hook["id"]
+
+
+class WebhookServer:
+    """Small HTTP server that receives Webex message-created events
+
+    Webhook payloads only carry the message id, so on_message(data) is called
+    with the event's "data" object and the caller fetches the text itself.
+    Requests with a bad signature are rejected when a secret is configured.
+    """
+
+    def __init__(self, port, on_message, secret=None, room_ids=None, host="0.0.0.0"):
+        self._on_message = on_message
+        self._secret = secret
+        self._room_ids = frozenset(room_ids) if room_ids else None
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if server._secret and not verify_signature(
+                    server._secret, body, self.headers.get("X-Spark-Signature")
+                ):
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+
+                try:
+                    event = json.loads(body)
+                except ValueError:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+
+                # Answer right away; the command itself runs on the bot's own loop
+                self.send_response(200)
+                self.end_headers()
+
+                data = event.get("data") or {}
+                if event.get("resource") != "messages" or event.get("event") != "created":
+                    return
+                if server._room_ids and data.get("roomId") not in server._room_ids:
+                    return
+                server._on_message(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="webex-webhook", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()